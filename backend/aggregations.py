@@ -0,0 +1,97 @@
+"""
+MongoDB aggregation pipelines that compute route statistics server-side.
+
+Only the summary document travels over the network instead of every matched
+recipe with its full ingredient list.
+"""
+from ingredient_mappings import ALLERGEN_TERM_BITS
+from recipe_enrichment import ENRICHMENT_VERSION
+
+# Same text as recipe_enrichment.ingredients_text: string ingredients joined by
+# spaces and lowercased. Note $toLower only folds ASCII characters.
+INGREDIENTS_TEXT_EXPR = {"$toLower": {"$ifNull": [
+    {"$reduce": {
+        "input": {"$filter": {
+            "input": {"$cond": [{"$isArray": "$ingredients"}, "$ingredients", []]},
+            "cond": {"$eq": [{"$type": "$$this"}, "string"]},
+        }},
+        "initialValue": None,
+        "in": {"$cond": [
+            {"$eq": ["$$value", None]},
+            "$$this",
+            {"$concat": ["$$value", " ", "$$this"]},
+        ]},
+    }},
+    "",
+]}}
+
+# recipe_enrichment.has_current_mask: a current enrichment_version and an allergen_mask field
+HAS_CURRENT_MASK_EXPR = {"$and": [
+    {"$eq": ["$enrichment_version", ENRICHMENT_VERSION]},
+    {"$ne": [{"$type": "$allergen_mask"}, "missing"]},
+]}
+
+def text_contains_expr(allergen_lower):
+    return {"$gte": [{"$indexOfCP": ["$$text", allergen_lower]}, 0]}
+
+def mask_has_bit_expr(bit):
+    # Masks are non-negative int64s, so the top usable bit is set iff mask >= bit
+    if bit == 1 << 62:
+        return {"$gte": ["$allergen_mask", bit]}
+    # Exact on int64, unlike dividing by the bit (which goes through a double)
+    return {"$gte": [{"$mod": ["$allergen_mask", bit * 2]}, bit]}
+
+def allergen_hits_expr(allergens_lower):
+    """
+    Per-document array of booleans, one per allergen, mirroring
+    recipe_enrichment.detect_allergens: mask bits where the recipe has a current
+    mask and the allergen has a bit, substring checks on the ingredient text otherwise.
+    """
+    text_checks = {"$let": {
+        "vars": {"text": INGREDIENTS_TEXT_EXPR},
+        "in": [text_contains_expr(a) for a in allergens_lower],
+    }}
+    mask_checks = [
+        mask_has_bit_expr(ALLERGEN_TERM_BITS[a]) if a in ALLERGEN_TERM_BITS else text_contains_expr(a)
+        for a in allergens_lower
+    ]
+    if all(a in ALLERGEN_TERM_BITS for a in allergens_lower):
+        with_mask = mask_checks
+    else:
+        with_mask = {"$let": {"vars": {"text": INGREDIENTS_TEXT_EXPR}, "in": mask_checks}}
+    return {"$cond": [HAS_CURRENT_MASK_EXPR, with_mask, text_checks]}
+
+def allergen_stats_pipeline(match_filter, allergens_lower):
+    """$match + $group returning total, with_any and one count per allergen (a0, a1, ...)"""
+    group = {
+        "_id": None,
+        "total": {"$sum": 1},
+        "with_any": {"$sum": {"$cond": [{"$anyElementTrue": ["$hits"]}, 1, 0]}},
+    }
+    for index in range(len(allergens_lower)):
+        group[f"a{index}"] = {"$sum": {"$cond": [{"$arrayElemAt": ["$hits", index]}, 1, 0]}}
+    return [
+        {"$match": match_filter},
+        {"$project": {"_id": 0, "hits": allergen_hits_expr(allergens_lower)}},
+        {"$group": group},
+    ]
+
+async def allergen_stats(collection, match_filter, user_allergens):
+    """
+    Count matched recipes, recipes with any user allergen and per-allergen hits.
+    Expects an async collection (db.async_recipes_collection).
+
+    Returns (total, with_any, allergen_counts) with allergen_counts keyed by the
+    lowercased allergen, exactly as the per-document loop in /detect counted them.
+    """
+    allergens_lower = list(dict.fromkeys(a.lower() for a in user_allergens))
+    cursor = await collection.aggregate(allergen_stats_pipeline(match_filter, allergens_lower))
+    summaries = await cursor.to_list(1)
+    summary = summaries[0] if summaries else None
+    allergen_counts = {a.lower(): 0 for a in user_allergens}
+    if summary is None:
+        return 0, 0, allergen_counts
+    # An allergen listed twice (in any casing) was counted twice by the loop
+    for allergen in user_allergens:
+        allergen_counts[allergen.lower()] += summary[f"a{allergens_lower.index(allergen.lower())}"]
+    return summary["total"], summary["with_any"], allergen_counts
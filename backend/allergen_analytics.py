@@ -0,0 +1,186 @@
+"""
+Roaring-bitmap analytics over the whole recipe corpus.
+
+Every recipe gets a position; the engine keeps one compressed bitmap of
+positions per allergen term and category and one per title word. A dish
+family is the AND of its title words' bitmaps, and breakdowns or
+co-occurrence questions like P(milk | eggs) within a family are bitmap
+ANDs and popcounts, without touching a single document.
+
+Term bitmaps use the same substring semantics as /detect: a recipe is in a
+term's bitmap when the term appears in its lowercased ingredient text (the
+allergen_mask bit). With expand_categories, a category name like "dairy"
+uses its category bitmap instead: the category name or any of its
+ALLERGEN_CATEGORIES ingredients appears. Allergens outside ALLERGEN_TERMS
+have no bitmap and are reported as unsupported.
+"""
+import threading
+import time
+from pyroaring import BitMap
+from db import recipes_collection
+from ingredient_mappings import ALLERGEN_CATEGORIES, ALLERGEN_TERM_BITS
+from recipe_enrichment import compute_allergen_mask, has_current_mask, ingredients_text, tokenize_title
+
+# How long (in seconds) the bitmaps may serve results before they are rebuilt
+REFRESH_INTERVAL = 600
+
+ANALYTICS_FIELDS = {"title": 1, "title_tokens": 1, "ingredients": 1, "allergen_mask": 1, "enrichment_version": 1}
+
+
+def category_bits(category):
+    """Mask bits of a category name and its ingredients"""
+    bits = ALLERGEN_TERM_BITS.get(category, 0)
+    for term in ALLERGEN_CATEGORIES.get(category, []):
+        bits |= ALLERGEN_TERM_BITS.get(term, 0)
+    return bits
+
+
+class AllergenAnalytics:
+    """Bitmaps of recipe positions per allergen term, allergen category and title word."""
+
+    def __init__(self, collection, refresh_interval=REFRESH_INTERVAL):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        # (term bitmaps, category bitmaps, title word bitmaps, recipe count), swapped as a whole
+        self._state = ({}, {}, {}, 0)
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def build(self, recipes=None, blocking=True, force=True):
+        """
+        Index the recipes (the whole collection by default), replacing the bitmaps.
+
+        With force=False, does nothing if the bitmaps were built while waiting
+        for the lock, so concurrent first requests scan the collection once.
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return  # another request is already rebuilding; keep serving the old bitmaps
+        try:
+            if not force and self.is_built:
+                return
+            start_time = time.time()
+            if recipes is None:
+                recipes = self.collection.find({}, ANALYTICS_FIELDS)
+            term_positions = {term: [] for term in ALLERGEN_TERM_BITS}
+            word_positions = {}
+            count = 0
+            for position, recipe in enumerate(recipes):
+                count += 1
+                if has_current_mask(recipe):
+                    mask = recipe["allergen_mask"]
+                else:
+                    mask = compute_allergen_mask(ingredients_text(recipe.get("ingredients") or []))
+                if mask:
+                    for term, bit in ALLERGEN_TERM_BITS.items():
+                        if mask & bit:
+                            term_positions[term].append(position)
+                words = recipe.get("title_tokens")
+                if not isinstance(words, list):
+                    title = recipe.get("title")
+                    words = tokenize_title(title) if isinstance(title, str) else []
+                for word in words:
+                    word_positions.setdefault(word, []).append(position)
+
+            terms = {term: BitMap(positions) for term, positions in term_positions.items()}
+            categories = {
+                category: BitMap.union(BitMap(), *(
+                    terms[term] for term, bit in ALLERGEN_TERM_BITS.items() if bit & category_bits(category)
+                ))
+                for category in ALLERGEN_CATEGORIES
+            }
+            words = {word: BitMap(positions) for word, positions in word_positions.items()}
+            bitmaps = [*terms.values(), *categories.values(), *words.values()]
+            for bitmap in bitmaps:
+                bitmap.run_optimize()
+            self._state = (terms, categories, words, count)
+            self._built_at = time.time()
+            size = sum(len(bitmap.serialize()) for bitmap in bitmaps)
+            print(f"Allergen analytics built over {count} recipes: {len(terms)} term, {len(categories)} category "
+                  f"and {len(words)} title word bitmaps, {size / 1024:.0f} KiB, in {time.time() - start_time:.1f}s")
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """Rebuild the bitmaps; breakdowns keep using the current ones until the new ones are swapped in"""
+        try:
+            self.build(blocking=False)
+        except Exception as e:
+            print(f"Allergen analytics refresh failed, serving the previous bitmaps: {e}")
+
+    def ensure_fresh(self):
+        """
+        Build on first use. Once the bitmaps are older than the interval,
+        rebuild them on a background thread; requests keep using the current ones.
+        """
+        if not self.is_built:
+            self.build(force=False)
+        elif time.time() - self._built_at > self.refresh_interval and not self._lock.locked():
+            threading.Thread(target=self.refresh, name="allergen-analytics-refresh", daemon=True).start()
+
+    def family(self, dish, state=None):
+        """Recipes whose title contains every word of the dish name"""
+        _, _, words, count = state or self._state
+        dish_words = tokenize_title(dish)
+        if not dish_words:
+            return BitMap(range(count))
+        bitmaps = sorted((words.get(word, BitMap()) for word in dish_words), key=len)
+        return BitMap.intersection(*bitmaps) if len(bitmaps) > 1 else BitMap(bitmaps[0])
+
+    def allergen_bitmap(self, allergen_lower, expand_categories=False, state=None):
+        terms, categories, _, _ = state or self._state
+        if expand_categories and allergen_lower in categories:
+            return categories[allergen_lower]
+        return terms.get(allergen_lower)
+
+    def breakdown(self, dish, user_allergens, expand_categories=False):
+        """
+        Per-allergen counts within the dish family.
+
+        Returns (total, with_any, allergen_counts, unsupported) where
+        allergen_counts is keyed by the lowercased allergen like /detect.
+        """
+        self.ensure_fresh()
+        state = self._state
+        family = self.family(dish, state)
+        allergen_counts = {}
+        unsupported = []
+        matched = []
+        for allergen in dict.fromkeys(a.lower() for a in user_allergens):
+            bitmap = self.allergen_bitmap(allergen, expand_categories, state)
+            if bitmap is None:
+                unsupported.append(allergen)
+                continue
+            allergen_counts[allergen] = family.intersection_cardinality(bitmap)
+            matched.append(bitmap)
+        with_any = family.intersection_cardinality(BitMap.union(BitMap(), *matched))
+        return len(family), with_any, allergen_counts, unsupported
+
+    def cooccurrence(self, dish, user_allergens, expand_categories=False):
+        """
+        Conditional probabilities within the dish family:
+        result[a][b] = P(a | b) = |family & a & b| / |family & b|, in percent.
+        """
+        self.ensure_fresh()
+        state = self._state
+        family = self.family(dish, state)
+        bitmaps = {}
+        for allergen in dict.fromkeys(a.lower() for a in user_allergens):
+            bitmap = self.allergen_bitmap(allergen, expand_categories, state)
+            if bitmap is not None:
+                bitmaps[allergen] = bitmap
+        names = list(bitmaps)
+        given = {name: family & bitmaps[name] for name in names}
+        return {
+            a: {
+                b: round(given[b].intersection_cardinality(bitmaps[a]) / len(given[b]) * 100, 2) if given[b] else 0.0
+                for b in names
+            }
+            for a in names
+        }
+
+
+allergen_analytics = AllergenAnalytics(recipes_collection)
@@ -0,0 +1,167 @@
+"""
+Indexed work queue for the LLM ingredient analysis in data_refine_gem.
+
+Each recipe carries its own queue state:
+  analysis_state        pending | in_flight | done | failed
+  analysis_claim        id of the claim that owns an in-flight recipe
+  analysis_lease_until  when an in-flight claim expires and the recipe can be re-claimed
+  analysis_attempts     how many times the recipe was claimed
+  analyzed_hash         ingredients_hash the stored analysis was computed from
+  failed_hash           ingredients_hash the last failed analysis was attempted on
+
+Workers claim disjoint batches (a claim only succeeds on recipes that are still
+claimable, one document at a time), so several enrichment processes can run
+side by side without analyzing the same recipe twice. Only recipes whose
+ingredients_hash differs from the hash they were last analyzed (or failed) on
+are ever queued again.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from recipe_enrichment import ingredients_hash
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+# A claimed recipe goes back to the queue if its worker hasn't finished by then
+LEASE_SECONDS = 600
+# Recipes whose analysis keeps failing are parked as failed after this many claims
+MAX_ATTEMPTS = 3
+
+SYNC_BATCH_SIZE = 500
+
+def ensure_queue_indexes(collection):
+    collection.create_index([("analysis_state", 1), ("analysis_lease_until", 1)])
+    collection.create_index([("analysis_claim", 1)])
+
+def claimable_filter(now):
+    return {"$or": [
+        {"analysis_state": PENDING},
+        {"analysis_state": IN_FLIGHT, "analysis_lease_until": {"$lt": now}},
+    ]}
+
+def hash_changed(field):
+    # A missing field counts as changed, like a recipe that was never analyzed
+    return {"$expr": {"$ne": [{"$ifNull": [f"${field}", None]}, "$ingredients_hash"]}}
+
+def sync_work_queue(collection):
+    """
+    Bring recipes into the queue model.
+
+    Recipes without a state are migrated (already analyzed ones count as done
+    for their current ingredients), and done or failed recipes whose
+    ingredients changed since their last attempt are queued again. Failed
+    recipes with unchanged ingredients stay failed.
+    """
+    migrated = 0
+    operations = []
+    for recipe in collection.find({"analysis_state": None}, {"ingredients": 1, "ingredients_hash": 1, "ingredient_analysis_complete": 1}):
+        current_hash = recipe.get("ingredients_hash") or ingredients_hash(recipe.get("ingredients") or [])
+        fields = {"ingredients_hash": current_hash, "analysis_attempts": 0}
+        if recipe.get("ingredient_analysis_complete"):
+            fields.update({"analysis_state": DONE, "analyzed_hash": current_hash})
+        else:
+            fields["analysis_state"] = PENDING
+        operations.append(UpdateOne({"_id": recipe["_id"]}, {"$set": fields}))
+        if len(operations) >= SYNC_BATCH_SIZE:
+            collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+
+    changed = collection.update_many(
+        {"$or": [
+            {"analysis_state": DONE, **hash_changed("analyzed_hash")},
+            {"analysis_state": FAILED, **hash_changed("failed_hash")},
+        ]},
+        {"$set": {"analysis_state": PENDING, "analysis_attempts": 0}},
+    ).modified_count
+    print(f"Work queue synced: {migrated} recipes migrated, {changed} changed recipes re-queued")
+    return migrated, changed
+
+def claim_batch(collection, batch_size, lease_seconds=LEASE_SECONDS):
+    """
+    Claim up to batch_size recipes for this worker.
+
+    Returns (claim_id, recipes). Each recipe is flipped to in_flight by a
+    conditional update, so a recipe another worker claimed first is skipped.
+    An empty batch means nothing was claimable: when other workers win every
+    candidate, the next claimable recipes are tried.
+    """
+    claim_id = uuid.uuid4().hex
+    while True:
+        now = datetime.now(timezone.utc)
+        candidates = [r["_id"] for r in collection.find(claimable_filter(now), {"_id": 1}).limit(batch_size)]
+        if not candidates:
+            return claim_id, []
+        collection.update_many(
+            {"_id": {"$in": candidates}, **claimable_filter(now)},
+            {
+                "$set": {
+                    "analysis_state": IN_FLIGHT,
+                    "analysis_claim": claim_id,
+                    "analysis_lease_until": now + timedelta(seconds=lease_seconds),
+                },
+                "$inc": {"analysis_attempts": 1},
+            },
+        )
+        recipes = list(collection.find({"analysis_claim": claim_id}))
+        if recipes:
+            return claim_id, recipes
+
+def has_claimable(collection):
+    return collection.find_one(claimable_filter(datetime.now(timezone.utc)), {"_id": 1}) is not None
+
+def owned_by(recipe, claim_id):
+    # Only write back while we still own the recipe and its ingredients are
+    # the ones we analyzed; otherwise the newer state wins
+    return {
+        "_id": recipe["_id"],
+        "analysis_claim": claim_id,
+        "ingredients_hash": recipe.get("ingredients_hash"),
+    }
+
+RELEASE = {"analysis_claim": "", "analysis_lease_until": ""}
+
+def completion_operation(recipe, claim_id, result):
+    """
+    Turn one process_recipe result into the update that settles the recipe.
+    """
+    if "data" in result:
+        return UpdateOne(owned_by(recipe, claim_id), {
+            "$set": {
+                "ingredient_analysis": result["data"]["ingredient_analysis"],
+                "normalized_ingredients": result["data"]["normalized_ingredients"],
+                "ingredient_analysis_complete": True,
+                "analysis_state": DONE,
+                "analyzed_hash": recipe.get("ingredients_hash"),
+                # New usage data for the recipe's dish in dish_stats
+                "dish_stats_stale": True,
+            },
+            "$unset": {"analysis_error": "", **RELEASE},
+        })
+    if result.get("error") == "No ingredients found":
+        return UpdateOne(owned_by(recipe, claim_id), {
+            "$set": {
+                "ingredient_analysis_complete": True,
+                "analysis_error": "No ingredients found",
+                "analysis_state": DONE,
+                "analyzed_hash": recipe.get("ingredients_hash"),
+            },
+            "$unset": RELEASE,
+        })
+    # The analysis failed: retry later unless it has failed too often
+    state = FAILED if recipe.get("analysis_attempts", 0) >= MAX_ATTEMPTS else PENDING
+    return UpdateOne(owned_by(recipe, claim_id), {
+        "$set": {
+            "analysis_state": state,
+            "analysis_error": result.get("error", "Unknown error"),
+            # Only new ingredients give a failed recipe another round of attempts
+            "failed_hash": recipe.get("ingredients_hash"),
+        },
+        "$unset": RELEASE,
+    })
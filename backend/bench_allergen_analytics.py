@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the roaring-bitmap allergen analytics engine.
+
+Builds allergen_analytics.AllergenAnalytics over synthetic recipes and
+compares a dish family breakdown plus the pairwise co-occurrence matrix
+against the per-document loop /detect's scan mode runs (detect_allergens on
+every recipe whose title contains the dish words). Checks that both give
+the same counts and prints the time per query.
+
+    python bench_allergen_analytics.py [--recipes 200000] [--queries 20]
+"""
+import argparse
+import random
+import time
+from allergen_analytics import AllergenAnalytics
+from ingredient_mappings import ALLERGEN_CATEGORIES
+from recipe_enrichment import ENRICHMENT_VERSION, compute_allergen_mask, detect_allergens, ingredients_text, tokenize_title
+
+DISH_WORDS = ["chicken", "pasta", "salad", "soup", "cake", "bread", "curry", "tacos", "pie", "stir", "fry", "cookies"]
+INGREDIENTS = [
+    "1 cup all-purpose flour", "2 large eggs", "1/2 cup milk", "2 tablespoons butter",
+    "1 teaspoon salt", "1/4 cup sugar", "2 cloves garlic, minced", "1 onion, chopped",
+    "1 pound chicken breast", "1 cup shredded mozzarella", "2 tablespoons soy sauce",
+    "1/2 cup chopped pecans", "1 tablespoon olive oil", "1 cup cooked rice", "1 lemon, juiced",
+    "1/2 pound shrimp", "2 tablespoons peanut butter", "1 teaspoon sesame oil", "1 can tuna",
+]
+DISHES = ["chicken", "chicken salad", "cake", "stir fry", "pasta soup"]
+
+
+def make_recipes(count, seed=0):
+    rng = random.Random(seed)
+    recipes = []
+    for i in range(count):
+        ingredients = rng.sample(INGREDIENTS, rng.randint(4, 10))
+        recipe = {"_id": i, "title": " ".join(rng.sample(DISH_WORDS, rng.randint(1, 3))).title(), "ingredients": ingredients}
+        recipe["title_tokens"] = tokenize_title(recipe["title"])
+        recipe["allergen_mask"] = compute_allergen_mask(ingredients_text(ingredients))
+        recipe["enrichment_version"] = ENRICHMENT_VERSION
+        recipes.append(recipe)
+    return recipes
+
+
+def scan(recipes, dish, allergens):
+    """What the per-document loop computes: breakdown plus pairwise counts"""
+    dish_words = set(tokenize_title(dish))
+    total = 0
+    with_any = 0
+    counts = {a: 0 for a in allergens}
+    pairs = {a: {b: 0 for b in allergens} for a in allergens}
+    for recipe in recipes:
+        if not dish_words <= set(recipe["title_tokens"]):
+            continue
+        total += 1
+        detected = detect_allergens(recipe, allergens)
+        if detected:
+            with_any += 1
+        for a in detected:
+            counts[a] += 1
+            for b in detected:
+                pairs[a][b] += 1
+    cooccurrence = {
+        a: {b: round(pairs[a][b] / counts[b] * 100, 2) if counts[b] else 0.0 for b in allergens}
+        for a in allergens
+    }
+    return total, with_any, counts, cooccurrence
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=20, help="Repetitions of each dish query")
+    args = parser.parse_args()
+
+    recipes = make_recipes(args.recipes)
+    allergens = list(ALLERGEN_CATEGORIES)
+    analytics = AllergenAnalytics(collection=None)
+    analytics.build(recipes=recipes)
+
+    print(f"\n{'dish':<15} {'family':>8} {'scan ms':>9} {'bitmap ms':>10} {'speedup':>8}")
+    for dish in DISHES:
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            expected = scan(recipes, dish, allergens)
+        scan_time = (time.perf_counter() - start) / args.queries
+
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            total, with_any, counts, unsupported = analytics.breakdown(dish, allergens)
+            cooccurrence = analytics.cooccurrence(dish, allergens)
+        bitmap_time = (time.perf_counter() - start) / args.queries
+
+        assert not unsupported, unsupported
+        assert (total, with_any, counts, cooccurrence) == expected, f"results differ for {dish!r}"
+        print(f"{dish:<15} {total:>8} {scan_time * 1000:>9.1f} {bitmap_time * 1000:>10.2f} "
+              f"{scan_time / bitmap_time:>7.0f}x")
+    print("\n✓ Bitmap results match the per-document scan")
+
+
+if __name__ == "__main__":
+    main()
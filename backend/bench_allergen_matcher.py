@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the compiled allergen matcher in ingredient_mappings.
+
+Runs the original nested-loop implementation side by side with the compiled
+one on a synthetic menu, checks that both return the same matches and prints
+the timings.
+
+    python bench_allergen_matcher.py [--dishes 40] [--repeat 20]
+"""
+import argparse
+import random
+import time
+import ingredient_mappings
+from ingredient_mappings import INGREDIENT_MAPPINGS, ALLERGEN_CATEGORIES
+
+# --- Original implementations, kept here only for comparison ---
+def legacy_normalize_ingredient(ingredient):
+    ingredient_lower = ingredient.lower().strip()
+    if ingredient_lower in INGREDIENT_MAPPINGS:
+        return INGREDIENT_MAPPINGS[ingredient_lower]
+    for mapped_ingredient, base_ingredients in INGREDIENT_MAPPINGS.items():
+        if mapped_ingredient in ingredient_lower or ingredient_lower in mapped_ingredient:
+            return base_ingredients
+    return [ingredient_lower]
+
+def legacy_get_allergen_matches(ingredients, user_allergens):
+    all_normalized = []
+    for ingredient in ingredients:
+        all_normalized.extend(legacy_normalize_ingredient(ingredient))
+    allergen_matches = {}
+    for user_allergen in user_allergens:
+        user_allergen_lower = user_allergen.lower()
+        matches = []
+        for norm_ingredient in all_normalized:
+            if user_allergen_lower in norm_ingredient or norm_ingredient in user_allergen_lower:
+                matches.append(norm_ingredient)
+        if user_allergen_lower in ALLERGEN_CATEGORIES:
+            for category_ingredient in ALLERGEN_CATEGORIES[user_allergen_lower]:
+                for norm_ingredient in all_normalized:
+                    if category_ingredient in norm_ingredient or norm_ingredient in category_ingredient:
+                        matches.append(norm_ingredient)
+        allergen_matches[user_allergen] = list(set(matches))
+    return allergen_matches, all_normalized
+
+# --- Synthetic menu ---
+MODIFIERS = ["", "fresh ", "shredded ", "homemade ", "grilled ", "spicy ", "creamy "]
+EXTRA_INGREDIENTS = [
+    "chicken", "rice", "basil", "lime", "bean sprouts", "garlic", "onion",
+    "cilantro", "spinach", "mushrooms", "bacon", "lettuce", "avocado",
+]
+
+def make_menu(dishes, rng):
+    vocabulary = list(INGREDIENT_MAPPINGS) + EXTRA_INGREDIENTS + [
+        term for terms in ALLERGEN_CATEGORIES.values() for term in terms
+    ]
+    return [
+        [rng.choice(MODIFIERS) + rng.choice(vocabulary) for _ in range(rng.randint(4, 12))]
+        for _ in range(dishes)
+    ]
+
+def time_path(get_matches, menu, allergens, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for ingredients in menu:
+            get_matches(ingredients, allergens)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    menu = make_menu(args.dishes, rng)
+    allergens = list(ALLERGEN_CATEGORIES) + ["Milk", "garlic", "pork"]
+
+    for ingredients in menu:
+        old_matches, old_normalized = legacy_get_allergen_matches(ingredients, allergens)
+        new_matches, new_normalized = ingredient_mappings.get_allergen_matches(ingredients, allergens)
+        assert old_normalized == new_normalized, ingredients
+        assert {a: set(m) for a, m in old_matches.items()} == {a: set(m) for a, m in new_matches.items()}, ingredients
+    print(f"✓ Both paths agree on {len(menu)} dishes x {len(allergens)} allergens")
+
+    legacy = time_path(legacy_get_allergen_matches, menu, allergens, args.repeat)
+    # The first pass warms the per-ingredient caches, like a long-running server would be
+    cold = time_path(ingredient_mappings.get_allergen_matches, menu, allergens, 1)
+    compiled = time_path(ingredient_mappings.get_allergen_matches, menu, allergens, args.repeat)
+
+    calls = args.dishes * args.repeat
+    print(f"Legacy nested loops: {legacy:.4f}s ({legacy / calls * 1e6:.1f}µs per dish)")
+    print(f"Compiled matcher:    {compiled:.4f}s ({compiled / calls * 1e6:.1f}µs per dish), cold pass {cold:.4f}s")
+    print(f"Speedup: {legacy / compiled:.1f}x")
+
+if __name__ == "__main__":
+    main()
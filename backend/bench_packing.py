@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for packed enrichment prompts (several recipes per Gemini call).
+
+Runs data_refine_gem.process_pack against a stub model over a synthetic set
+of recipes for several pack sizes K. The stub's latency is a fixed per-call
+overhead plus a per-recipe cost, and each section is dropped or corrupted
+with a small probability, so re-queued sections go round again like they
+would through the work queue. Prints recipes/sec, API calls and re-queued
+sections for each K.
+
+    python bench_packing.py [--recipes 200] [--pack-sizes 1,2,4,8,16] [--workers 8]
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from analysis_queue import MAX_ATTEMPTS
+from data_refine_gem import process_pack
+from rate_limiter import AdaptiveLimiter
+
+INGREDIENTS = [
+    "1 cup all-purpose flour", "2 large eggs", "1/2 cup milk", "2 tablespoons butter",
+    "1 teaspoon salt", "1/4 cup sugar", "2 cloves garlic, minced", "1 onion, chopped",
+    "1 pound chicken breast", "1 cup shredded mozzarella", "2 tablespoons soy sauce",
+    "1/2 cup chopped pecans", "1 tablespoon olive oil", "1 cup cooked rice", "1 lemon, juiced",
+]
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Answers packed prompts like Gemini would, with latency and occasional bad sections"""
+
+    def __init__(self, overhead, per_recipe, section_failure_rate, seed=0):
+        self.overhead = overhead
+        self.per_recipe = per_recipe
+        self.section_failure_rate = section_failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def generate_content(self, prompt, request_options=None):
+        self.calls += 1
+        packed = json.loads(prompt.split("**Recipes:**", 1)[1].split("**Task 1", 1)[0])
+        time.sleep(self.overhead + self.per_recipe * len(packed))
+        sections = []
+        for recipe_id, ingredients in packed.items():
+            roll = self.random.random()
+            if roll < self.section_failure_rate / 2:
+                continue  # section missing
+            section = {
+                "id": recipe_id,
+                "normalized_ingredients": sorted({ingredient.split()[-1] for ingredient in ingredients}),
+                "ingredient_analysis": [
+                    {"ingredient": ingredient, "usage": "central", "reason": "stub"} for ingredient in ingredients
+                ],
+            }
+            if roll < self.section_failure_rate:
+                section["ingredient_analysis"] = section["ingredient_analysis"][1:]  # an ingredient left out
+            sections.append(section)
+        return StubResponse(json.dumps({"recipes": sections}))
+
+
+def make_recipes(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"_id": f"recipe-{i}", "title": f"Recipe {i}", "ingredients": rng.sample(INGREDIENTS, rng.randint(4, 10))}
+        for i in range(count)
+    ]
+
+
+def run(recipes, pack_size, workers, model, limiter):
+    """Process every recipe, re-queueing failed sections up to MAX_ATTEMPTS times"""
+    pending = list(recipes)
+    done = 0
+    requeued = 0
+    attempts = 0
+    start = time.perf_counter()
+    while pending and attempts < MAX_ATTEMPTS:
+        attempts += 1
+        packs = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = [r for rs in executor.map(lambda pack: process_pack(pack, model, limiter), packs) for r in rs]
+        failed_ids = {result["_id"] for result in results if "data" not in result}
+        done += len(results) - len(failed_ids)
+        pending = [recipe for recipe in pending if recipe["_id"] in failed_ids]
+        if attempts < MAX_ATTEMPTS:
+            requeued += len(pending)
+    return done, len(pending), requeued, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--pack-sizes", default="1,2,4,8,16", help="Comma-separated values of K")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent API calls")
+    parser.add_argument("--rate", type=float, default=20, help="API calls/sec allowed by the limiter")
+    parser.add_argument("--overhead", type=float, default=0.3, help="Stub seconds per call")
+    parser.add_argument("--per-recipe", type=float, default=0.03, help="Stub seconds per recipe in the prompt")
+    parser.add_argument("--failure-rate", type=float, default=0.03, help="Probability that a section is bad")
+    args = parser.parse_args()
+
+    recipes = make_recipes(args.recipes)
+    print(f"{args.recipes} recipes, {args.workers} workers, {args.rate:g} calls/sec, stub latency "
+          f"{args.overhead}s + {args.per_recipe}s per recipe, {args.failure_rate:.0%} bad sections\n")
+    print(f"{'K':>4} {'recipes/sec':>12} {'calls':>7} {'re-queued':>10} {'failed':>7} {'seconds':>8}")
+    for pack_size in [int(k) for k in args.pack_sizes.split(",")]:
+        model = StubModel(args.overhead, args.per_recipe, args.failure_rate)
+        limiter = AdaptiveLimiter(rate=args.rate, max_concurrency=args.workers, latency_target=0)
+        done, failed, requeued, elapsed = run(recipes, pack_size, args.workers, model, limiter)
+        print(f"{pack_size:>4} {done / elapsed:>12.1f} {model.calls:>7} {requeued:>10} {failed:>7} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the shared Gemini rate limiter against fake_llm_server.
+
+Starts a throttling fake endpoint in-process and pushes the same workload
+through it twice with a fixed pool of worker threads:
+  legacy    every worker calls as fast as it can and, on failure, sleeps
+            2s, 4s, ... like the original retry loop (all in lockstep)
+  adaptive  calls go through rate_limiter.AdaptiveLimiter and
+            call_with_retries (token bucket + AIMD window + jittered backoff)
+and prints completed calls, failures, 429s and wall time for each.
+
+    python bench_rate_limiter.py [--requests 60] [--workers 20] [--server-rate 5]
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from fake_llm_server import start_fake_server
+from rate_limiter import AdaptiveLimiter, call_with_retries
+
+MAX_RETRIES = 3
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} from fake LLM server")
+        self.code = code
+
+
+def generate(base_url):
+    request = urllib.request.Request(
+        f"{base_url}/v1beta/models/gemini-1.5-flash-latest:generateContent",
+        data=json.dumps({"contents": [{"parts": [{"text": "analyze"}]}]}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise HTTPStatusError(e.code)
+
+
+def legacy_call(base_url):
+    # The original loop: fixed doubling delay, no jitter, no shared state
+    delay = 2
+    for attempt in range(MAX_RETRIES):
+        try:
+            return generate(base_url)
+        except Exception:
+            time.sleep(delay)
+            delay *= 2
+    return None
+
+
+def adaptive_call(base_url, limiter):
+    try:
+        return call_with_retries(lambda: generate(base_url), limiter, max_retries=MAX_RETRIES)
+    except Exception:
+        return None
+
+
+def run(name, call, requests, workers, server_args):
+    server, base_url, state = start_fake_server(**server_args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda _: call(base_url), range(requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    completed = sum(result is not None for result in results)
+    stats = state.stats()
+    print(f"{name:<9} {completed:>4}/{requests} completed, {requests - completed:>3} failed, "
+          f"{stats['throttled']:>4} x 429 of {stats['requests']} requests, "
+          f"{elapsed:6.2f}s ({completed / elapsed:.2f} calls/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=20, help="Worker threads (MAX_WORKERS in data_refine_gem)")
+    parser.add_argument("--server-rate", type=float, default=5, help="Requests/sec the fake server accepts")
+    parser.add_argument("--server-concurrency", type=int, default=8, help="In-flight requests the fake server accepts")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake server seconds per response")
+    parser.add_argument("--rate", type=float, default=10, help="Limiter starting (and maximum) requests/sec")
+    args = parser.parse_args()
+
+    server_args = {"rate": args.server_rate, "max_concurrency": args.server_concurrency, "latency": args.latency}
+    print(f"{args.requests} calls, {args.workers} workers, fake server accepting "
+          f"{args.server_rate:g} req/sec and {args.server_concurrency} in flight\n")
+
+    run("legacy", legacy_call, args.requests, args.workers, server_args)
+    limiter = AdaptiveLimiter(rate=args.rate, max_concurrency=args.workers, latency_target=0)
+    run("adaptive", lambda base_url: adaptive_call(base_url, limiter), args.requests, args.workers, server_args)
+    print(f"\nAdaptive limiter: {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark for sharing the recipe snapshot file between API workers.
+
+Writes a snapshot of synthetic recipes, then starts N worker processes that
+either map the file (what RECIPE_SNAPSHOT_PATH does) or hold a private copy
+of every array (what each worker ends up with without a shared file). Every
+worker touches all of its pages and runs a title search through a TitleIndex
+following the snapshot, and once all of them are loaded each reports the
+growth of its proportional set size (PSS, shared pages split between the
+processes mapping them) and its whole-process RSS. Prints the PSS total over
+all workers, which grows with N for private copies and stays roughly flat for
+the shared file, and the mean RSS of one worker, which counts the shared pages
+in full plus the interpreter, numpy and the title index's private length order.
+
+This covers the snapshot and the title index only. A real API worker also
+builds its own ingredient_index postings and allergen_analytics bitmaps from
+Mongo when those endpoints are used; they are not shared and not measured here.
+Linux only (reads /proc/self/smaps_rollup and /proc/self/status).
+
+    python bench_snapshot_workers.py [--recipes 200000] [--workers 1,2,4,8]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+from bench_allergen_analytics import make_recipes
+from recipe_snapshot import RecipeSnapshot, StringColumn
+from title_index import TitleIndex
+
+
+def proc_kib(path, field):
+    with open(path) as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"no {field} in {path}")
+
+
+def pss_bytes():
+    return proc_kib("/proc/self/smaps_rollup", "Pss")
+
+
+def rss_bytes():
+    return proc_kib("/proc/self/status", "VmRSS")
+
+
+def private_copy(snapshot):
+    strings = {
+        name: StringColumn(np.array(column.buffer), np.array(column.offsets))
+        for name, column in snapshot.strings.items()
+    }
+    arrays = {name: np.array(array) for name, array in snapshot.arrays.items()}
+    return RecipeSnapshot(strings, arrays, snapshot.built_at)
+
+
+def worker(path, shared, barrier, results):
+    before = pss_bytes()
+    snapshot = RecipeSnapshot.open(path)
+    if not shared:
+        snapshot = private_copy(snapshot)
+    # Fault in every page, like a worker that has served for a while
+    touched = sum(int(array.sum()) for array in snapshot.columns().values())
+    title_index = TitleIndex(collection=None)
+    title_index.use_snapshot(snapshot)
+    title_index.search("chicken")
+    barrier.wait()  # measure only once every worker holds the snapshot
+    results.put((pss_bytes() - before, rss_bytes()))
+    barrier.wait()
+    return touched
+
+
+def run(path, workers, shared):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(path, shared, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(pss for pss, _ in measured), sum(rss for _, rss in measured) / workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=200000)
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated worker counts")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "recipes.snapshot")
+        recipes = make_recipes(args.recipes)
+        for recipe in recipes:
+            recipe["_id"] = f"{recipe['_id']:08d}"
+        RecipeSnapshot.build(recipes).save(path)
+        del recipes
+        print(f"{args.recipes} recipes, snapshot file {os.path.getsize(path) / 1024 / 1024:.1f} MiB\n")
+        print(f"{'':>8} {'PSS growth, all workers':>25} {'RSS per worker':>25}")
+        print(f"{'workers':>8} {'private MiB':>12} {'shared MiB':>12} {'private MiB':>12} {'shared MiB':>12}")
+        mib = 1024 * 1024
+        for workers in [int(n) for n in args.workers.split(",")]:
+            private_pss, private_rss = run(path, workers, shared=False)
+            shared_pss, shared_rss = run(path, workers, shared=True)
+            print(f"{workers:>8} {private_pss / mib:>12.1f} {shared_pss / mib:>12.1f} "
+                  f"{private_rss / mib:>12.1f} {shared_rss / mib:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
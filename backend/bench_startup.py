@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark for API cold-start time.
+
+Times fresh interpreters importing main and entering its lifespan startup
+(what a new serverless container pays before it can serve), and compares
+that with the work main no longer does at import: creating the Mongo
+clients and importing the Gemini SDK. The warm-up the lifespan starts in
+the background (the title index scan and, with RECIPE_SNAPSHOT=true, the
+snapshot load) is timed until it finishes, both from a cold process and on
+its own. Each scenario runs in its own process, so nothing is cached in
+memory between runs; the median of several runs is printed.
+
+The warm-up scenarios read the recipes from MONGO_URI; without a reachable
+database they only measure the server selection timeout, so skip them with
+--skip-startup.
+
+    python bench_startup.py [--runs 5] [--skip-startup]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs the lifespan up to the point where the app serves requests
+STARTUP = """
+import asyncio
+asyncio.run(main.lifespan(main.app).__aenter__())
+"""
+WARM_UP = "main.app.state.warm_up.join()"
+
+# (name, untimed setup, timed code, waits for the warm-up)
+SCENARIOS = [
+    ("import main", "", "import main", False),
+    ("import main + lifespan startup (serving)", "", "import main" + STARTUP, False),
+    ("import main + startup + warm-up finished", "", "import main" + STARTUP + WARM_UP, True),
+    ("warm-up alone (after startup)", "import main" + STARTUP, WARM_UP, True),
+    ("import main + Mongo clients", "",
+     "import main, db; db.client.codec_options; db.async_client.codec_options", False),
+    ("import main + Mongo clients + Gemini SDK (eager)", "",
+     "import main, db; db.client.codec_options; db.async_client.codec_options; import google.generativeai", False),
+    ("import google.generativeai alone", "", "import google.generativeai", False),
+]
+
+TIMER = """
+{setup}
+import time
+_start = time.perf_counter()
+{code}
+print(time.perf_counter() - _start)
+"""
+
+
+def time_once(code, setup=""):
+    env = dict(os.environ)
+    # Creating a client starts its background monitors but never waits for the server
+    env.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    output = subprocess.run(
+        [sys.executable, "-c", TIMER.format(setup=setup, code=code)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-startup", action="store_true", help="Skip the scenarios that wait for the warm-up")
+    args = parser.parse_args()
+
+    time_once("import main")  # warm the OS file cache so the first scenario isn't penalized
+    print(f"{'scenario':<50} {'median ms':>10} {'min ms':>8}")
+    for name, setup, code, warm_up in SCENARIOS:
+        if warm_up and args.skip_startup:
+            continue
+        times = [time_once(code, setup) for _ in range(args.runs)]
+        print(f"{name:<50} {statistics.median(times) * 1000:>10.0f} {min(times) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
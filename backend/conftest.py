@@ -0,0 +1 @@
+# Lets tests import the backend modules the way main.py does (flat, from this directory)
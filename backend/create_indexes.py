@@ -3,6 +3,10 @@
 Script to create database indexes for better performance
 """
 from db import recipes_collection
+import sys
+from title_search import plan_stages, uses_title_tokens_index, winning_plan
+from analysis_queue import ensure_queue_indexes
+from dish_stats import ensure_dish_stats_indexes
 
 def create_indexes():
     try:
@@ -17,6 +21,18 @@ def create_indexes():
         ])
         print("✓ Created compound index on 'title' and 'ingredients'")
         
+        # Multikey index backing the anchored token search in title_search.py
+        recipes_collection.create_index([("title_tokens", 1)])
+        print("✓ Created index on 'title_tokens' field")
+        
+        # Work-queue indexes for the ingredient analysis in data_refine_gem.py
+        ensure_queue_indexes(recipes_collection)
+        print("✓ Created work-queue indexes on 'analysis_state' and 'analysis_claim'")
+        
+        # Grouping and incremental refresh of the precomputed dish_stats
+        ensure_dish_stats_indexes(recipes_collection)
+        print("✓ Created indexes on 'dish_key' and 'dish_stats_stale'")
+        
         # List all indexes
         indexes = recipes_collection.list_indexes()
         print("\nCurrent indexes:")
@@ -26,5 +42,28 @@ def create_indexes():
     except Exception as e:
         print(f"Error creating indexes: {e}")
 
+def check_title_search_plan(dish="chicken"):
+    """
+    Confirm the default title search is answered from the title_tokens index,
+    not a scan. Returns False if any variant of the lookup is not.
+    """
+    ok = True
+    try:
+        for whole_words in (False, True):
+            plan = winning_plan(recipes_collection, dish, whole_words, backend="tokens")
+            stages = " <- ".join(plan_stages(plan))
+            label = "whole-word" if whole_words else "prefix"
+            if uses_title_tokens_index(plan):
+                print(f"✓ {label} title search for '{dish}' uses the title_tokens index: {stages}")
+            else:
+                print(f"✗ {label} title search for '{dish}' does not use the title_tokens index: {stages}")
+                ok = False
+    except Exception as e:
+        print(f"Error explaining title search: {e}")
+        ok = False
+    return ok
+
 if __name__ == "__main__":
     create_indexes()
+    if not check_title_search_plan():
+        sys.exit(1)
@@ -1,26 +1,282 @@
+import argparse
+import glob
 import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Full
+import ijson
+from pymongo import UpdateOne
 from db import recipes_collection
+from recipe_enrichment import enrich_recipe
+from result_cache import invalidate_result_caches
+from analysis_queue import FAILED, IN_FLIGHT, PENDING
+
+# Recipes per unordered bulk_write in the streaming loader
+LOAD_BATCH_SIZE = 1000
+# Parallel ingest: parser processes and batches buffered for the writer
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_QUEUE_SIZE = 8
+
+def clean_recipe(recipe_id, recipe_data):
+    recipe_data["_id"] = recipe_id  # preserve original ID
+    # remove "ADVERTISEMENT"
+    recipe_data["ingredients"] = [
+        i.replace("ADVERTISEMENT", "").strip()
+        for i in recipe_data.get("ingredients", [])
+        if i.strip() != "ADVERTISEMENT"
+    ]
+    recipe_data.update(enrich_recipe(recipe_data))
+    return recipe_data
 
 def load_json(file_path):
     with open(file_path, "r") as f:
         data = json.load(f)
-    
+
     docs = []
     for recipe_id, recipe_data in data.items():
-        recipe_data["_id"] = recipe_id  # preserve original ID
-        # remove "ADVERTISEMENT"
-        recipe_data["ingredients"] = [
-            i.replace("ADVERTISEMENT", "").strip()
-            for i in recipe_data.get("ingredients", [])
-            if i.strip() != "ADVERTISEMENT"
-        ]
-        docs.append(recipe_data)
-    
+        doc = clean_recipe(recipe_id, recipe_data)
+        doc["analysis_state"] = PENDING
+        doc["dish_stats_stale"] = True
+        docs.append(doc)
+
     if docs:
         recipes_collection.insert_many(docs)
         print(f"Inserted {len(docs)} recipes from {file_path}")
+        invalidate_result_caches(recipes_collection.database)
+
+# --- Streaming loader ---
+def upsert_operation(doc):
+    # $set rather than a replace, so analysis fields added later by
+    # data_refine_gem survive a reload of the raw file. This is a pipeline
+    # update, so values are wrapped in $literal to never be read as field paths.
+    fields = {k: {"$literal": v} for k, v in doc.items() if k != "_id"}
+    # dish_stats.py recomputes the dishes of marked recipes
+    fields["dish_stats_stale"] = {"$literal": True}
+    fields["analysis_state"] = reloaded_analysis_state(doc["ingredients_hash"])
+    return UpdateOne({"_id": doc["_id"]}, [{"$set": fields}], upsert=True)
+
+def reloaded_analysis_state(new_hash):
+    """
+    Queue state of a reloaded recipe, following analysis_queue's rules. Field
+    paths read the stored document as it was before this update.
+    """
+    def stored(field):
+        return {"$ifNull": [f"${field}", None]}
+    return {"$switch": {"branches": [
+        # Recipes without a state (new, or analyzed before the queue existed) are left for
+        # sync_work_queue to migrate, unless their stored ingredients visibly changed
+        {"case": {"$eq": [stored("analysis_state"), None]},
+         "then": {"$cond": [
+             {"$in": [stored("ingredients_hash"), [None, new_hash]]}, "$$REMOVE", PENDING,
+         ]}},
+        # A worker holds the lease; its completion records the hash it analyzed
+        {"case": {"$eq": ["$analysis_state", IN_FLIGHT]}, "then": "$analysis_state"},
+        # Failed stays failed until the ingredients change
+        {"case": {"$and": [
+            {"$eq": ["$analysis_state", FAILED]}, {"$eq": [stored("failed_hash"), new_hash]},
+        ]}, "then": "$analysis_state"},
+        {"case": {"$eq": [stored("analyzed_hash"), new_hash]}, "then": "$analysis_state"},
+    ], "default": PENDING}}
+
+def checkpoint_path(file_path):
+    return file_path + ".checkpoint"
+
+def read_checkpoint(file_path):
+    """Number of recipes already written from this exact file, 0 if there is no usable checkpoint"""
+    try:
+        with open(checkpoint_path(file_path), "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    stat = os.stat(file_path)
+    if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime") != stat.st_mtime:
+        print(f"Ignoring checkpoint for {file_path}: the file changed since it was written")
+        return 0
+    return checkpoint.get("processed", 0)
+
+def write_checkpoint(file_path, processed):
+    stat = os.stat(file_path)
+    tmp_path = checkpoint_path(file_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"size": stat.st_size, "mtime": stat.st_mtime, "processed": processed}, f)
+    os.replace(tmp_path, checkpoint_path(file_path))
+
+def iter_recipes(file_path):
+    """Yield (recipe_id, recipe_data) from a {id: recipe} JSON file without loading it whole"""
+    with open(file_path, "rb") as f:
+        yield from ijson.kvitems(f, "", use_float=True)
+
+def load_json_streaming(file_path, batch_size=LOAD_BATCH_SIZE, resume=True):
+    """
+    Stream a raw recipes file into Mongo with constant memory.
+
+    Recipes are parsed incrementally, written as unordered upsert batches (so
+    re-running never fails on existing _ids) and progress is checkpointed next
+    to the file after every batch; an interrupted load resumes from there.
+    """
+    skip = read_checkpoint(file_path) if resume else 0
+    if skip:
+        print(f"Resuming {file_path} after {skip} recipes")
+
+    start_time = time.time()
+    processed = 0
+    written = 0
+    batch = []
+
+    def flush():
+        nonlocal written, batch
+        if batch:
+            recipes_collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+            batch = []
+        write_checkpoint(file_path, processed)
+        elapsed = time.time() - start_time
+        print(f"{file_path}: {written} recipes written ({written / elapsed if elapsed else 0:.0f} docs/sec)")
+
+    for recipe_id, recipe_data in iter_recipes(file_path):
+        processed += 1
+        if processed <= skip:
+            continue
+        batch.append(upsert_operation(clean_recipe(recipe_id, recipe_data)))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    os.remove(checkpoint_path(file_path))
+    elapsed = time.time() - start_time
+    print(f"✓ Loaded {written} recipes from {file_path} in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed else 0:.0f} docs/sec)")
+    if written:
+        invalidate_result_caches(recipes_collection.database)
+    return written
+
+# --- Parallel multi-file ingest ---
+def parse_file(file_path, batch_size, queue, skip):
+    """
+    Worker process: parse and clean one file, handing batches to the writer.
+
+    Each message is (file_path, processed, docs, done); processed counts every
+    recipe seen so far so the writer can checkpoint after writing the batch.
+    """
+    processed = 0
+    batch = []
+    for recipe_id, recipe_data in iter_recipes(file_path):
+        processed += 1
+        if processed <= skip:
+            continue
+        batch.append(clean_recipe(recipe_id, recipe_data))
+        if len(batch) >= batch_size:
+            queue.put((file_path, processed, batch, False))
+            batch = []
+    queue.put((file_path, processed, batch, True))
+    return processed
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or ([pattern] if os.path.exists(pattern) else [])
+        if not matches:
+            print(f"Warning: no files match {pattern}")
+        files.extend(matches)
+    return list(dict.fromkeys(files))
+
+def ingest(files, workers=DEFAULT_WORKERS, batch_size=LOAD_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE, resume=True):
+    """
+    Load many raw files at once: a process pool parses and cleans them while
+    this process drains a bounded queue and writes each batch to Mongo.
+
+    A single writer keeps every file's batches in order, so checkpoints stay
+    valid and an interrupted ingest resumes like load_json_streaming. If a
+    write fails, the parsers are stopped and the error is raised.
+    """
+    start_time = time.time()
+    written = {file_path: 0 for file_path in files}
+    remaining = set(files)
+
+    manager = multiprocessing.Manager()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    stopping = threading.Event()
+    try:
+        # Bounded, so parsers block instead of piling cleaned recipes up in memory
+        queue = manager.Queue(maxsize=queue_size)
+
+        def report_failure(file_path):
+            def callback(future):
+                if future.cancelled() or future.exception() is None:
+                    return
+                # Runs on the pool's management thread: never block it on a queue nobody drains any more
+                while not stopping.is_set():
+                    try:
+                        queue.put((file_path, None, future.exception(), True), timeout=1)
+                        return
+                    except Full:
+                        continue
+                    except Exception:
+                        return  # the manager is already gone
+            return callback
+
+        for file_path in files:
+            skip = read_checkpoint(file_path) if resume else 0
+            if skip:
+                print(f"Resuming {file_path} after {skip} recipes")
+            future = pool.submit(parse_file, file_path, batch_size, queue, skip)
+            future.add_done_callback(report_failure(file_path))
+
+        while remaining:
+            file_path, processed, docs, done = queue.get()
+            if processed is None:
+                print(f"✗ Failed to parse {file_path}: {docs}")
+                remaining.discard(file_path)
+                continue
+            if docs:
+                recipes_collection.bulk_write([upsert_operation(doc) for doc in docs], ordered=False)
+                written[file_path] += len(docs)
+            write_checkpoint(file_path, processed)
+            if done:
+                os.remove(checkpoint_path(file_path))
+                remaining.discard(file_path)
+                print(f"✓ {file_path}: {written[file_path]} recipes written")
+            else:
+                total = sum(written.values())
+                elapsed = time.time() - start_time
+                print(f"{total} recipes written ({total / elapsed if elapsed else 0:.0f} docs/sec)")
+    except BaseException:
+        # Parsers may be blocked on the full queue. Stopping the manager makes their
+        # next put fail, so neither they nor the pool wait on a writer that is gone.
+        stopping.set()
+        manager.shutdown()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    manager.shutdown()
+
+    total = sum(written.values())
+    elapsed = time.time() - start_time
+    print("\n--- Ingest summary ---")
+    for file_path, count in written.items():
+        print(f"  {file_path}: {count} recipes")
+    print(f"  {total} recipes from {len(files)} files in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.0f} docs/sec) with {workers} workers, batch size {batch_size}")
+    if total:
+        invalidate_result_caches(recipes_collection.database)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Load raw recipe JSON dumps into MongoDB")
+    parser.add_argument("inputs", nargs="+", help="Input files or glob patterns, e.g. 'recipes_raw/*.json'")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parser processes")
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE, help="Recipes per bulk write")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Batches buffered between parsers and the writer")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore existing checkpoints and load every file from the start")
+    args = parser.parse_args()
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error("no input files found")
+    ingest(files, args.workers, args.batch_size, args.queue_size, resume=not args.no_resume)
 
 if __name__ == "__main__":
-    load_json("/Users/prema/Downloads/recipes_raw/recipes_raw_nosource_ar.json")
-    load_json("/Users/prema/Downloads/recipes_raw/recipes_raw_nosource_epi.json")
-    load_json("/Users/prema/Downloads/recipes_raw/recipes_raw_nosource_fn.json")
+    main()
@@ -1,10 +1,13 @@
 import os
 import json
 import time
-from pymongo import MongoClient, UpdateOne
-import google.generativeai as genai
+from pymongo import MongoClient
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor
+from analysis_queue import PENDING, ensure_queue_indexes, sync_work_queue
+from enrichment_pipeline import EnrichmentPipeline
+from gemini_integration import configure_gemini, genai_sdk
+from rate_limiter import gemini_limiter, call_with_retries
+from ingredient_cache import LINE_CACHE_COLLECTION, IngredientLineCache, line_key, assemble_analysis
 
 load_dotenv()
 
@@ -17,7 +20,13 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # --- UPDATED: Processing configuration for maximum efficiency ---
 BATCH_SIZE = 50 # How many recipes to fetch from the DB at a time
-MAX_WORKERS = 20 # Increased for faster parallel processing. You can experiment with higher values.
+WRITE_BATCH_SIZE = 50 # How many results to collect per bulk write (partial batches are flushed every few seconds)
+MAX_WORKERS = 20 # Analysis threads; calls actually in flight adapt to throttling (see rate_limiter.py)
+PACK_SIZE = int(os.getenv("ENRICHMENT_PACK_SIZE", "1")) # Recipes per prompt; 1 keeps the one-recipe prompt
+# Analyze each distinct ingredient line once and assemble recipes from the cache (see ingredient_cache.py).
+# Off by default: line prompts don't see the recipe a line belongs to, so usage/reason can't use the
+# dish, and when on it replaces the packed recipe prompts selected with ENRICHMENT_PACK_SIZE.
+USE_LINE_CACHE = os.getenv("ENRICHMENT_LINE_CACHE", "false").lower() in ("1", "true", "yes")
 
 # --- 1. SETUP API AND DATABASE CONNECTIONS ---
 def setup_connections():
@@ -25,7 +34,7 @@ def setup_connections():
     print("Setting up connections...")
     if not GOOGLE_API_KEY:
         raise ValueError("GOOGLE_API_KEY environment variable not set.")
-    genai.configure(api_key=GOOGLE_API_KEY)
+    configure_gemini(GOOGLE_API_KEY)
 
     client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
@@ -83,22 +92,240 @@ def get_full_ingredient_analysis_from_gemini(ingredients):
     """
     generation_config = {"response_mime_type": "application/json"}
     # --- UPDATED: Switched to the faster, more cost-effective Flash model ---
-    model = genai.GenerativeModel("gemini-1.5-flash-latest", generation_config=generation_config)
+    model = genai_sdk().GenerativeModel("gemini-1.5-flash-latest", generation_config=generation_config)
     
-    # --- NEW: Retry logic with exponential backoff ---
-    max_retries = 3
-    delay = 2  # Initial delay in seconds
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt, request_options={'timeout': 120})
-            return json.loads(response.text)
-        except Exception as e:
-            print(f"Attempt {attempt + 1}/{max_retries} failed: {e}. Retrying in {delay} seconds...")
-            time.sleep(delay)
-            delay *= 2  # Double the delay for the next retry
-    
-    print("All retry attempts failed.")
-    return None
+    # Retries with jittered exponential backoff, under the shared rate limit and
+    # adaptive concurrency window (so 429s shrink the number of calls in flight)
+    try:
+        return call_with_retries(
+            lambda: json.loads(model.generate_content(prompt, request_options={'timeout': 120}).text),
+            gemini_limiter,
+            max_retries=3,
+        )
+    except Exception as e:
+        print(f"All retry attempts failed: {e}")
+        return None
+
+
+# --- 2b. PACKED MODE: SEVERAL RECIPES PER PROMPT ---
+# Gemini's response schemas can't describe objects keyed by arbitrary ids, so
+# packed responses are arrays and are converted back to the stored shape.
+USAGE_VALUES = ["central", "garnish", "trace", "none"]
+PACKED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recipes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "normalized_ingredients": {"type": "array", "items": {"type": "string"}},
+                    "ingredient_analysis": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "ingredient": {"type": "string"},
+                                "usage": {"type": "string", "enum": USAGE_VALUES},
+                                "reason": {"type": "string"},
+                            },
+                            "required": ["ingredient", "usage", "reason"],
+                        },
+                    },
+                },
+                "required": ["id", "normalized_ingredients", "ingredient_analysis"],
+            },
+        },
+    },
+    "required": ["recipes"],
+}
+
+def build_packed_prompt(recipes):
+    """One prompt for several recipes, keyed by recipe _id"""
+    packed = {str(recipe["_id"]): recipe["ingredients"] for recipe in recipes}
+    return f"""
+    You are an expert food data processor. Your task is to return a single, valid JSON object and nothing else.
+    Below are {len(packed)} recipes, keyed by recipe id. For EACH recipe, perform two actions on its ingredient list: normalization and usage analysis.
+
+    **Recipes:**
+    {json.dumps(packed, indent=2)}
+
+    **Task 1: Normalization**
+    Create a flat list of normalized, categorized terms. Rules:
+    1. Identify the core food item (e.g., "shredded mozzarella" -> "mozzarella").
+    2. Add parent categories (e.g., "mozzarella" -> "cheese", "dairy").
+    3. Deconstruct sauces into key components (e.g., "sambal oelek" -> "chili").
+    4. Exclude "salt", "pepper", "water".
+    5. The final list must be unique, lowercase strings.
+
+    **Task 2: Usage Analysis**
+    For each original ingredient, determine its "usage" ("central", "garnish", "trace", or "none") and provide a "reason".
+    The "ingredient" value must be the original ingredient string, copied exactly.
+
+    **Output Format:**
+    Your response MUST be a single JSON object with one key, "recipes": an array with one entry per recipe id above.
+
+    **Example Output Structure:**
+    {{
+      "recipes": [
+        {{
+          "id": "<recipe id>",
+          "normalized_ingredients": ["mozzarella", "cheese", "dairy", "pecan", "nuts"],
+          "ingredient_analysis": [
+            {{"ingredient": "1/2 cup shredded mozzarella", "usage": "central", "reason": "Provides the main cheesy component."}},
+            {{"ingredient": "2 oz finely chopped pecans", "usage": "garnish", "reason": "Adds texture and flavor but can be omitted."}}
+          ]
+        }}
+      ]
+    }}
+    """
+
+def validate_packed_section(section, ingredients):
+    """
+    Check one recipe's section and convert it to the stored format.
+
+    Returns {"normalized_ingredients": [...], "ingredient_analysis": {ingredient: {usage, reason}}},
+    or None when the section is malformed or doesn't cover every original ingredient.
+    """
+    normalized = section.get("normalized_ingredients")
+    entries = section.get("ingredient_analysis")
+    if not isinstance(normalized, list) or not all(isinstance(n, str) for n in normalized):
+        return None
+    if not isinstance(entries, list):
+        return None
+    analysis = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("usage") not in USAGE_VALUES:
+            return None
+        if entry.get("ingredient") in ingredients:
+            analysis[entry["ingredient"]] = {"usage": entry["usage"], "reason": entry.get("reason", "")}
+    # The API looks usages up by the exact original ingredient string
+    if any(ingredient not in analysis for ingredient in ingredients):
+        return None
+    return {"normalized_ingredients": normalized, "ingredient_analysis": analysis}
+
+def split_packed_response(response, recipes):
+    """Map each recipe _id to its validated analysis, or None if its section is missing or invalid"""
+    analyses = {recipe["_id"]: None for recipe in recipes}
+    if not isinstance(response, dict) or not isinstance(response.get("recipes"), list):
+        return analyses
+    by_key = {str(recipe["_id"]): recipe for recipe in recipes}
+    for section in response["recipes"]:
+        recipe = by_key.get(str(section.get("id"))) if isinstance(section, dict) else None
+        if recipe is not None and analyses[recipe["_id"]] is None:
+            analyses[recipe["_id"]] = validate_packed_section(section, recipe["ingredients"])
+    return analyses
+
+def packed_model():
+    generation_config = {"response_mime_type": "application/json", "response_schema": PACKED_RESPONSE_SCHEMA}
+    return genai_sdk().GenerativeModel("gemini-1.5-flash-latest", generation_config=generation_config)
+
+def get_packed_analysis_from_gemini(recipes, model=None, limiter=gemini_limiter):
+    """
+    Analyze several recipes in a single API call.
+
+    Returns {recipe _id: analysis or None}; None marks recipes whose section
+    failed validation (or all of them if the call itself failed).
+    """
+    model = model or packed_model()
+    prompt = build_packed_prompt(recipes)
+    try:
+        response = call_with_retries(
+            lambda: json.loads(model.generate_content(prompt, request_options={'timeout': 120}).text),
+            limiter,
+            max_retries=3,
+        )
+    except Exception as e:
+        print(f"All retry attempts failed for a pack of {len(recipes)} recipes: {e}")
+        response = None
+    return split_packed_response(response, recipes)
+
+
+# --- 2c. LINE MODE: ANALYZE DISTINCT INGREDIENT LINES, BACKED BY A SHARED CACHE ---
+LINE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lines": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "ingredient": {"type": "string"},
+                    "normalized_ingredients": {"type": "array", "items": {"type": "string"}},
+                    "usage": {"type": "string", "enum": USAGE_VALUES},
+                    "reason": {"type": "string"},
+                },
+                "required": ["ingredient", "normalized_ingredients", "usage", "reason"],
+            },
+        },
+    },
+    "required": ["lines"],
+}
+
+def build_line_prompt(lines):
+    return f"""
+    You are an expert food data processor. Your task is to return a single, valid JSON object and nothing else.
+    Below is a list of recipe ingredient lines. Analyze EACH line on its own.
+
+    **Ingredient Lines:**
+    {json.dumps(lines, indent=2)}
+
+    **For each line:**
+    1. "normalized_ingredients": a list of normalized, categorized terms. Identify the core food item
+       (e.g., "shredded mozzarella" -> "mozzarella"), add parent categories ("cheese", "dairy") and deconstruct
+       sauces into key components (e.g., "sambal oelek" -> "chili"). Exclude "salt", "pepper", "water".
+       Use unique, lowercase strings.
+    2. "usage": how the ingredient is typically used in a dish ("central", "garnish", "trace", or "none"), with a "reason".
+    3. "ingredient": the original line, copied exactly.
+
+    **Output Format:**
+    Your response MUST be a single JSON object with one key, "lines": an array with one entry per line above.
+
+    **Example Output Structure:**
+    {{
+      "lines": [
+        {{"ingredient": "1/2 cup shredded mozzarella", "normalized_ingredients": ["mozzarella", "cheese", "dairy"],
+          "usage": "central", "reason": "Provides the main cheesy component."}}
+      ]
+    }}
+    """
+
+def line_model():
+    generation_config = {"response_mime_type": "application/json", "response_schema": LINE_RESPONSE_SCHEMA}
+    return genai_sdk().GenerativeModel("gemini-1.5-flash-latest", generation_config=generation_config)
+
+def get_line_analysis_from_gemini(lines, model=None, limiter=gemini_limiter):
+    """
+    Analyze distinct ingredient lines in a single API call.
+
+    Returns {line: entry} for the lines whose entry came back valid; the rest are left out.
+    """
+    model = model or line_model()
+    prompt = build_line_prompt(lines)
+    try:
+        response = call_with_retries(
+            lambda: json.loads(model.generate_content(prompt, request_options={'timeout': 120}).text),
+            limiter,
+            max_retries=3,
+        )
+    except Exception as e:
+        print(f"All retry attempts failed for {len(lines)} ingredient lines: {e}")
+        return {}
+
+    by_key = {line_key(line): line for line in lines}
+    entries = {}
+    for entry in response.get("lines", []) if isinstance(response, dict) else []:
+        if not isinstance(entry, dict) or not isinstance(entry.get("ingredient"), str):
+            continue
+        line = by_key.get(line_key(entry["ingredient"]))
+        normalized = entry.get("normalized_ingredients")
+        if line is None or line in entries or entry.get("usage") not in USAGE_VALUES:
+            continue
+        if not isinstance(normalized, list) or not all(isinstance(n, str) for n in normalized):
+            continue
+        entries[line] = {"normalized_ingredients": normalized, "usage": entry["usage"], "reason": entry.get("reason", "")}
+    return entries
 
 
 # --- 3. TRIAL FUNCTION ---
@@ -112,7 +339,7 @@ def trial():
 
     print(f"--- Starting Trial Run: Fetching {sample_size} sample UNPROCESSED recipes ---")
     
-    query = {"ingredient_analysis_complete": {"$ne": True}}
+    query = {"analysis_state": PENDING}
     samples = list(collection.find(query).limit(sample_size))
 
     if not samples:
@@ -161,47 +388,97 @@ def process_recipe(recipe):
         print(f"Failed to fully analyze recipe {title_for_log} after all retries.")
         return {"_id": recipe_id, "error": "API analysis failed"}
 
+def process_pack(recipes, model=None, limiter=gemini_limiter):
+    """
+    Packed counterpart of process_recipe: one API call for all recipes with
+    ingredients, one result per recipe. Recipes whose section failed
+    validation get an error result, so only they go back to the queue.
+    """
+    results = {}
+    to_analyze = []
+    for recipe in recipes:
+        ingredients = recipe.get("ingredients")
+        if not ingredients or not isinstance(ingredients, list):
+            print(f"Skipping recipe {recipe.get('title', recipe['_id'])}: No ingredients list found.")
+            results[recipe["_id"]] = {"_id": recipe["_id"], "error": "No ingredients found"}
+        else:
+            to_analyze.append(recipe)
+
+    if to_analyze:
+        analyses = get_packed_analysis_from_gemini(to_analyze, model, limiter)
+        failed = 0
+        for recipe in to_analyze:
+            analysis = analyses[recipe["_id"]]
+            if analysis is None:
+                failed += 1
+                results[recipe["_id"]] = {"_id": recipe["_id"], "error": "Packed section failed validation"}
+            else:
+                results[recipe["_id"]] = {"_id": recipe["_id"], "data": analysis}
+        print(f"Analyzed a pack of {len(to_analyze)} recipes ({failed} sections re-queued)")
+    return [results[recipe["_id"]] for recipe in recipes]
+
+def process_with_line_cache(recipes, line_cache, model=None, limiter=gemini_limiter):
+    """
+    Counterpart of process_pack that goes through the ingredient line cache:
+    only lines no worker has analyzed yet are sent to the model (one call for
+    the whole pack), and each recipe is assembled from its lines' entries.
+    """
+    results = {}
+    to_analyze = []
+    for recipe in recipes:
+        ingredients = recipe.get("ingredients")
+        if not ingredients or not isinstance(ingredients, list):
+            print(f"Skipping recipe {recipe.get('title', recipe['_id'])}: No ingredients list found.")
+            results[recipe["_id"]] = {"_id": recipe["_id"], "error": "No ingredients found"}
+        else:
+            to_analyze.append(recipe)
+
+    if to_analyze:
+        all_lines = [ingredient for recipe in to_analyze for ingredient in recipe["ingredients"]]
+        entries = line_cache.lookup(all_lines)
+        from_cache = sum(all(line_key(i) in entries for i in recipe["ingredients"]) for recipe in to_analyze)
+
+        # One representative string per uncached line
+        uncached = list({line_key(line): line for line in all_lines if line_key(line) not in entries}.values())
+        if uncached:
+            analyzed = get_line_analysis_from_gemini(uncached, model, limiter)
+            line_cache.store(analyzed)
+            entries.update({line_key(line): entry for line, entry in analyzed.items()})
+        line_cache.record(len(to_analyze), from_cache, called_model=bool(uncached))
+
+        for recipe in to_analyze:
+            analysis = assemble_analysis(recipe["ingredients"], entries)
+            if analysis is None:
+                results[recipe["_id"]] = {"_id": recipe["_id"], "error": "Ingredient line analysis failed"}
+            else:
+                results[recipe["_id"]] = {"_id": recipe["_id"], "data": analysis}
+    return [results[recipe["_id"]] for recipe in recipes]
+
 # --- 5. MAIN PROCESSING LOOP ---
 def main():
     """Main function to run the batch processing script."""
     collection = setup_connections()
-    
-    while True:
-        print(f"\nFetching a new batch of {BATCH_SIZE} unprocessed recipes...")
-        
-        query = {"ingredient_analysis_complete": {"$ne": True}}
-        batch = list(collection.find(query).limit(BATCH_SIZE))
+    ensure_queue_indexes(collection)
+    sync_work_queue(collection)
 
-        if not batch:
-            print("No more recipes to process. All done!")
-            break
+    # Claiming, analysis and writes overlap, so the workers stay busy across batches.
+    # Claims are disjoint, so several copies of this script can run at once.
+    print(f"Starting pipelined processing with {MAX_WORKERS} workers (claims of {BATCH_SIZE} recipes, "
+          f"{PACK_SIZE} recipes per prompt, line cache {'on' if USE_LINE_CACHE else 'off'})...")
+    line_cache = None
+    if USE_LINE_CACHE:
+        line_cache = IngredientLineCache(collection.database[LINE_CACHE_COLLECTION])
+        analyze = lambda recipes: process_with_line_cache(recipes, line_cache)
+    else:
+        analyze = process_pack if PACK_SIZE > 1 else None
+    EnrichmentPipeline(
+        collection, process_recipe, MAX_WORKERS, BATCH_SIZE, write_batch_size=WRITE_BATCH_SIZE,
+        pack_size=PACK_SIZE, process_pack=analyze,
+    ).run()
+    print(f"Gemini calls: {gemini_limiter.stats()}")
+    if line_cache is not None:
+        line_cache.report()
+    print("No more recipes to process. All done!")
 
-        print(f"Found {len(batch)} recipes. Starting parallel processing with {MAX_WORKERS} workers...")
-        
-        update_operations = []
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            results = executor.map(process_recipe, batch)
-
-            for result in results:
-                if "data" in result:
-                    update_operations.append(UpdateOne(
-                        {"_id": result["_id"]},
-                        {"$set": {
-                            "ingredient_analysis": result["data"]["ingredient_analysis"],
-                            "normalized_ingredients": result["data"]["normalized_ingredients"],
-                            "ingredient_analysis_complete": True
-                        }}
-                    ))
-                elif "error" in result and result["error"] == "No ingredients found":
-                    update_operations.append(UpdateOne(
-                        {"_id": result["_id"]},
-                        {"$set": {"ingredient_analysis_complete": True, "analysis_error": "No ingredients found"}}
-                    ))
-        
-        if update_operations:
-            print(f"Updating {len(update_operations)} recipes in the database...")
-            collection.bulk_write(update_operations)
-            print("Batch update complete.")
-        
 if __name__ == "__main__":
     main()
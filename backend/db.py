@@ -1,24 +1,82 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from dotenv import load_dotenv
 import os
 import certifi
 import ssl
+import threading
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 
+# Connections per client (each worker process has one blocking and one async client)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
 # Fix SSL/TLS issues with MongoDB Atlas
 # Use TLSv1.2+ and proper certificate handling
-client = MongoClient(
-    MONGO_URI,
+CLIENT_OPTIONS = dict(
     tlsCAFile=certifi.where(),
     tlsAllowInvalidCertificates=False,
     tlsAllowInvalidHostnames=False,
     serverSelectionTimeoutMS=10000,
     connectTimeoutMS=10000,
-    socketTimeoutMS=10000
+    socketTimeoutMS=10000,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
 )
 
-db = client["recipes"]
-recipes_collection = db["recipes"]
+
+class LazyProxy:
+    """
+    Stands in for a client, database or collection that is only created on
+    first use, so importing a module that needs Mongo doesn't connect to it.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    @property
+    def is_created(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        if name in ("_factory", "_target", "_lock"):
+            raise AttributeError(name)  # e.g. on a copy that skipped __init__
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+    def __repr__(self):
+        return f"LazyProxy({self._target!r})" if self.is_created else "LazyProxy(<not created>)"
+
+
+# Blocking client for scripts, background jobs and the in-memory indexes
+client = LazyProxy(lambda: MongoClient(MONGO_URI, **CLIENT_OPTIONS))
+
+db = LazyProxy(lambda: client["recipes"])
+recipes_collection = LazyProxy(lambda: db["recipes"])
+
+# Non-blocking client for the async request handlers; same collection, same settings
+async_client = LazyProxy(lambda: AsyncMongoClient(MONGO_URI, **CLIENT_OPTIONS))
+
+async_db = LazyProxy(lambda: async_client["recipes"])
+async_recipes_collection = LazyProxy(lambda: async_db["recipes"])
+
+
+async def close_clients():
+    """Close whichever clients were created, e.g. on application shutdown"""
+    if client.is_created:
+        client.close()
+    if async_client.is_created:
+        await async_client.close()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Precomputed per-dish allergen statistics.
+
+Recipes are grouped by dish key (the title's lowercased words, see dish_key)
+and each group is materialized as one `dish_stats` document:
+  total_recipes     recipes with that dish key
+  allergen_counts   recipes containing each ALLERGEN_TERMS entry
+  masks             distinct allergen masks with their recipe counts, so
+                    "recipes with any of these allergens" is exact for any set
+  usage             per term, how often data_refine_gem's ingredient_analysis
+                    rated the lines containing it central/garnish/trace/none
+  analyzed_recipes  recipes that had an ingredient_analysis
+
+Request handlers do one _id lookup (find_dish_stats) instead of scanning
+recipes, and fall back to the live computation when the dish has no entry,
+the entry predates the current ENRICHMENT_VERSION, or an allergen isn't one
+of the precomputed terms.
+
+Writers mark changed recipes with `dish_stats_stale`; running this module
+recomputes only the dishes those recipes belong to (or belonged to before a
+title change). `--full` rebuilds everything.
+
+    python dish_stats.py [--full]
+"""
+import argparse
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pymongo import ReplaceOne, UpdateOne
+from db import recipes_collection
+from ingredient_mappings import ALLERGEN_TERMS, ALLERGEN_TERM_BITS
+from recipe_enrichment import (
+    ENRICHMENT_VERSION, compute_allergen_mask, has_current_mask, ingredients_text, tokenize_title
+)
+from result_cache import invalidate_result_caches
+
+DISH_STATS_COLLECTION = "dish_stats"
+STATS_BATCH_SIZE = 500
+
+USAGES = ["central", "garnish", "trace", "none"]
+# The most extreme usage of a term within one recipe is the one counted
+USAGE_PRIORITY = {usage: rank for rank, usage in enumerate(USAGES)}
+
+# Recipe fields the statistics are computed from
+STATS_FIELDS = {
+    "title": 1, "dish_key": 1, "ingredients": 1, "allergen_mask": 1,
+    "enrichment_version": 1, "ingredient_analysis": 1,
+}
+
+def dish_key(title):
+    """Recipes (and dish names) with the same lowercased words share statistics"""
+    return " ".join(tokenize_title(title)) if isinstance(title, str) else ""
+
+def recipe_mask(recipe):
+    if has_current_mask(recipe):
+        return recipe["allergen_mask"]
+    return compute_allergen_mask(ingredients_text(recipe.get("ingredients") or []))
+
+def recipe_usages(recipe):
+    """{term: usage} for terms appearing in lines the ingredient analysis rated"""
+    analysis = recipe.get("ingredient_analysis")
+    if not isinstance(analysis, dict):
+        return None
+    usages = {}
+    for line, details in analysis.items():
+        usage = details.get("usage") if isinstance(details, dict) else None
+        if usage not in USAGE_PRIORITY:
+            continue
+        line_lower = line.lower()
+        for term in ALLERGEN_TERMS:
+            if term in line_lower and (term not in usages or USAGE_PRIORITY[usage] < USAGE_PRIORITY[usages[term]]):
+                usages[term] = usage
+    return usages
+
+
+class DishAccumulator:
+    def __init__(self):
+        self.total = 0
+        self.analyzed = 0
+        self.masks = Counter()
+        self.usage = defaultdict(Counter)
+
+    def add(self, recipe):
+        self.total += 1
+        self.masks[recipe_mask(recipe)] += 1
+        usages = recipe_usages(recipe)
+        if usages is not None:
+            self.analyzed += 1
+            for term, usage in usages.items():
+                self.usage[term][usage] += 1
+
+    def to_document(self, key, run_id):
+        return {
+            "_id": key,
+            "total_recipes": self.total,
+            "analyzed_recipes": self.analyzed,
+            "allergen_counts": {
+                term: sum(count for mask, count in self.masks.items() if mask & bit)
+                for term, bit in ALLERGEN_TERM_BITS.items()
+            },
+            "masks": [{"mask": mask, "count": count} for mask, count in self.masks.items()],
+            "usage": {term: dict(counts) for term, counts in self.usage.items()},
+            "enrichment_version": ENRICHMENT_VERSION,
+            "run_id": run_id,
+            "refreshed_at": datetime.now(timezone.utc),
+        }
+
+def ensure_dish_stats_indexes(collection):
+    collection.create_index([("dish_key", 1)])
+    collection.create_index([("dish_stats_stale", 1)], partialFilterExpression={"dish_stats_stale": True})
+
+def write_batched(collection, operations, batch_size=STATS_BATCH_SIZE):
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+def refresh_all(collection):
+    """Recompute every dish in one pass over the recipes"""
+    stats_collection = collection.database[DISH_STATS_COLLECTION]
+    run_id = uuid.uuid4().hex
+    # Cleared first, so recipes changed during the pass are marked again for the next run
+    collection.update_many({"dish_stats_stale": True}, {"$unset": {"dish_stats_stale": ""}})
+    dishes = defaultdict(DishAccumulator)
+    key_updates = []
+    for recipe in collection.find({}, STATS_FIELDS):
+        key = dish_key(recipe.get("title"))
+        if key:
+            dishes[key].add(recipe)
+        if recipe.get("dish_key") != key:
+            key_updates.append(UpdateOne({"_id": recipe["_id"]}, {"$set": {"dish_key": key}}))
+    write_batched(collection, key_updates)
+
+    write_batched(stats_collection, [
+        ReplaceOne({"_id": key}, dish.to_document(key, run_id), upsert=True) for key, dish in dishes.items()
+    ])
+    removed = stats_collection.delete_many({"run_id": {"$ne": run_id}}).deleted_count
+    return len(dishes), removed
+
+def refresh_stale(collection):
+    """Recompute only the dishes of recipes marked dish_stats_stale"""
+    stats_collection = collection.database[DISH_STATS_COLLECTION]
+    run_id = uuid.uuid4().hex
+    stale = list(collection.find({"dish_stats_stale": True}, {"title": 1, "dish_key": 1}))
+    keys = set()
+    operations = []
+    for recipe in stale:
+        key = dish_key(recipe.get("title"))
+        # A renamed recipe also leaves the dish it used to count towards
+        if recipe.get("dish_key") is not None:
+            keys.add(recipe["dish_key"])
+        keys.add(key)
+        operations.append(UpdateOne(
+            {"_id": recipe["_id"]}, {"$set": {"dish_key": key}, "$unset": {"dish_stats_stale": ""}}
+        ))
+    # Cleared before recomputing, so recipes changed meanwhile are marked again for the next run
+    write_batched(collection, operations)
+
+    keys.discard("")
+    refreshed = 0
+    removed = 0
+    for key in keys:
+        dish = DishAccumulator()
+        for recipe in collection.find({"dish_key": key}, STATS_FIELDS):
+            dish.add(recipe)
+        if dish.total:
+            stats_collection.replace_one({"_id": key}, dish.to_document(key, run_id), upsert=True)
+            refreshed += 1
+        else:
+            removed += stats_collection.delete_one({"_id": key}).deleted_count
+    return refreshed, removed
+
+def refresh_dish_stats(collection, full=False):
+    start_time = time.time()
+    ensure_dish_stats_indexes(collection)
+    if full or collection.database[DISH_STATS_COLLECTION].estimated_document_count() == 0:
+        refreshed, removed = refresh_all(collection)
+    else:
+        refreshed, removed = refresh_stale(collection)
+    print(f"✓ Dish stats: {refreshed} dishes refreshed, {removed} removed in {time.time() - start_time:.1f}s")
+    if refreshed or removed:
+        invalidate_result_caches(collection.database)
+    return refreshed, removed
+
+# --- Lookups for the request handlers ---
+async def find_dish_stats(async_database, dish):
+    """The dish_stats document for a dish name (one _id lookup), or None"""
+    key = dish_key(dish)
+    if not key:
+        return None
+    return await async_database[DISH_STATS_COLLECTION].find_one({"_id": key})
+
+def usable_stats(stats, allergens_lower):
+    return (
+        stats is not None
+        and stats.get("enrichment_version") == ENRICHMENT_VERSION
+        and all(a in ALLERGEN_TERM_BITS for a in allergens_lower)
+    )
+
+def stats_breakdown(stats, user_allergens):
+    """
+    (total, with_any, allergen_counts) like aggregations.allergen_stats, or
+    None when the live computation is needed instead.
+    """
+    allergens_lower = [a.lower() for a in user_allergens]
+    if not usable_stats(stats, allergens_lower):
+        return None
+    bits = 0
+    for allergen in allergens_lower:
+        bits |= ALLERGEN_TERM_BITS[allergen]
+    with_any = sum(entry["count"] for entry in stats["masks"] if entry["mask"] & bits)
+    allergen_counts = {a: 0 for a in allergens_lower}
+    # Listed twice (in any casing) counts twice, as in the live loop
+    for allergen in allergens_lower:
+        allergen_counts[allergen] += stats["allergen_counts"].get(allergen, 0)
+    return stats["total_recipes"], with_any, allergen_counts
+
+def stats_probability(stats, user_allergen):
+    """(probability, usage) for one allergen like probability_from_matches, or None on a miss"""
+    allergen_lower = user_allergen.lower()
+    if not usable_stats(stats, [allergen_lower]) or not stats["total_recipes"]:
+        return None
+    probability = stats["allergen_counts"].get(allergen_lower, 0) / stats["total_recipes"] * 100
+    usage = "central" if probability > 50 else "possible" if probability > 0 else None
+    return probability, usage
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the precomputed dish_stats collection")
+    parser.add_argument("--full", action="store_true", help="Recompute every dish instead of only changed ones")
+    args = parser.parse_args()
+    refresh_dish_stats(recipes_collection, full=args.full)
@@ -0,0 +1,232 @@
+"""
+Continuous fetch -> analyze -> write pipeline for data_refine_gem.
+
+Instead of claim a batch / analyze all of it / write it / repeat, the three
+stages run side by side:
+  fetch    a reader thread keeps a bounded buffer of claimed recipes filled
+  analyze  up to `workers` analysis calls are in flight at any time, each
+           for one recipe or, in packed mode, up to pack_size recipes
+  write    a writer thread flushes finished results once write_batch_size
+           are waiting or flush_interval seconds have passed
+so analysis workers never sit idle while a batch drains or a bulk write runs.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from analysis_queue import claim_batch, completion_operation, has_claimable
+
+# Claimed batches buffered ahead of the analysis workers. Kept small so
+# prefetched recipes are analyzed well within their claim lease.
+PREFETCH_BATCHES = 2
+WRITE_BATCH_SIZE = 50
+# Seconds before a partial write batch is flushed anyway
+FLUSH_INTERVAL = 5.0
+# How long the reader waits before looking again when nothing is claimable
+# but earlier recipes may still come back to the queue
+IDLE_POLL_INTERVAL = 2.0
+
+_DONE = object()
+
+
+class StageStats:
+    """Throughput of one pipeline stage: time spent working vs waiting on its neighbours"""
+
+    def __init__(self, name, waiting_on):
+        self.name = name
+        self.waiting_on = waiting_on
+        self.items = 0
+        self.calls = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.calls += 1
+            self.busy += seconds
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.waiting += seconds
+
+    def summary(self, elapsed):
+        rate = self.items / elapsed if elapsed else 0
+        per_call = self.busy / self.calls if self.calls else 0
+        return (f"  {self.name:<8} {self.items:>7} recipes in {self.calls} calls "
+                f"({rate:.2f} recipes/sec, {per_call:.3f}s per call), "
+                f"{self.waiting:.1f}s waiting on {self.waiting_on}")
+
+
+class EnrichmentPipeline:
+    """
+    Runs process_recipe over every claimable recipe in the collection.
+
+    process_recipe takes a recipe document and returns the result dict that
+    analysis_queue.completion_operation expects. With pack_size > 1,
+    process_pack takes a list of recipes and returns one result per recipe.
+    """
+
+    def __init__(self, collection, process_recipe, workers, claim_size,
+                 write_batch_size=WRITE_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 prefetch_batches=PREFETCH_BATCHES, pack_size=1, process_pack=None):
+        self.collection = collection
+        self.process_pack = process_pack or (lambda recipes: [process_recipe(recipe) for recipe in recipes])
+        self.pack_size = pack_size
+        self.workers = workers
+        self.claim_size = claim_size
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.claimed = queue.Queue(maxsize=claim_size * prefetch_batches)
+        self.finished = queue.Queue()
+        self.slots = threading.Semaphore(workers)
+        self.stats = {
+            "fetch": StageStats("fetch", "a full buffer"),
+            "analyze": StageStats("analyze", "fetch"),
+            "write": StageStats("write", "analyze"),
+        }
+        # Recipes claimed but not written back yet; failed ones may return to the queue
+        self.outstanding = 0
+        # Raised again by run() once the remaining work has been written
+        self.reader_error = None
+        self._lock = threading.Lock()
+        self.start_time = None
+
+    def _read(self):
+        try:
+            while True:
+                with self._lock:
+                    busy = self.outstanding > 0
+                start = time.monotonic()
+                claim_id, batch = claim_batch(self.collection, self.claim_size)
+                self.stats["fetch"].record(len(batch), time.monotonic() - start)
+
+                if not batch:
+                    # Checked before the claim, so results written since then were
+                    # visible to it; only stop once nothing can come back
+                    if not busy and not has_claimable(self.collection):
+                        break
+                    time.sleep(IDLE_POLL_INTERVAL)
+                    continue
+
+                with self._lock:
+                    self.outstanding += len(batch)
+                for recipe in batch:
+                    start = time.monotonic()
+                    self.claimed.put((claim_id, recipe))
+                    self.stats["fetch"].record_wait(time.monotonic() - start)
+        except BaseException as e:
+            self.reader_error = e
+        finally:
+            # Always let the analysis loop finish, or run() would wait forever
+            self.claimed.put(_DONE)
+
+    def _analyze(self, pack):
+        start = time.monotonic()
+        try:
+            results = self.process_pack([recipe for _, recipe in pack])
+        except Exception as e:
+            results = [{"_id": recipe["_id"], "error": str(e)} for _, recipe in pack]
+        finally:
+            self.slots.release()
+        self.stats["analyze"].record(len(pack), time.monotonic() - start)
+        for (claim_id, recipe), result in zip(pack, results):
+            self.finished.put(completion_operation(recipe, claim_id, result))
+
+    def _next_pack(self):
+        """Up to pack_size claimed recipes, waiting only for the first; None once the reader is done"""
+        item = self.claimed.get()
+        if item is _DONE:
+            return None
+        pack = [item]
+        while len(pack) < self.pack_size:
+            try:
+                item = self.claimed.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                # Leave the marker for the next call
+                self.claimed.put(item)
+                break
+            pack.append(item)
+        return pack
+
+    def _flush(self, operations):
+        start = time.monotonic()
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Unwritten recipes keep their claim and are re-claimed once the lease expires
+            print(f"✗ Failed to write {len(operations)} results: {e}")
+        self.stats["write"].record(len(operations), time.monotonic() - start)
+        with self._lock:
+            self.outstanding -= len(operations)
+
+        written = self.stats["write"].items
+        elapsed = time.monotonic() - self.start_time
+        print(f"Wrote {len(operations)} results ({written} total, {written / elapsed if elapsed else 0:.2f} recipes/sec)")
+
+    def _write(self):
+        pending = []
+        last_flush = time.monotonic()
+        done = False
+        while not done:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            start = time.monotonic()
+            try:
+                item = self.finished.get(timeout=timeout)
+                if item is _DONE:
+                    done = True
+                else:
+                    pending.append(item)
+            except queue.Empty:
+                pass
+            self.stats["write"].record_wait(time.monotonic() - start)
+
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if pending and (done or due or len(pending) >= self.write_batch_size):
+                self._flush(pending)
+                pending = []
+                last_flush = time.monotonic()
+            elif due:
+                last_flush = time.monotonic()
+
+    def run(self):
+        """
+        Process until nothing is claimable and every result is written; returns
+        the stage stats. If claiming fails, what was already claimed is still
+        analyzed and written before the error is raised.
+        """
+        self.start_time = time.monotonic()
+        reader = threading.Thread(target=self._read, name="enrichment-reader", daemon=True)
+        writer = threading.Thread(target=self._write, name="enrichment-writer", daemon=True)
+        reader.start()
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                # Wait for a free analysis slot first, then for recipes to fill it
+                self.slots.acquire()
+                start = time.monotonic()
+                pack = self._next_pack()
+                self.stats["analyze"].record_wait(time.monotonic() - start)
+                if pack is None:
+                    self.slots.release()
+                    break
+                executor.submit(self._analyze, pack)
+
+        self.finished.put(_DONE)
+        reader.join()
+        writer.join()
+        self.report()
+        if self.reader_error is not None:
+            raise self.reader_error
+        return self.stats
+
+    def report(self):
+        elapsed = time.monotonic() - self.start_time
+        print(f"\n--- Enrichment pipeline: {self.stats['write'].items} recipes in {elapsed:.1f}s "
+              f"with {self.workers} workers ---")
+        for stage in self.stats.values():
+            print(stage.summary(elapsed))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini generateContent REST API that injects throttling.
+
+It answers POST .../models/<model>:generateContent with a canned JSON
+response after a configurable latency, and with 429 RESOURCE_EXHAUSTED once
+more than --rate requests arrived in the last second or more than
+--max-concurrency are in flight, like the real quota does.
+
+Point the backend at it with
+    python fake_llm_server.py --port 8089 --rate 5
+    GEMINI_API_ENDPOINT=http://localhost:8089 python data_refine_gem.py
+or start it in-process with start_fake_server() (see bench_rate_limiter.py).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = {"normalized_ingredients": [], "ingredient_analysis": {}, "allergens": {}}
+
+
+class FakeLLMState:
+    def __init__(self, rate, max_concurrency, latency, jitter, responder):
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.latency = latency
+        self.jitter = jitter
+        self.responder = responder
+        self.recent = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Count the request; False if it should be throttled"""
+        with self.lock:
+            now = time.monotonic()
+            self.requests += 1
+            while self.recent and now - self.recent[0] > 1.0:
+                self.recent.popleft()
+            if len(self.recent) >= self.rate or self.in_flight >= self.max_concurrency:
+                self.throttled += 1
+                return False
+            self.recent.append(now)
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled}
+
+
+def prompt_text(body):
+    return "".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.split("?")[0].endswith(":generateContent"):
+                return self.reply(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            if not state.admit():
+                return self.reply(429, {"error": {
+                    "code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                    "status": "RESOURCE_EXHAUSTED",
+                }})
+            try:
+                time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+                text = json.dumps(state.responder(prompt_text(body)))
+            finally:
+                state.release()
+            self.reply(200, {"candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }]})
+
+        def reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_server(port=0, rate=10, max_concurrency=8, latency=0.2, jitter=0.05, responder=None):
+    """Serve in a background thread; returns (server, base_url, state). Stop with server.shutdown()."""
+    state = FakeLLMState(rate, max_concurrency, latency, jitter, responder or (lambda prompt: DEFAULT_RESPONSE))
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini endpoint with injected throttling")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rate", type=float, default=10, help="Requests per second before answering 429")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="In-flight requests before answering 429")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per successful response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random +/- seconds added to the latency")
+    args = parser.parse_args()
+
+    server, url, state = start_fake_server(args.port, args.rate, args.max_concurrency, args.latency, args.jitter)
+    print(f"Fake LLM server listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            print(state.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
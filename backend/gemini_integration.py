@@ -1,11 +1,105 @@
+import copy
 import os
 import json
-import google.generativeai as genai
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from rate_limiter import gemini_limiter, call_with_retries
+from result_cache import ResultCache
+
+# Optional base URL for the Gemini REST API, e.g. http://localhost:8089 for fake_llm_server.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+def genai_sdk():
+    """
+    The Gemini SDK, imported on first use: it is slow to import and the API
+    only needs it once a request actually falls back to the LLM.
+    """
+    import google.generativeai as genai
+    return genai
+
+def configure_gemini(api_key):
+    """Configure the Gemini SDK, against GEMINI_API_ENDPOINT when it is set"""
+    genai = genai_sdk()
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+
+# Parsed dish analyses, keyed on the canonical (dish, ingredients, allergens) request
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+dish_analysis_cache = ResultCache("gemini_dish_analysis", ttl=GEMINI_CACHE_TTL)
+
+# The model is built once per process; the API key is read on first use
+_model = None
+_model_lock = threading.Lock()
+
+# Single-flight: identical requests in progress share one API call
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {"requests": 0, "api_calls": 0, "coalesced": 0, "errors": 0}
+# Latencies of recent API calls, for percentiles
+_latencies = deque(maxlen=1000)
+
+def get_dish_model():
+    """The long-lived dish analysis model (configured on first call)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise ValueError("GOOGLE_API_KEY environment variable not set.")
+                configure_gemini(api_key)
+                # JSON mode for reliable, machine-readable output; the low temperature
+                # makes the output more deterministic and less "creative".
+                # Using gemini-1.5-flash for its speed and cost-effectiveness.
+                _model = genai_sdk().GenerativeModel(
+                    model_name="gemini-1.5-flash",
+                    generation_config={
+                        "temperature": 0.1,
+                        "response_mime_type": "application/json",
+                    },
+                )
+    return _model
+
+def dish_request_key(dish_name, ingredients, allergens):
+    """Canonical cache key: case, whitespace, order and duplicates don't matter"""
+    def canonical(values):
+        return sorted({v.strip().lower() for v in values or [] if v.strip()})
+    return [dish_name.strip().lower(), canonical(ingredients), canonical(allergens)]
+
+def _count(metric, amount=1):
+    with _metrics_lock:
+        _metrics[metric] += amount
+
+def gemini_metrics():
+    """Request, coalescing and latency counters plus the response cache stats"""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+        latencies = sorted(_latencies)
+    if latencies:
+        metrics.update({
+            "latency_avg": round(sum(latencies) / len(latencies), 3),
+            "latency_p50": round(latencies[len(latencies) // 2], 3),
+            "latency_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        })
+    metrics["cache"] = dish_analysis_cache.stats()
+    metrics["limiter"] = gemini_limiter.stats()
+    return metrics
 
 def analyze_dish_with_gemini(dish_name, ingredients, allergens, current_conclusion):
     """
     Calls the Gemini API to analyze a dish for allergens using a structured prompt.
 
+    Parsed responses are cached for GEMINI_CACHE_TTL seconds, and concurrent
+    identical requests wait for the one call already in flight. The key is
+    (dish, ingredients, allergens); current_conclusion is derived from those
+    same inputs, so it isn't part of it.
+
     Args:
         dish_name (str): The name of the dish.
         ingredients (list): A list of main ingredients.
@@ -15,15 +109,41 @@ def analyze_dish_with_gemini(dish_name, ingredients, allergens, current_conclusi
     Returns:
         dict: The parsed JSON response from the Gemini API, or None if an error occurs.
     """
+    _count("requests")
+    key = dish_request_key(dish_name, ingredients, allergens)
+    cached = dish_analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    flight_key = json.dumps(key)
+    with _in_flight_lock:
+        future = _in_flight.get(flight_key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _in_flight[flight_key] = future
+    if not leader:
+        _count("coalesced")
+        return copy.deepcopy(future.result())
+
+    result = None
     try:
-        # --- 1. CONFIGURE THE API KEY ---
-        # It's best practice to use an environment variable for your API key.
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set.")
-        genai.configure(api_key=api_key)
+        result = _call_gemini(dish_name, ingredients, allergens, current_conclusion)
+        if result is not None:
+            dish_analysis_cache.set(key, result)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[flight_key]
+        # Waiters copy from a snapshot, so the leader's caller can't mutate what they get
+        future.set_result(copy.deepcopy(result))
+    return result
 
-        # --- 2. DEFINE THE MODEL AND PROMPT ---
+def _call_gemini(dish_name, ingredients, allergens, current_conclusion):
+    try:
+        # --- 1. GET THE LONG-LIVED MODEL ---
+        model = get_dish_model()
+
+        # --- 2. DEFINE THE PROMPT ---
         # This prompt is taken directly from your 'idea_evaluation.md' file.
         # It is highly structured to ensure a reliable JSON output.
         prompt_template = f"""
@@ -58,28 +178,21 @@ def analyze_dish_with_gemini(dish_name, ingredients, allergens, current_conclusi
         }}
         """
 
-        # --- 3. SET UP GENERATION CONFIGURATION ---
-        # We are enabling JSON mode for reliable, machine-readable output.
-        # The low temperature makes the output more deterministic and less "creative".
-        generation_config = {
-            "temperature": 0.1,
-            "response_mime_type": "application/json",
-        }
-
-        # --- 4. INITIALIZE THE MODEL AND MAKE THE API CALL ---
-        # Using gemini-1.5-flash for its speed and cost-effectiveness.
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config
-        )
-        response = model.generate_content(prompt_template)
-
-        # --- 5. PARSE AND RETURN THE RESPONSE ---
+        # --- 3. MAKE THE API CALL ---
+        # Shared rate limit and concurrency window, with jittered retries on throttling
+        start = time.perf_counter()
+        response = call_with_retries(lambda: model.generate_content(prompt_template), gemini_limiter, max_retries=2)
+        with _metrics_lock:
+            _metrics["api_calls"] += 1
+            _latencies.append(time.perf_counter() - start)
+
+        # --- 4. PARSE AND RETURN THE RESPONSE ---
         # The response text will be a JSON string, which we parse into a Python dict.
         print("Gemini API response:", response.text)  # Debugging line
         return json.loads(response.text)
 
     except Exception as e:
+        _count("errors")
         print(f"An error occurred: {e}")
         return None
 
@@ -0,0 +1,125 @@
+"""
+Content-addressed cache of LLM analyses per ingredient line.
+
+Lines like "1 cup all-purpose flour" or "2 large eggs" repeat across
+thousands of recipes, so data_refine_gem analyzes each distinct line once.
+A line is normalized (lowercase, collapsed whitespace, trailing punctuation
+stripped) and hashed together with LINE_CACHE_VERSION; the entry keeps the
+line's normalized terms and its usage/reason. A recipe's result is assembled
+from the entries of its lines, and only lines nobody has analyzed yet are
+sent to the model.
+
+Entries live in the ingredient_line_cache collection, so every enrichment
+worker shares them. Bump LINE_CACHE_VERSION when the line prompt changes.
+"""
+import hashlib
+import re
+import threading
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+
+LINE_CACHE_COLLECTION = "ingredient_line_cache"
+LINE_CACHE_VERSION = "v1"
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_line(line):
+    return WHITESPACE_RE.sub(" ", line.lower()).strip().rstrip(".,;:")
+
+
+def line_key(line):
+    return hashlib.sha1(f"{LINE_CACHE_VERSION}:{normalize_line(line)}".encode()).hexdigest()
+
+
+def assemble_analysis(ingredients, entries):
+    """
+    Build one recipe's stored analysis from per-line entries.
+
+    entries maps line_key -> {"normalized_ingredients", "usage", "reason"};
+    returns None if any line has no entry.
+    """
+    normalized = []
+    analysis = {}
+    for ingredient in ingredients:
+        entry = entries.get(line_key(ingredient))
+        if entry is None:
+            return None
+        normalized.extend(entry["normalized_ingredients"])
+        analysis[ingredient] = {"usage": entry["usage"], "reason": entry["reason"]}
+    return {"normalized_ingredients": list(dict.fromkeys(normalized)), "ingredient_analysis": analysis}
+
+
+class IngredientLineCache:
+    def __init__(self, collection):
+        self.collection = collection
+        self._lock = threading.Lock()
+        self.lines = 0
+        self.hits = 0
+        self.analyzed = 0
+        self.recipes = 0
+        self.recipes_from_cache = 0
+        self.model_calls = 0
+        self.saved_calls = 0
+
+    def lookup(self, lines):
+        """Cached entries for the given lines, keyed by line_key"""
+        keys = list({line_key(line) for line in lines})
+        found = {doc["_id"]: doc for doc in self.collection.find({"_id": {"$in": keys}})}
+        with self._lock:
+            self.lines += len(keys)
+            self.hits += len(found)
+        return found
+
+    def store(self, entries):
+        """Save {line: entry} for newly analyzed lines; concurrent workers may store the same line"""
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"_id": line_key(line)},
+                {"$setOnInsert": {
+                    "line": normalize_line(line),
+                    "normalized_ingredients": entry["normalized_ingredients"],
+                    "usage": entry["usage"],
+                    "reason": entry["reason"],
+                    "created_at": now,
+                }},
+                upsert=True,
+            )
+            for line, entry in entries.items()
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        with self._lock:
+            self.analyzed += len(operations)
+
+    def record(self, recipes, from_cache, called_model):
+        """Count one analysis unit (a recipe, or a pack of them) and whether it needed the model"""
+        with self._lock:
+            self.recipes += recipes
+            self.recipes_from_cache += from_cache
+            if called_model:
+                self.model_calls += 1
+            else:
+                self.saved_calls += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "distinct_lines_looked_up": self.lines,
+                "line_hits": self.hits,
+                "line_hit_ratio": round(self.hits / self.lines, 4) if self.lines else 0.0,
+                "lines_analyzed": self.analyzed,
+                "recipes": self.recipes,
+                "recipes_served_from_cache": self.recipes_from_cache,
+                "model_calls": self.model_calls,
+                "saved_calls": self.saved_calls,
+            }
+
+    def report(self):
+        stats = self.stats()
+        print("\n--- Ingredient line cache ---")
+        print(f"  {stats['line_hits']}/{stats['distinct_lines_looked_up']} line lookups hit "
+              f"({stats['line_hit_ratio']:.1%}), {stats['lines_analyzed']} new lines analyzed")
+        print(f"  {stats['recipes_served_from_cache']}/{stats['recipes']} recipes served entirely from the cache, "
+              f"{stats['model_calls']} model calls ({stats['saved_calls']} saved)")
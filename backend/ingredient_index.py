@@ -0,0 +1,157 @@
+"""
+In-memory inverted index from ingredient tokens to recipes.
+
+Answering "how many of these recipes contain allergen Y" used to mean pulling
+every recipe and substring-scanning its joined ingredient text. The index maps
+each ingredient token to a sorted array of recipe positions, so an allergen
+query is a union of a few posting lists intersected with the candidate set.
+
+A recipe's tokens come from the words of its `normalized_ingredients` (the
+LLM normalization from data_refine_gem, which already adds parent categories
+like "dairy") when it has them, and from its raw ingredient words otherwise.
+Matching is per word: "buttermilk" does not contain the token "milk" unless
+the normalization listed it, which is what the normalized terms are for.
+"""
+import threading
+import time
+import numpy as np
+from db import recipes_collection
+from ingredient_mappings import ALLERGEN_CATEGORIES
+from recipe_enrichment import ingredients_text, tokenize_ingredients, tokenize_title
+
+# How long (in seconds) the index may serve results before it is rebuilt
+REFRESH_INTERVAL = 600
+
+INDEX_FIELDS = {"normalized_ingredients": 1, "ingredient_tokens": 1, "ingredients": 1}
+
+
+def recipe_tokens(recipe):
+    """The words a recipe is indexed under"""
+    normalized = recipe.get("normalized_ingredients")
+    if isinstance(normalized, list) and normalized:
+        return tokenize_ingredients(" ".join(n for n in normalized if isinstance(n, str)).lower())
+    if isinstance(recipe.get("ingredient_tokens"), list):
+        return recipe["ingredient_tokens"]
+    return tokenize_ingredients(ingredients_text(recipe.get("ingredients") or []))
+
+
+def allergen_terms(allergen_lower):
+    """The allergen itself plus the ingredients of its category, as lists of words"""
+    terms = [allergen_lower, *ALLERGEN_CATEGORIES.get(allergen_lower, [])]
+    return [words for words in (tokenize_title(term) for term in terms) if words]
+
+
+class IngredientIndex:
+    """Posting lists of recipe positions per ingredient token."""
+
+    def __init__(self, collection, refresh_interval=REFRESH_INTERVAL):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        # (ids, positions, postings, allergen cache), swapped as a whole on every build
+        self._state = ([], {}, {}, {})
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def build(self, blocking=True, force=True):
+        """
+        Read every recipe's tokens and replace the index.
+
+        With force=False, does nothing if the index was built while waiting
+        for the lock, so concurrent first requests scan the collection once.
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return  # another request is already rebuilding; keep serving the old index
+        try:
+            if not force and self.is_built:
+                return
+            start_time = time.time()
+            ids = []
+            lists = {}
+            # Imported here, the snapshot module itself imports recipe_tokens from this one
+            from recipe_snapshot import recipe_snapshot, SNAPSHOT_MODE
+            snapshot = recipe_snapshot.current if SNAPSHOT_MODE else None
+            if snapshot is not None:
+                # The snapshot already holds every recipe's tokens, no need to read the collection
+                for position in range(len(snapshot)):
+                    ids.append(snapshot.ids[position])
+                    for token in snapshot.tokens(position):
+                        lists.setdefault(token, []).append(position)
+            else:
+                for recipe in self.collection.find({}, INDEX_FIELDS):
+                    position = len(ids)
+                    ids.append(recipe["_id"])
+                    for token in recipe_tokens(recipe):
+                        lists.setdefault(token, []).append(position)
+            # Positions are appended in order, so every posting list is already sorted
+            postings = {token: np.array(positions, dtype=np.uint32) for token, positions in lists.items()}
+            self._state = (ids, {_id: position for position, _id in enumerate(ids)}, postings, {})
+            self._built_at = time.time()
+            size = sum(array.nbytes for array in postings.values())
+            print(f"Ingredient index built with {len(ids)} recipes, {len(postings)} tokens, "
+                  f"{size / 1024:.0f} KiB of postings in {time.time() - start_time:.1f}s")
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """Rebuild the index; counts keep using the current postings until the new ones are swapped in"""
+        try:
+            self.build(blocking=False)
+        except Exception as e:
+            print(f"Ingredient index refresh failed, serving the previous postings: {e}")
+
+    def ensure_fresh(self):
+        """
+        Build on first use. Once the index is older than the interval, rebuild
+        it on a background thread; requests keep counting with the current one.
+        """
+        if not self.is_built:
+            self.build(force=False)
+        elif time.time() - self._built_at > self.refresh_interval and not self._lock.locked():
+            threading.Thread(target=self.refresh, name="ingredient-index-refresh", daemon=True).start()
+
+    def allergen_positions(self, allergen, state=None):
+        """Sorted positions of recipes containing the allergen or an ingredient of its category"""
+        _, _, postings, cache = state or self._state
+        allergen_lower = allergen.lower()
+        if allergen_lower not in cache:
+            empty = np.empty(0, dtype=np.uint32)
+            matches = []
+            for words in allergen_terms(allergen_lower):
+                positions = postings.get(words[0], empty)
+                for word in words[1:]:
+                    positions = np.intersect1d(positions, postings.get(word, empty), assume_unique=True)
+                matches.append(positions)
+            cache[allergen_lower] = np.unique(np.concatenate(matches)) if matches else empty
+        return cache[allergen_lower]
+
+    def count(self, recipe_ids, user_allergens):
+        """
+        Count recipes among recipe_ids containing each allergen.
+
+        Returns (total, with_any, allergen_counts) like aggregations.allergen_stats;
+        ids the index doesn't know (yet) are left out of total.
+        """
+        self.ensure_fresh()
+        state = self._state
+        positions = state[1]
+        candidates = np.unique(np.array(
+            [positions[_id] for _id in recipe_ids if _id in positions], dtype=np.uint32
+        ))
+        allergen_counts = {a.lower(): 0 for a in user_allergens}
+        any_hit = np.zeros(len(candidates), dtype=bool)
+        for allergen in user_allergens:
+            hits = np.isin(candidates, self.allergen_positions(allergen, state), assume_unique=True)
+            # Listed twice (in any casing) counts twice, as in /detect
+            allergen_counts[allergen.lower()] += int(hits.sum())
+            any_hit |= hits
+        return len(candidates), int(any_hit.sum()), allergen_counts
+
+
+ingredient_index = IngredientIndex(recipes_collection)
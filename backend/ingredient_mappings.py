@@ -1,5 +1,8 @@
 # Comprehensive ingredient mapping for allergen detection
 # Maps complex ingredients, sauces, and preparations to their base components
+import re
+from bisect import bisect_right
+from functools import lru_cache
 
 INGREDIENT_MAPPINGS = {
     # Tomato-based items
@@ -137,23 +140,111 @@ ALLERGEN_CATEGORIES = {
     'tomatoes': ['tomatoes', 'tomato']
 }
 
+# Every category name and term, each with its own bit in a recipe's allergen mask.
+# Mongo stores signed 64-bit ints, so anything past 63 terms has no bit and is
+# checked against the ingredient text instead.
+ALLERGEN_TERMS = list(dict.fromkeys(
+    term for category, terms in ALLERGEN_CATEGORIES.items() for term in [category, *terms]
+))
+ALLERGEN_TERM_BITS = {term: 1 << index for index, term in enumerate(ALLERGEN_TERMS[:63])}
+
+class SubstringMatcher:
+    """
+    Answers "which terms occur in this text" and "which terms contain this text"
+    for a fixed term list, each with a single scan instead of a loop over terms.
+    """
+
+    # Joins terms into one searchable blob; never appears in a stripped ingredient
+    SEPARATOR = "\x00"
+
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(terms))
+        # Longest first, so the lookahead reports the longest term starting at each position
+        by_length = sorted(self.terms, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(t) for t in by_length) + "))")
+        # Every term that starts where a longer term starts is one of its prefixes
+        self._prefixes = {t: [p for p in self.terms if t.startswith(p)] for t in self.terms}
+        self._blob = self.SEPARATOR.join(self.terms)
+        self._starts = []
+        offset = 0
+        for term in self.terms:
+            self._starts.append(offset)
+            offset += len(term) + len(self.SEPARATOR)
+
+    def contained_in(self, text):
+        """Terms that are substrings of text"""
+        found = set()
+        for m in self._pattern.finditer(text):
+            found.update(self._prefixes[m.group(1)])
+        return found
+
+    def containing(self, text):
+        """Terms that have text as a substring"""
+        if self.SEPARATOR in text:
+            return {t for t in self.terms if text in t}
+        found = set()
+        position = self._blob.find(text)
+        while position != -1:
+            index = bisect_right(self._starts, position) - 1
+            found.add(self.terms[index])
+            # Jump to the next term, each term only needs to be reported once
+            if index + 1 == len(self._starts):
+                break
+            position = self._blob.find(text, self._starts[index + 1])
+        return found
+
+    def related(self, text):
+        """Terms that are a substring of text or have text as a substring"""
+        return self.contained_in(text) | self.containing(text)
+
+
+# Compiled once at import time and shared by every request
+_MAPPING_MATCHER = SubstringMatcher(INGREDIENT_MAPPINGS)
+_MAPPING_ORDER = {key: index for index, key in enumerate(INGREDIENT_MAPPINGS)}
+_CATEGORY_MATCHER = SubstringMatcher(
+    term for terms in ALLERGEN_CATEGORIES.values() for term in terms
+)
+_TERM_CATEGORIES = {}
+for _category, _terms in ALLERGEN_CATEGORIES.items():
+    for _term in _terms:
+        _TERM_CATEGORIES.setdefault(_term, set()).add(_category)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_lowered(ingredient_lower):
+    if ingredient_lower in INGREDIENT_MAPPINGS:
+        return INGREDIENT_MAPPINGS[ingredient_lower]
+
+    # The first mapping (in definition order) that overlaps the ingredient wins
+    related = _MAPPING_MATCHER.related(ingredient_lower)
+    if related:
+        return INGREDIENT_MAPPINGS[min(related, key=_MAPPING_ORDER.__getitem__)]
+
+    return None
+
+
+@lru_cache(maxsize=4096)
+def allergen_categories_for(norm_ingredient):
+    """
+    Allergen categories whose terms overlap a normalized ingredient
+    """
+    categories = set()
+    for term in _CATEGORY_MATCHER.related(norm_ingredient):
+        categories.update(_TERM_CATEGORIES[term])
+    return frozenset(categories)
+
+
 def normalize_ingredient(ingredient):
     """
     Normalize an ingredient to its base components
     """
     ingredient_lower = ingredient.lower().strip()
-    
-    # Direct mapping
-    if ingredient_lower in INGREDIENT_MAPPINGS:
-        return INGREDIENT_MAPPINGS[ingredient_lower]
-    
-    # Partial matching for complex ingredient names
-    for mapped_ingredient, base_ingredients in INGREDIENT_MAPPINGS.items():
-        if mapped_ingredient in ingredient_lower or ingredient_lower in mapped_ingredient:
-            return base_ingredients
-    
+    base_ingredients = _normalize_lowered(ingredient_lower)
+
     # If no mapping found, return the original ingredient
-    return [ingredient_lower]
+    if base_ingredients is None:
+        return [ingredient_lower]
+    return base_ingredients
 
 def get_allergen_matches(ingredients, user_allergens):
     """
@@ -166,26 +257,22 @@ def get_allergen_matches(ingredients, user_allergens):
         normalized = normalize_ingredient(ingredient)
         all_normalized.extend(normalized)
     
+    # Category hits are computed once per ingredient, not once per allergen
+    categorized = [(norm, allergen_categories_for(norm)) for norm in all_normalized]
+    
     # Check for allergen matches
     allergen_matches = {}
     
     for user_allergen in user_allergens:
         user_allergen_lower = user_allergen.lower()
-        matches = []
-        
-        # Direct matches
-        for norm_ingredient in all_normalized:
-            if user_allergen_lower in norm_ingredient or norm_ingredient in user_allergen_lower:
-                matches.append(norm_ingredient)
+        matches = set()
         
-        # Category-based matching
-        if user_allergen_lower in ALLERGEN_CATEGORIES:
-            category_ingredients = ALLERGEN_CATEGORIES[user_allergen_lower]
-            for category_ingredient in category_ingredients:
-                for norm_ingredient in all_normalized:
-                    if category_ingredient in norm_ingredient or norm_ingredient in category_ingredient:
-                        matches.append(norm_ingredient)
+        for norm_ingredient, categories in categorized:
+            # Direct matches and category-based matching
+            if (user_allergen_lower in norm_ingredient or norm_ingredient in user_allergen_lower
+                    or user_allergen_lower in categories):
+                matches.add(norm_ingredient)
         
-        allergen_matches[user_allergen] = list(set(matches))  # Remove duplicates
+        allergen_matches[user_allergen] = list(matches)
     
     return allergen_matches, all_normalized
@@ -0,0 +1,79 @@
+"""
+Batched main-ingredient scoring for /api/match.
+
+A main ingredient is "detected" in a recipe when any of the recipe's
+ingredients matches it by one of three rules (kept from the original loop):
+  1. the whole-word pattern r'\\b' + re.escape(main) + r'\\b' finds it
+  2. for mains of 4+ characters, one is a whitespace token of the other
+  3. fuzz.ratio(main, ingredient) >= ingredient_threshold
+
+Instead of a Python triple loop, rule 3 is evaluated for every main x
+ingredient pair of every candidate recipe in one rapidfuzz cdist call, rules 1
+and 2 are applied through lookups, and per-recipe hits are reduced with NumPy.
+"""
+import re
+import numpy as np
+from rapidfuzz import fuzz, process
+
+def main_ingredient_scores(main_ingredients_lower, recipes_ingredients, ingredient_threshold):
+    """
+    ing_score for each recipe: the percentage of main ingredients detected.
+
+    recipes_ingredients holds one list of lowercased ingredient strings per
+    recipe. Recipes without ingredients (or calls without main ingredients)
+    score 0, exactly like the original loop.
+    """
+    scores = [0] * len(recipes_ingredients)
+    flat = [ri for ingredients in recipes_ingredients for ri in ingredients]
+    if not main_ingredients_lower or not flat:
+        return scores
+
+    # Rule 3: one similarity matrix for all pairs; cutoff values are clamped to
+    # what rapidfuzz accepts, the comparison below uses the real threshold
+    similarity = process.cdist(
+        main_ingredients_lower,
+        flat,
+        scorer=fuzz.ratio,
+        processor=None,
+        score_cutoff=min(max(ingredient_threshold, 0), 100),
+        dtype=np.float64,
+        workers=-1,
+    )
+    found = similarity >= ingredient_threshold
+
+    # Rule 2: token membership in either direction, via dictionaries
+    long_mains = {}
+    for row, mi in enumerate(main_ingredients_lower):
+        if len(mi) >= 4:
+            long_mains.setdefault(mi, []).append(row)
+    if long_mains:
+        columns_by_text = {}
+        for column, ri in enumerate(flat):
+            columns_by_text.setdefault(ri, []).append(column)
+            for token in set(ri.split()):
+                for row in long_mains.get(token, ()):
+                    found[row, column] = True
+        for mi, rows in long_mains.items():
+            for token in set(mi.split()):
+                for column in columns_by_text.get(token, ()):
+                    found[rows, column] = True
+
+    # Rule 1: the pattern's escaped backslashes only match text that contains
+    # a literal backslash, so only those ingredients need the regex at all
+    backslash_columns = [column for column, ri in enumerate(flat) if "\\" in ri]
+    if backslash_columns:
+        for row, mi in enumerate(main_ingredients_lower):
+            pattern = re.compile(r'\\b' + re.escape(mi) + r'\\b')
+            for column in backslash_columns:
+                if pattern.search(flat[column]):
+                    found[row, column] = True
+
+    # Any hit within a recipe's columns detects that main ingredient
+    lengths = np.array([len(ingredients) for ingredients in recipes_ingredients])
+    non_empty = np.flatnonzero(lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+    detected = np.logical_or.reduceat(found, starts, axis=1).sum(axis=0)
+
+    for recipe, detected_main in zip(non_empty, detected):
+        scores[recipe] = (int(detected_main) / len(main_ingredients_lower)) * 100
+    return scores
@@ -1,7 +1,50 @@
+import signal
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routes import recipes
+from title_index import title_index
+from recipe_snapshot import recipe_snapshot, SNAPSHOT_MODE
+from db import close_clients
 
-app = FastAPI(title="Allergen Alert API")
+def build_title_index():
+    # Build once up front so the first /match request doesn't pay for it
+    # (with a snapshot loaded, this only switches the index to its titles)
+    try:
+        title_index.ensure_fresh()
+    except Exception as e:
+        print(f"Title index build failed, will retry on first use: {e}")
+
+def load_recipe_snapshot():
+    if not SNAPSHOT_MODE:
+        return
+    try:
+        recipe_snapshot.load_or_build()
+    except Exception as e:
+        print(f"Recipe snapshot load failed, serving from Mongo: {e}")
+
+def warm_up():
+    # With a snapshot loaded, the title index switches to its titles instead of scanning Mongo
+    load_recipe_snapshot()
+    build_title_index()
+
+@asynccontextmanager
+async def lifespan(app):
+    if SNAPSHOT_MODE:
+        title_index.follow(recipe_snapshot)
+        # `kill -HUP <pid>` re-checks the snapshot file (or rebuilds the in-memory copy) in the background.
+        # Signal handlers can only be installed from the main thread (not e.g. under a test client).
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=recipe_snapshot.refresh, daemon=True).start())
+    # Serve right away; requests arriving before the warm-up finishes wait for the
+    # title index build (it only runs once) and use Mongo until the snapshot is loaded
+    app.state.warm_up = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    app.state.warm_up.start()
+    yield
+    # The clients themselves are created on first use (see db.LazyProxy)
+    await close_clients()
+
+app = FastAPI(title="Allergen Alert API", lifespan=lifespan)
 
 app.include_router(recipes.router, prefix="/api")
 
@@ -7,3 +7,16 @@ class Recipe(BaseModel):
     instructions: Optional[str] = ""
     picture_link: Optional[str] = None
     detected_allergens: List[str] = []
+
+class RecipeFields(BaseModel):
+    """A recipe in a /search page; only the requested fields are present"""
+    title: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    instructions: Optional[str] = None
+    picture_link: Optional[str] = None
+    detected_allergens: Optional[List[str]] = None
+
+class RecipePage(BaseModel):
+    recipes: List[RecipeFields]
+    next_cursor: Optional[str] = None
+    total_estimate: int
@@ -0,0 +1,27 @@
+"""
+Opaque cursors for _id-ordered pagination.
+
+The cursor is the last _id of a page, serialized with BSON extended JSON so
+string and ObjectId ids both round-trip, then base64 encoded for URLs.
+"""
+import base64
+from bson import json_util
+from bson.errors import BSONError
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json_util.dumps(last_id).encode()).decode()
+
+def decode_cursor(cursor):
+    """Return the _id a cursor points at, or raise ValueError if it is malformed"""
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    # Base64, UTF-8 and JSON errors are ValueErrors; a bad extended JSON value like
+    # {"$oid": "zz"} can also raise InvalidId, TypeError or decimal.InvalidOperation
+    except (ValueError, TypeError, ArithmeticError, BSONError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def after_cursor(query, cursor):
+    """Restrict a query to documents past the cursor"""
+    if cursor is None:
+        return query
+    return {"$and": [query, {"_id": {"$gt": decode_cursor(cursor)}}]}
@@ -0,0 +1,216 @@
+"""
+Shared rate limiting and adaptive concurrency for Gemini calls.
+
+Every LLM call goes through gemini_limiter.slot(), which
+  1. waits until fewer than `limit` calls are in flight (the concurrency window)
+  2. takes a token from a token bucket refilled at LLM_RATE_LIMIT requests/sec
+Both follow AIMD: the window grows by about one slot per window of successful
+calls and the rate by about 1 req/sec per second of successes, up to their
+configured maximums, and both halve (at most once per cooldown) when the API
+throttles us, overloads or answers slower than LLM_LATENCY_TARGET. call_with_retries() adds
+full-jitter exponential backoff, so throttled workers don't all retry at once.
+
+data_refine_gem and gemini_integration share the module-level gemini_limiter,
+so one process never exceeds the configured budget whichever path it runs.
+"""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MIN_RATE = float(os.getenv("LLM_MIN_RATE", "0.5"))
+# Seconds; slower answers count as congestion. 0 disables the latency signal.
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "30"))
+
+# Exception class names the Google client raises for throttling and overload
+THROTTLE_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+OVERLOAD_ERRORS = {"ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "TimeoutError"}
+
+
+def error_code(error):
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return getattr(code, "value", code)
+
+
+def is_throttle_error(error):
+    return error_code(error) == 429 or type(error).__name__ in THROTTLE_ERRORS or "429" in str(error)
+
+
+def is_overload_error(error):
+    """Errors that mean "send less": throttling, 5xx responses and timeouts (not bad output)"""
+    if is_throttle_error(error):
+        return True
+    code = error_code(error)
+    return (isinstance(code, int) and code >= 500) or type(error).__name__ in OVERLOAD_ERRORS
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket plus a concurrency window, both adjusted by AIMD.
+
+    Use `with limiter.slot(): ...` around each call; the outcome of the block
+    (its latency, or the exception it raised) drives the window.
+    """
+
+    def __init__(self, rate=LLM_RATE_LIMIT, max_concurrency=LLM_MAX_CONCURRENCY,
+                 min_concurrency=LLM_MIN_CONCURRENCY, latency_target=LLM_LATENCY_TARGET,
+                 decrease_factor=0.5, cooldown=2.0, min_rate=LLM_MIN_RATE):
+        self.bucket = TokenBucket(rate)
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.calls = 0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+        self.decreases = 0
+        self.lowest_limit = self.limit
+        self.latency_total = 0.0
+        self.queue_wait = 0.0
+
+    @contextmanager
+    def slot(self):
+        start = time.monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            self.bucket.acquire()
+            call_start = time.monotonic()
+            with self._cond:
+                self.calls += 1
+                self.queue_wait += call_start - start
+            try:
+                yield
+            except Exception as e:
+                self._on_error(e)
+                raise
+            self._on_success(time.monotonic() - call_start)
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def _on_success(self, latency):
+        with self._cond:
+            self.successes += 1
+            self.latency_total += latency
+            if self.latency_target and latency > self.latency_target:
+                self._decrease()
+            else:
+                # Additive increase: about +1 slot per window of successful calls
+                # and +1 req/sec per second's worth of them
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + 1 / self.bucket.rate)
+            self._cond.notify_all()
+
+    def _on_error(self, error):
+        with self._cond:
+            self.errors += 1
+            if is_throttle_error(error):
+                self.throttled += 1
+            if is_overload_error(error):
+                self._decrease()
+
+    def _decrease(self):
+        # A burst of failures from one overloaded moment only counts once
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease_factor)
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.decreases += 1
+
+    def record_retry(self):
+        with self._cond:
+            self.retries += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "calls": self.calls,
+                "successes": self.successes,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "concurrency_limit": round(self.limit, 2),
+                "lowest_concurrency_limit": round(self.lowest_limit, 2),
+                "rate": round(self.bucket.rate, 2),
+                "decreases": self.decreases,
+                "avg_latency": round(self.latency_total / self.successes, 3) if self.successes else 0.0,
+                "avg_queue_wait": round(self.queue_wait / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """Full jitter: uniform in [0, min(max_delay, base_delay * 2**attempt)]"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def call_with_retries(fn, limiter, max_retries=3, base_delay=2.0, max_delay=60.0):
+    """
+    Call fn() inside a limiter slot, retrying failures with jittered backoff.
+
+    Raises the last exception once max_retries attempts have failed.
+    """
+    for attempt in range(max_retries):
+        try:
+            with limiter.slot():
+                return fn()
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            limiter.record_retry()
+            print(f"Attempt {attempt + 1}/{max_retries} failed: {e}. Retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
+
+
+gemini_limiter = AdaptiveLimiter()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Precomputed allergen data stored alongside each recipe.
+
+Every recipe gets an `allergen_mask` with one bit per entry of ALLERGEN_TERMS
+(set when the term appears in the lowercased ingredient text) and a sorted
+`ingredient_tokens` list. Routes test bits instead of re-joining and scanning
+the ingredient list on every request, and Mongo can count on the mask
+server-side. `title_lower` and `title_tokens` back the indexed title search in
+title_search.py, and `ingredients_hash` tells data_refine_gem which recipes
+changed since their ingredient analysis. Run this module directly to backfill existing recipes.
+"""
+import hashlib
+import json
+import re
+import zlib
+from pymongo import UpdateOne
+from db import recipes_collection
+from ingredient_mappings import ALLERGEN_TERMS, ALLERGEN_TERM_BITS
+from result_cache import invalidate_result_caches
+
+# Changes whenever the term list does, so stale masks are never trusted
+ENRICHMENT_VERSION = zlib.crc32("\n".join(["v3", *ALLERGEN_TERMS]).encode())
+
+BACKFILL_BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r"[^\W\d_]+")
+
+def ingredients_text(ingredients):
+    """The lowercased text allergen substring checks run against"""
+    return " ".join(i for i in ingredients if isinstance(i, str)).lower()
+
+def compute_allergen_mask(text):
+    mask = 0
+    for term, bit in ALLERGEN_TERM_BITS.items():
+        if term in text:
+            mask |= bit
+    return mask
+
+def tokenize_ingredients(text):
+    return sorted(set(TOKEN_RE.findall(text)))
+
+def tokenize_title(title):
+    """Lowercased words of a title, in order, without repeats"""
+    return list(dict.fromkeys(TOKEN_RE.findall(title.lower())))
+
+def ingredients_hash(ingredients):
+    """Content hash of an ingredient list; changes whenever the list does"""
+    return hashlib.sha1(json.dumps(ingredients, ensure_ascii=False).encode()).hexdigest()
+
+def enrich_recipe(recipe):
+    """Return the precomputed fields to store on a recipe document"""
+    text = ingredients_text(recipe.get("ingredients") or [])
+    title = recipe.get("title")
+    title = title if isinstance(title, str) else ""
+    return {
+        "allergen_mask": compute_allergen_mask(text),
+        "ingredient_tokens": tokenize_ingredients(text),
+        "title_lower": title.lower(),
+        "title_tokens": tokenize_title(title),
+        "ingredients_hash": ingredients_hash(recipe.get("ingredients") or []),
+        "enrichment_version": ENRICHMENT_VERSION,
+    }
+
+def has_current_mask(recipe):
+    return recipe.get("enrichment_version") == ENRICHMENT_VERSION and "allergen_mask" in recipe
+
+def detect_allergens(recipe, user_allergens):
+    """
+    User allergens found in a recipe's ingredients.
+
+    Same result as checking `allergen.lower() in " ".join(ingredients).lower()`,
+    but known terms are answered from the precomputed mask. The ingredient text
+    is only built for unknown allergens or recipes that were not enriched yet.
+    """
+    mask = recipe["allergen_mask"] if has_current_mask(recipe) else None
+    text = None
+    detected = []
+    for allergen in user_allergens:
+        allergen_lower = allergen.lower()
+        bit = ALLERGEN_TERM_BITS.get(allergen_lower)
+        if mask is not None and bit is not None:
+            found = mask & bit
+        else:
+            if text is None:
+                text = ingredients_text(recipe.get("ingredients") or [])
+            found = allergen_lower in text
+        if found:
+            detected.append(allergen)
+    return detected
+
+# Fields routes need to project so detect_allergens can use the mask
+DETECTION_FIELDS = {"ingredients": 1, "allergen_mask": 1, "enrichment_version": 1}
+
+def backfill(collection, batch_size=BACKFILL_BATCH_SIZE):
+    """Enrich every recipe whose stored fields are missing or out of date"""
+    query = {"enrichment_version": {"$ne": ENRICHMENT_VERSION}}
+    operations = []
+    updated = 0
+    for recipe in collection.find(query, {"title": 1, "ingredients": 1}):
+        operations.append(UpdateOne({"_id": recipe["_id"]}, {"$set": enrich_recipe(recipe)}))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+            print(f"Enriched {updated} recipes...")
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    print(f"✓ Enrichment backfill complete, {updated} recipes updated")
+    if updated:
+        invalidate_result_caches(collection.database)
+    return updated
+
+if __name__ == "__main__":
+    backfill(recipes_collection)
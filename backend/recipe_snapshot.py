@@ -0,0 +1,423 @@
+"""
+Read-only columnar snapshot of the recipe corpus.
+
+Handlers like /match and /detect's scan mode re-fetch titles and ingredients
+from Mongo on every request. The snapshot keeps what they read in a handful
+of flat numpy arrays instead of one Python dict per recipe:
+
+  ids, titles, title_lower, lines   strings as one UTF-8 buffer plus offsets
+  line_offsets                      recipe i owns lines[line_offsets[i]:line_offsets[i + 1]]
+  allergen_masks                    the ALLERGEN_TERM_BITS mask of every recipe
+  vocabulary, token_ids,            each recipe's ingredient_index tokens, interned
+  token_offsets                     as uint32 ids into one shared vocabulary
+
+Recipes are stored in _id order, so an _id lookup is a binary search.
+
+The snapshot file is a magic number, a JSON header listing each column's
+dtype, offset and length, then the raw arrays. Running this module writes
+it from recipes_collection; every API worker maps it read-only, so the
+pages come from the OS page cache once per machine instead of once per
+worker. The builder replaces the file atomically, and workers notice the
+new inode within RECIPE_SNAPSHOT_CHECK_INTERVAL seconds and swap to it.
+
+Enable it with RECIPE_SNAPSHOT=true and point RECIPE_SNAPSHOT_PATH at the
+file. Without a path each worker builds a private copy from the collection
+at startup. SIGHUP re-checks the file, or rebuilds the private copy.
+
+In snapshot mode the title index searches the mapped title_lower column too
+(see title_index.py). The ingredient_index postings behind /allergen_counts
+and the allergen_analytics bitmaps are still built per worker from Mongo.
+
+    python recipe_snapshot.py [--output recipes.snapshot]
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import uuid
+import numpy as np
+from dotenv import load_dotenv
+from db import recipes_collection
+from ingredient_index import recipe_tokens
+from ingredient_mappings import ALLERGEN_TERM_BITS
+from recipe_enrichment import ENRICHMENT_VERSION, compute_allergen_mask, has_current_mask, ingredients_text
+
+load_dotenv()
+
+# Serve /match and /detect's snapshot mode from the in-memory snapshot
+SNAPSHOT_MODE = os.getenv("RECIPE_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+DEFAULT_SNAPSHOT_PATH = "recipes.snapshot"
+# Snapshot file the workers map; empty builds a private copy per worker instead
+SNAPSHOT_PATH = os.getenv("RECIPE_SNAPSHOT_PATH", "")
+# How often (in seconds) workers look for a replaced snapshot file
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("RECIPE_SNAPSHOT_CHECK_INTERVAL", "5"))
+
+SNAPSHOT_MAGIC = b"RSNAP\x00\x01\x00"
+# Every column starts on a cache-line boundary
+ALIGNMENT = 64
+
+SNAPSHOT_FIELDS = {
+    "title": 1, "ingredients": 1, "allergen_mask": 1, "enrichment_version": 1,
+    "normalized_ingredients": 1, "ingredient_tokens": 1,
+}
+STRING_COLUMNS = ["ids", "titles", "title_lower", "lines", "vocabulary"]
+ARRAY_COLUMNS = ["line_offsets", "allergen_masks", "token_ids", "token_offsets"]
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class StringColumn:
+    """A sequence of strings stored as one UTF-8 buffer plus offsets"""
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode() for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode()
+
+    def slice(self, start, stop):
+        return [self[i] for i in range(start, stop)]
+
+    def find(self, needle):
+        """Sorted indexes of the strings containing needle"""
+        if not needle:
+            return np.arange(len(self))
+        encoded = needle.encode()
+        # A lookahead finds overlapping occurrences, so one straddling two strings can't hide a real one
+        starts = np.fromiter(
+            (m.start() for m in re.finditer(b"(?=" + re.escape(encoded) + b")", memoryview(self.buffer))),
+            dtype=np.int64,
+        )
+        indexes = np.searchsorted(self.offsets, starts, side="right") - 1
+        inside = starts + len(encoded) <= self.offsets[indexes + 1]
+        return np.unique(indexes[inside])
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes
+
+
+class RecipeSnapshot:
+    def __init__(self, strings, arrays, built_at):
+        self.strings = strings
+        self.arrays = arrays
+        self.built_at = built_at
+        self.generation = None
+        # The ALLERGEN_TERM_BITS mapping the masks were computed with
+        self.enrichment_version = ENRICHMENT_VERSION
+        self.ids = strings["ids"]
+        self.titles = strings["titles"]
+        self.title_lower = strings["title_lower"]
+        self.lines = strings["lines"]
+        self.vocabulary = strings["vocabulary"]
+        self.line_offsets = arrays["line_offsets"]
+        self.allergen_masks = arrays["allergen_masks"]
+        self.token_ids = arrays["token_ids"]
+        self.token_offsets = arrays["token_offsets"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, recipes):
+        """Snapshot recipes given in _id order (e.g. a cursor sorted on _id)"""
+        ids, titles, lines, line_offsets, masks = [], [], [], [0], []
+        vocabulary = {}
+        token_ids, token_offsets = [], [0]
+        for recipe in recipes:
+            title = recipe.get("title")
+            ingredients = [i for i in (recipe.get("ingredients") or []) if isinstance(i, str)]
+            ids.append(str(recipe["_id"]))
+            titles.append(title if isinstance(title, str) else "")
+            lines.extend(ingredients)
+            line_offsets.append(len(lines))
+            if has_current_mask(recipe):
+                masks.append(recipe["allergen_mask"])
+            else:
+                masks.append(compute_allergen_mask(ingredients_text(ingredients)))
+            for token in recipe_tokens(recipe):
+                token_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+            token_offsets.append(len(token_ids))
+        strings = {
+            "ids": StringColumn.from_strings(ids),
+            "titles": StringColumn.from_strings(titles),
+            "title_lower": StringColumn.from_strings(t.lower() for t in titles),
+            "lines": StringColumn.from_strings(lines),
+            "vocabulary": StringColumn.from_strings(vocabulary),
+        }
+        arrays = {
+            "line_offsets": np.array(line_offsets, dtype=np.int64),
+            "allergen_masks": np.array(masks, dtype=np.uint64),
+            "token_ids": np.array(token_ids, dtype=np.uint32),
+            "token_offsets": np.array(token_offsets, dtype=np.int64),
+        }
+        return cls(strings, arrays, time.time())
+
+    def columns(self):
+        """Every array of the snapshot by file column name"""
+        columns = {}
+        for name, column in self.strings.items():
+            columns[f"{name}_buffer"] = column.buffer
+            columns[f"{name}_offsets"] = column.offsets
+        columns.update(self.arrays)
+        return columns
+
+    def save(self, path):
+        """
+        Write the snapshot file, atomically replacing any file already at path.
+
+        Workers that still map the old file keep reading it until they swap.
+        """
+        columns = self.columns()
+        header = {
+            "recipes": len(self),
+            "built_at": self.built_at,
+            "generation": uuid.uuid4().hex,
+            "enrichment_version": ENRICHMENT_VERSION,
+            "columns": {},
+        }
+        offset = 0
+        for name, array in columns.items():
+            header["columns"][name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+            offset = align(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        data_start = align(len(SNAPSHOT_MAGIC) + 8 + len(encoded))
+        staging = f"{path}.{os.getpid()}.tmp"
+        with open(staging, "wb") as f:
+            f.write(SNAPSHOT_MAGIC + len(encoded).to_bytes(8, "little") + encoded)
+            for name, array in columns.items():
+                f.seek(data_start + header["columns"][name]["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            # Empty trailing columns still need their offsets inside the file
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, path)
+        return header
+
+    @classmethod
+    def open(cls, path):
+        """Map a snapshot file read-only; the arrays are views into the shared mapping"""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a recipe snapshot")
+        header_length = int.from_bytes(mapping[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 8], "little")
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        header = json.loads(mapping[header_start:header_start + header_length])
+        if header["enrichment_version"] != ENRICHMENT_VERSION:
+            # Its allergen masks were computed with a different term mapping
+            raise ValueError(f"{path} was built for enrichment version {header['enrichment_version']}, "
+                             f"not {ENRICHMENT_VERSION}; rebuild it with `python recipe_snapshot.py`")
+        data_start = align(header_start + header_length)
+        columns = {
+            name: np.frombuffer(mapping, dtype=np.dtype(column["dtype"]), count=column["length"],
+                                offset=data_start + column["offset"])
+            for name, column in header["columns"].items()
+        }
+        strings = {name: StringColumn(columns[f"{name}_buffer"], columns[f"{name}_offsets"]) for name in STRING_COLUMNS}
+        arrays = {name: columns[name] for name in ARRAY_COLUMNS}
+        snapshot = cls(strings, arrays, header["built_at"])
+        snapshot.generation = header["generation"]
+        snapshot.enrichment_version = header["enrichment_version"]
+        return snapshot
+
+    def position(self, _id):
+        """Position of a recipe by _id, or None"""
+        key = str(_id)
+        position = bisect.bisect_left(self.ids, key)
+        if position < len(self) and self.ids[position] == key:
+            return position
+        return None
+
+    def ingredients(self, position):
+        return self.lines.slice(int(self.line_offsets[position]), int(self.line_offsets[position + 1]))
+
+    def tokens(self, position):
+        start, stop = int(self.token_offsets[position]), int(self.token_offsets[position + 1])
+        return [self.vocabulary[int(token_id)] for token_id in self.token_ids[start:stop]]
+
+    def recipe(self, position):
+        """The recipe as the {"title", DETECTION_FIELDS} document routes work with"""
+        return {
+            "_id": self.ids[position],
+            "title": self.titles[position],
+            "ingredients": self.ingredients(position),
+            "allergen_mask": int(self.allergen_masks[position]),
+            "enrichment_version": self.enrichment_version,
+        }
+
+    def recipes_by_ids(self, ids):
+        """{_id: recipe} for the ids the snapshot has, like routes.fetch_by_ids"""
+        docs = {}
+        for _id in ids:
+            position = self.position(_id)
+            if position is not None:
+                docs[_id] = self.recipe(position)
+        return docs
+
+    def find_title(self, dish):
+        """Positions of recipes whose title contains the dish name, ignoring case"""
+        return self.title_lower.find(dish.lower())
+
+    def allergen_stats(self, positions, user_allergens):
+        """(total, with_any, allergen_counts) over the positions, like aggregations.allergen_stats"""
+        masks = self.allergen_masks[positions]
+        any_hit = np.zeros(len(positions), dtype=bool)
+        allergen_counts = {a.lower(): 0 for a in user_allergens}
+        texts = None
+        for allergen in user_allergens:
+            allergen_lower = allergen.lower()
+            bit = ALLERGEN_TERM_BITS.get(allergen_lower)
+            if bit is not None:
+                hits = (masks & np.uint64(bit)) != 0
+            else:
+                # Unknown terms need the ingredient text, as in detect_allergens
+                if texts is None:
+                    texts = [ingredients_text(self.ingredients(p)) for p in positions]
+                hits = np.array([allergen_lower in text for text in texts], dtype=bool)
+            # Listed twice (in any casing) counts twice, as in /detect
+            allergen_counts[allergen_lower] += int(hits.sum())
+            any_hit |= hits
+        return len(positions), int(any_hit.sum()), allergen_counts
+
+    def memory_report(self):
+        columns = {name: column.nbytes for name, column in self.strings.items()}
+        columns.update({name: array.nbytes for name, array in self.arrays.items()})
+        total = sum(columns.values())
+        return {
+            "recipes": len(self),
+            "total_bytes": total,
+            "bytes_per_recipe": round(total / len(self), 1) if len(self) else 0.0,
+            "columns": columns,
+            "built_at": self.built_at,
+            "generation": self.generation,
+        }
+
+
+class SnapshotStore:
+    """
+    The current snapshot, swapped as a whole on every load or rebuild.
+
+    With a snapshot path, every worker maps the same file and checks it at
+    most every SNAPSHOT_CHECK_INTERVAL seconds: once the builder has replaced
+    it (a new inode or mtime), the next request maps the new file. Without
+    a path, each worker builds its own copy from the collection.
+    """
+
+    def __init__(self, collection, path=SNAPSHOT_PATH, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        self.collection = collection
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._file_id = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        # Keep polling after a rejected file too, so its rebuilt replacement is picked up
+        started = self._snapshot is not None or self._file_id is not None
+        if self.path and started and time.time() - self._checked_at > self.check_interval:
+            self.reload(blocking=False)
+        return self._snapshot
+
+    def load_or_build(self):
+        """Map the snapshot file, or build one in memory when there is none"""
+        if self.path and os.path.exists(self.path):
+            self.reload()
+        else:
+            if self.path:
+                print(f"No recipe snapshot at {self.path} (run `python recipe_snapshot.py`), building in memory")
+            self.refresh()
+
+    def reload(self, blocking=True):
+        """Map the snapshot file again if the builder has replaced it"""
+        if not self._lock.acquire(blocking=blocking):
+            return  # another request is already checking; keep serving the current snapshot
+        try:
+            self._checked_at = time.time()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            file_id = (stat.st_ino, stat.st_mtime_ns)
+            if file_id == self._file_id:
+                return
+            start_time = time.time()
+            self._file_id = file_id
+            try:
+                snapshot = RecipeSnapshot.open(self.path)
+            except ValueError as e:
+                # Keep serving the current snapshot, or the live Mongo path if there is none
+                print(f"✗ Recipe snapshot rejected: {e}")
+                return
+            self._publish(snapshot, "mapped", start_time)
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """SIGHUP: re-check the snapshot file, or rebuild the in-memory copy from the collection"""
+        if self.path and os.path.exists(self.path):
+            self.reload()
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            start_time = time.time()
+            snapshot = RecipeSnapshot.build(self.collection.find({}, SNAPSHOT_FIELDS).sort("_id", 1))
+            self._publish(snapshot, "built", start_time)
+        finally:
+            self._lock.release()
+
+    def _publish(self, snapshot, action, start_time):
+        self._snapshot = snapshot
+        report = snapshot.memory_report()
+        print(f"Recipe snapshot {action} with {report['recipes']} recipes, "
+              f"{report['total_bytes'] / 1024 / 1024:.1f} MiB ({report['bytes_per_recipe']:.0f} bytes/recipe) "
+              f"in {time.time() - start_time:.1f}s")
+
+    def stats(self):
+        snapshot = self.current
+        if snapshot is None:
+            return {"enabled": SNAPSHOT_MODE, "loaded": False}
+        return {"enabled": SNAPSHOT_MODE, "loaded": True, "path": self.path or None, **snapshot.memory_report()}
+
+
+def build_snapshot_file(collection, path):
+    """Offline builder: snapshot the collection into path for the API workers to map"""
+    start_time = time.time()
+    snapshot = RecipeSnapshot.build(collection.find({}, SNAPSHOT_FIELDS).sort("_id", 1))
+    header = snapshot.save(path)
+    report = snapshot.memory_report()
+    print(f"✓ Wrote {report['recipes']} recipes to {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MiB, "
+          f"{report['bytes_per_recipe']:.0f} bytes/recipe, generation {header['generation']}) "
+          f"in {time.time() - start_time:.1f}s")
+    return header
+
+
+recipe_snapshot = SnapshotStore(recipes_collection)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the recipe snapshot file the API workers map")
+    parser.add_argument("--output", default=SNAPSHOT_PATH or DEFAULT_SNAPSHOT_PATH,
+                        help="Snapshot file to write (default: RECIPE_SNAPSHOT_PATH)")
+    args = parser.parse_args()
+    build_snapshot_file(recipes_collection, args.output)
@@ -0,0 +1,202 @@
+"""
+Bounded TTL + LRU caches for repeated analysis results.
+
+Menus repeat heavily across users ("caesar salad", "pad thai", ...), so dish
+analyses and the recipe lookups behind them are cached in-process. A cache
+can also sit in front of a shared backend (anything with get/set/clear, e.g. a
+Redis adapter); LocalBackend is an in-process stand-in with the same interface.
+
+Writers (data_load, the enrichment backfill) call invalidate_result_caches()
+after they write. That clears caches in the calling process and bumps a
+generation counter in Mongo; API processes notice the new generation on their
+next sync_cache_generation() call and drop their entries.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+
+# How often (in seconds) API processes look for invalidations from other processes
+GENERATION_CHECK_INTERVAL = 30
+
+CACHE_STATE_COLLECTION = "cache_state"
+CACHE_STATE_ID = "recipes"
+
+
+class LocalBackend:
+    """In-process stand-in for a shared cache backend, storing JSON strings with expiry"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self, prefix=""):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+
+class ResultCache:
+    """
+    LRU cache whose entries expire after ttl seconds.
+
+    Keys are any JSON-serializable value; callers normalize them. Values are
+    copied on the way in and out so cached results can't be mutated by callers.
+    """
+
+    def __init__(self, name, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, backend=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_hits = 0
+        _caches.append(self)
+
+    def _key(self, key):
+        return f"{self.name}:{self.generation}:{json.dumps(key, sort_keys=True, default=str)}"
+
+    def get(self, key, default=None):
+        key = self._key(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                self.expirations += 1
+        if self.backend is not None:
+            stored = self.backend.get(key)
+            if stored is not None:
+                value = json.loads(stored)
+                with self._lock:
+                    self.hits += 1
+                    self.backend_hits += 1
+                    self._store(key, value)
+                return copy.deepcopy(value)
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        key = self._key(key)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value)
+        if self.backend is not None:
+            self.backend.set(key, json.dumps(value, default=str), self.ttl)
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, locally and in the shared backend"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear(f"{self.name}:")
+
+    def set_generation(self, generation):
+        # Old entries become unreachable in the shared backend as well
+        if generation != self.generation:
+            with self._lock:
+                self.generation = generation
+                self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "backend_hits": self.backend_hits,
+            "generation": self.generation,
+        }
+
+
+_caches = []
+_last_generation_check = 0.0
+
+
+def cache_stats():
+    return {cache.name: cache.stats() for cache in _caches}
+
+
+def set_shared_backend(backend):
+    """Put every cache in front of the same shared backend (or None for in-process only)"""
+    for cache in _caches:
+        cache.backend = backend
+
+
+def invalidate_result_caches(database=None):
+    """
+    Invalidation hook for anything that writes recipes.
+
+    Clears this process's caches and, given the database, bumps the generation
+    so API processes drop theirs on their next check.
+    """
+    for cache in _caches:
+        cache.invalidate()
+    if database is not None:
+        database[CACHE_STATE_COLLECTION].update_one(
+            {"_id": CACHE_STATE_ID}, {"$inc": {"generation": 1}}, upsert=True
+        )
+    print(f"Invalidated {len(_caches)} result caches")
+
+
+async def sync_cache_generation(async_database):
+    """Pick up invalidations published by other processes, at most every GENERATION_CHECK_INTERVAL"""
+    global _last_generation_check
+    now = time.monotonic()
+    if now - _last_generation_check < GENERATION_CHECK_INTERVAL:
+        return
+    _last_generation_check = now
+    try:
+        state = await async_database[CACHE_STATE_COLLECTION].find_one({"_id": CACHE_STATE_ID})
+    except Exception as e:
+        print(f"Cache generation check failed: {e}")
+        return
+    generation = state.get("generation", 0) if state else 0
+    for cache in _caches:
+        cache.set_generation(generation)
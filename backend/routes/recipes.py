@@ -1,49 +1,157 @@
 from rapidfuzz import fuzz
-from fastapi import APIRouter, Query, Body
-from db import recipes_collection
-from models import Recipe
-from typing import List, Dict, Any
+import asyncio
+import json
+import os
+import time
+from fastapi import APIRouter, Query, Body, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from db import async_db, async_recipes_collection as recipes_collection
+from models import RecipePage
+from typing import List, Dict, Any, Literal, Optional, get_args
 from collections import Counter
 from ingredient_mappings import normalize_ingredient, get_allergen_matches, ALLERGEN_CATEGORIES
+from title_index import title_index, TITLE_SCORE_FLOOR
+from ingredient_index import ingredient_index
+from allergen_analytics import allergen_analytics
+from recipe_snapshot import recipe_snapshot, SNAPSHOT_MODE
+from ingredient_scoring import main_ingredient_scores
+from recipe_enrichment import detect_allergens, DETECTION_FIELDS
+from aggregations import allergen_stats
+from title_search import title_filter
+from pagination import after_cursor, encode_cursor
+from result_cache import ResultCache, cache_stats, sync_cache_generation
+from dish_stats import find_dish_stats, stats_breakdown, stats_probability
 
 router = APIRouter()
 
-@router.get("/search", response_model=List[Recipe])
-def search(dish: str = Query(..., description="Dish name to search for"), user_allergens: List[str] = Query([])):
-    results = recipes_collection.find({"title": {"$regex": dish, "$options": "i"}})
-    recipes = []
-    for r in results:
-        ingredients = r.get("ingredients") or []
-        ingredients_text = " ".join(ingredients).lower()
-        detected_allergens = [a for a in user_allergens if a.lower() in ingredients_text]
+# Upper bound on dishes analyzed at once by /batch_ingredient_analysis
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
 
-        recipes.append({
+# Answer /ingredient_analysis's database fallback from the precomputed dish_stats collection when it
+# has the dish. Off by default: those probabilities come from the recipes with exactly the dish's
+# dish_key, not from fuzzy title matches, so the numbers differ from the live fallback.
+DISH_STATS_FALLBACK = os.getenv("DISH_STATS_FALLBACK", "false").lower() in ("1", "true", "yes")
+
+# Dish analyses and the recipe lookups behind their database fallback
+analysis_cache = ResultCache("dish_analysis")
+dish_match_cache = ResultCache("dish_matches")
+
+# Page size bounds for /search
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+# total_estimate stops counting here so broad queries stay cheap
+TOTAL_ESTIMATE_CAP = 1000
+
+RecipeField = Literal["title", "ingredients", "instructions", "picture_link", "detected_allergens"]
+
+# The page is streamed, so the schema is documented here rather than validated via response_model
+@router.get("/search", responses={200: {"model": RecipePage, "description": "One page of matching recipes"}})
+async def search(
+    dish: str = Query(..., description="Dish name to search for"),
+    user_allergens: List[str] = Query([]),
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT, description="Recipes per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: List[RecipeField] = Query([], description="Only return these recipe fields (default: all)")
+):
+    dish_filter = title_filter(dish)
+    try:
+        query = after_cursor(dish_filter, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    fields = fields or list(get_args(RecipeField))
+    projection = {f: 1 for f in fields if f != "detected_allergens"}
+    if "detected_allergens" in fields:
+        projection.update(DETECTION_FIELDS)
+
+    total_estimate = await recipes_collection.count_documents(dish_filter, limit=TOTAL_ESTIMATE_CAP)
+    # One extra document tells us whether there is a next page
+    results = recipes_collection.find(query, projection).sort("_id", 1).limit(limit + 1)
+
+    def render(r):
+        recipe = {
             "title": r.get("title", ""),
-            "ingredients": ingredients,
+            "ingredients": r.get("ingredients") or [],
             "instructions": r.get("instructions", ""),
             "picture_link": r.get("picture_link"),
-            "detected_allergens": detected_allergens
-        })
-    return recipes
+        }
+        if "detected_allergens" in fields:
+            recipe["detected_allergens"] = detect_allergens(r, user_allergens)
+        return {f: recipe[f] for f in fields}
+
+    async def stream_page():
+        # Recipes are written out one at a time instead of building the whole page
+        yield '{"recipes": ['
+        next_cursor = None
+        count = 0
+        try:
+            async for r in results:
+                if count == limit:
+                    next_cursor = encode_cursor(last_id)
+                    break
+                yield ("," if count else "") + json.dumps(render(r), default=str)
+                last_id = r["_id"]
+                count += 1
+        finally:
+            await results.close()
+        yield f'], "next_cursor": {json.dumps(next_cursor)}, "total_estimate": {total_estimate}}}'
+
+    return StreamingResponse(stream_page(), media_type="application/json")
 
 @router.get("/detect")
-def detect(dish: str = Query(...,  description="Dish name to check"), user_allergens: List[str] = Query([])):
-    results = recipes_collection.find({"title": {"$regex": dish, "$options": "i"}})
+async def detect(
+    dish: str = Query(...,  description="Dish name to check"),
+    user_allergens: List[str] = Query([]),
+    mode: Literal["aggregate", "scan", "stats", "snapshot"] = Query("aggregate", description="'aggregate' counts inside MongoDB, 'scan' streams recipes and counts here, 'stats' reads the precomputed dish_stats entry for recipes titled exactly like the dish and aggregates only when there is none, 'snapshot' counts over the in-memory recipe snapshot and aggregates when none is loaded")
+):
+    """
+    Allergen counts over the recipes whose title contains the dish name.
 
-    total = 0
-    with_any_allergen = 0
-    allergen_counts = {a.lower(): 0 for a in user_allergens}
+    Recipes without a current allergen mask are checked against their
+    lowercased ingredient text. In 'aggregate' mode MongoDB's $toLower does
+    the lowercasing and only folds ASCII letters, so ingredients written with
+    uppercase non-ASCII letters (e.g. "CRÈME") can count differently than in
+    'scan' mode.
+    """
+    dish_filter = title_filter(dish)
 
-    for r in results:
-        total += 1
-        ingredients = r.get("ingredients") or []
-        ingredients_text = " ".join(ingredients).lower()
+    snapshot = recipe_snapshot.current
+    if mode == "snapshot":
+        if snapshot is None:
+            mode = "aggregate"
+        else:
+            positions = await run_in_threadpool(snapshot.find_title, dish)
+            total, with_any_allergen, allergen_counts = await run_in_threadpool(
+                snapshot.allergen_stats, positions, user_allergens
+            )
 
-        detected = [a for a in user_allergens if a.lower() in ingredients_text]
-        if detected:
-            with_any_allergen += 1
-            for d in detected:
-                allergen_counts[d.lower()] += 1
+    stats = None
+    if mode == "stats":
+        stats = await find_dish_stats(async_db, dish)
+        breakdown = stats_breakdown(stats, user_allergens)
+        if breakdown is None:
+            stats = None
+            mode = "aggregate"
+        else:
+            total, with_any_allergen, allergen_counts = breakdown
+
+    if mode == "aggregate":
+        total, with_any_allergen, allergen_counts = await allergen_stats(recipes_collection, dish_filter, user_allergens)
+    elif mode == "scan":
+        results = recipes_collection.find(dish_filter, DETECTION_FIELDS)
+
+        total = 0
+        with_any_allergen = 0
+        allergen_counts = {a.lower(): 0 for a in user_allergens}
+
+        async for r in results:
+            total += 1
+            detected = detect_allergens(r, user_allergens)
+            if detected:
+                with_any_allergen += 1
+                for d in detected:
+                    allergen_counts[d.lower()] += 1
 
     percentage_any = (with_any_allergen / total * 100) if total > 0 else 0.0
     allergen_breakdown = {
@@ -51,58 +159,52 @@ def detect(dish: str = Query(...,  description="Dish name to check"), user_aller
         for allergen, count in allergen_counts.items()
     }
 
-    return {
+    response = {
         "dish": dish,
         "total_recipes": total,
         "recipes_with_any_allergen": with_any_allergen,
         "percentage_with_any_allergen": round(percentage_any, 2),
         "allergen_breakdown": allergen_breakdown
     }
+    if stats is not None:
+        response["source"] = "dish_stats"
+        response["usage_breakdown"] = {a: stats["usage"].get(a, {}) for a in allergen_counts}
+    return response
 
 @router.get("/match")
-def match(
+async def match(
     dish: str = Query(..., description="Dish name to check"),
     user_allergens: List[str] = Query([]),
     main_ingredients: List[str] = Query([]),
     threshold: int = Query(70, description="Fuzzy match threshold (0-100)"),
     ingredient_threshold: int = Query(60, description="Fuzzy match threshold for ingredients (0-100)")
 ):
-    all_recipes = list(recipes_collection.find({}, {"title": 1, "ingredients": 1}))
     scored = []
     dish_lower = dish.lower()
     main_ingredients_lower = [i.lower() for i in main_ingredients if i.strip()]
-    for r in all_recipes:
-        title = r.get("title", "")
-        if not isinstance(title, str) or not title.strip():
-            continue
-        title_score = fuzz.ratio(dish_lower, title.lower())
-        if title_score < 50:
-            continue
-        # Ingredient fuzzy matching
-        recipe_ingredients = [i.lower() for i in (r.get("ingredients") or []) if isinstance(i, str)]
-        import re
-        detected_main = 0
-        if main_ingredients_lower and recipe_ingredients:
-            for mi in main_ingredients_lower:
-                found = False
-                for ri in recipe_ingredients:
-                    # Check for whole word match
-                    if re.search(r'\\b' + re.escape(mi) + r'\\b', ri):
-                        found = True
-                        break
-                    # Substring match
-                    if len(mi) >= 4 and (mi in ri.split() or ri in mi.split()):
-                        found = True
-                        break
-                    # Fuzzy match
-                    if fuzz.ratio(mi, ri) >= ingredient_threshold:
-                        found = True
-                        break
-                if found:
-                    detected_main += 1
-            ing_score = (detected_main / len(main_ingredients_lower)) * 100 if main_ingredients_lower else 0
-        else:
-            ing_score = 0
+    # Only recipes whose title can clear the score floor are fetched from Mongo
+    # The index is in-memory and CPU-bound, keep it off the event loop
+    candidates = await run_in_threadpool(title_index.search, dish_lower, TITLE_SCORE_FLOOR)
+    candidate_ids = [_id for _id, _ in candidates]
+    snapshot = recipe_snapshot.current if SNAPSHOT_MODE else None
+    if snapshot is not None:
+        candidate_docs = snapshot.recipes_by_ids(candidate_ids)
+        # Recipes added since the snapshot was built still come from Mongo
+        missing = [_id for _id in candidate_ids if _id not in candidate_docs]
+        if missing:
+            candidate_docs.update(await fetch_by_ids(missing, {"title": 1, **DETECTION_FIELDS}))
+    else:
+        candidate_docs = await fetch_by_ids(candidate_ids, {"title": 1, **DETECTION_FIELDS})
+    matched = [(title_score, candidate_docs[_id]) for _id, title_score in candidates if _id in candidate_docs]
+    # Ingredient fuzzy matching, scored for every candidate at once
+    recipes_ingredients = [
+        [i.lower() for i in (r.get("ingredients") or []) if isinstance(i, str)]
+        for _, r in matched
+    ]
+    ing_scores = await run_in_threadpool(
+        main_ingredient_scores, main_ingredients_lower, recipes_ingredients, ingredient_threshold
+    )
+    for (title_score, r), ing_score in zip(matched, ing_scores):
         # Combine scores(50% title, 50% ingredients)
         combined_score = 0.5 * title_score + 0.5 * ing_score
         if title_score >= threshold or (main_ingredients_lower and ing_score >= ingredient_threshold):
@@ -116,17 +218,14 @@ def match(
     weighted_allergen_sum = {a.lower(): 0.0 for a in user_allergens}
     weighted_total = 0.0
     for combined_score, title_score, ing_score, r in scored:
-        ingredients = r.get("ingredients") or []
-        ingredients_text = " ".join(ingredients).lower()
-        detected = [a for a in user_allergens if a.lower() in ingredients_text]
+        detected = detect_allergens(r, user_allergens)
         if detected:
             with_any_allergen += 1
             for d in detected:
                 allergen_counts[d.lower()] += 1
         # Probability: weight by combined_score
-        for a in user_allergens:
-            if a.lower() in ingredients_text:
-                weighted_allergen_sum[a.lower()] += combined_score
+        for d in detected:
+            weighted_allergen_sum[d.lower()] += combined_score
         weighted_total += combined_score
     percentage_any = (with_any_allergen / total * 100) if total > 0 else 0.0
     allergen_breakdown = {
@@ -166,17 +265,77 @@ def match(
     }
     return response
 
+@router.get("/allergen_counts")
+async def allergen_counts(
+    dish: str = Query(..., description="Dish name to check"),
+    user_allergens: List[str] = Query([]),
+    threshold: int = Query(70, description="Fuzzy title match threshold (0-100)")
+):
+    """
+    Allergen counts over the recipes whose title fuzzily matches the dish,
+    answered from the in-memory ingredient token index without fetching recipes.
+    Allergens match whole ingredient words (including their category's
+    ingredients), not substrings.
+    """
+    candidates = await run_in_threadpool(title_index.search, dish.lower(), max(threshold, TITLE_SCORE_FLOOR))
+    total, with_any_allergen, counts = await run_in_threadpool(
+        ingredient_index.count, [_id for _id, _ in candidates], user_allergens
+    )
+    percentage_any = (with_any_allergen / total * 100) if total > 0 else 0.0
+    return {
+        "dish": dish,
+        "total_recipes": total,
+        "recipes_with_any_allergen": with_any_allergen,
+        "percentage_with_any_allergen": round(percentage_any, 2),
+        "allergen_counts": counts,
+        "allergen_breakdown": {
+            allergen: round((count / total * 100), 2) if total > 0 else 0.0
+            for allergen, count in counts.items()
+        },
+    }
+
+@router.get("/allergen_analytics")
+async def allergen_analytics_endpoint(
+    dish: str = Query("", description="Dish name; every word must appear in the title. Empty means all recipes"),
+    user_allergens: List[str] = Query([], description="Allergens to analyze; all ALLERGEN_CATEGORIES when empty"),
+    expand_categories: bool = Query(False, description="Count a category name like 'dairy' when any of its ingredients appears")
+):
+    """
+    Allergen breakdown and pairwise co-occurrence within a dish family,
+    answered from in-memory roaring bitmaps. conditional_probability[a][b]
+    is the percentage of the family's recipes containing b that also contain a.
+    """
+    allergens = user_allergens or list(ALLERGEN_CATEGORIES)
+    total, with_any_allergen, counts, unsupported = await run_in_threadpool(
+        allergen_analytics.breakdown, dish, allergens, expand_categories
+    )
+    cooccurrence = await run_in_threadpool(allergen_analytics.cooccurrence, dish, allergens, expand_categories)
+    percentage_any = (with_any_allergen / total * 100) if total > 0 else 0.0
+    return {
+        "dish": dish,
+        "total_recipes": total,
+        "recipes_with_any_allergen": with_any_allergen,
+        "percentage_with_any_allergen": round(percentage_any, 2),
+        "allergen_counts": counts,
+        "allergen_breakdown": {
+            allergen: round((count / total * 100), 2) if total > 0 else 0.0
+            for allergen, count in counts.items()
+        },
+        "conditional_probability": cooccurrence,
+        "unsupported_allergens": unsupported,
+    }
+
 @router.get("/ingredient_analysis")
-def ingredient_analysis(
+async def ingredient_analysis(
     dish: str = Query(..., description="Dish name to check"),
     user_allergens: List[str] = Query([]),
     main_ingredients: List[str] = Query([]),
     normalized_ingredients: List[str] = Query([], description="Normalized ingredients from Gemini")
 ):
-    import time
     start_time = time.time()
+    await sync_cache_generation(async_db)
     
-    result = analyze_single_dish(dish, user_allergens, main_ingredients, normalized_ingredients)
+    result = await analyze_single_dish(dish, user_allergens, main_ingredients, normalized_ingredients)
     
     print(f"Single dish analysis took {time.time() - start_time:.3f}s for '{dish}'")
     return result
@@ -261,11 +420,13 @@ def ingredient_analysis(
     }
 
 @router.post("/batch_ingredient_analysis")
-def batch_ingredient_analysis(
+async def batch_ingredient_analysis(
     request_data: Dict[str, Any] = Body(...)
 ):
     """
     Analyze multiple dishes in a single request for better performance.
+    Dishes are analyzed concurrently, at most max_concurrency at a time
+    (optional, capped at BATCH_MAX_CONCURRENCY), and results keep the input order.
     Expected format:
     {
         "dishes": [
@@ -283,7 +444,6 @@ def batch_ingredient_analysis(
         "user_allergens": ["dairy", "nuts"]
     }
     """
-    import time
     start_time = time.time()
     
     dishes = request_data.get("dishes", [])
@@ -292,51 +452,103 @@ def batch_ingredient_analysis(
     if not dishes:
         return {"error": "No dishes provided"}
     
-    print(f"Processing batch request for {len(dishes)} dishes with allergens: {user_allergens}")
+    try:
+        max_concurrency = min(max(int(request_data.get("max_concurrency", BATCH_MAX_CONCURRENCY)), 1), BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        max_concurrency = BATCH_MAX_CONCURRENCY
+    
+    await sync_cache_generation(async_db)
+    
+    print(f"Processing batch request for {len(dishes)} dishes with allergens: {user_allergens} (concurrency {max_concurrency})")
     
-    results = []
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Summed over dishes, so with concurrency these can exceed processing_time
+    timings = {"queue_time": 0.0, "db_time": 0.0}
     
-    for dish_data in dishes:
+    async def analyze_dish(dish_data):
         dish_name = dish_data.get("dish_name", "")
         main_ingredients = dish_data.get("main_ingredients", [])
         normalized_ingredients = dish_data.get("normalized_ingredients", [])
         
         if not dish_name:
-            results.append({
+            return {
                 "dish": "",
                 "error": "Dish name is required",
                 "probability_with_any": 0,
                 "probability_breakdown": {},
                 "common_usage": {}
-            })
-            continue
+            }
         
-        try:
-            # Reuse the existing logic from ingredient_analysis
-            result = analyze_single_dish(dish_name, user_allergens, main_ingredients, normalized_ingredients)
-            results.append(result)
-        except Exception as e:
-            print(f"Error analyzing {dish_name}: {e}")
-            results.append({
-                "dish": dish_name,
-                "error": str(e),
-                "probability_with_any": 0,
-                "probability_breakdown": {},
-                "common_usage": {}
-            })
+        queued_at = time.perf_counter()
+        async with semaphore:
+            timings["queue_time"] += time.perf_counter() - queued_at
+            try:
+                # Reuse the existing logic from ingredient_analysis
+                return await analyze_single_dish(dish_name, user_allergens, main_ingredients, normalized_ingredients, timings, dish_lookups)
+            except Exception as e:
+                # One failing dish must not take the rest of the batch down
+                print(f"Error analyzing {dish_name}: {e}")
+                return {
+                    "dish": dish_name,
+                    "error": str(e),
+                    "probability_with_any": 0,
+                    "probability_breakdown": {},
+                    "common_usage": {}
+                }
+    
+    # Identical dishes in one request are analyzed once and share the result,
+    # and every distinct dish name is fetched from the database at most once
+    dish_lookups = {}
+    analyses = {}
+    
+    def coalesced(dish_data):
+        key = json.dumps([
+            dish_data.get("dish_name", ""),
+            dish_data.get("main_ingredients", []),
+            dish_data.get("normalized_ingredients", [])
+        ], default=str)
+        if key not in analyses:
+            analyses[key] = asyncio.ensure_future(analyze_dish(dish_data))
+        return analyses[key]
+    
+    # gather keeps results in the same order as the dishes
+    results = await asyncio.gather(*(coalesced(dish_data) for dish_data in dishes))
     
     end_time = time.time()
-    print(f"Batch analysis completed in {end_time - start_time:.3f}s for {len(dishes)} dishes")
+    print(f"Batch analysis completed in {end_time - start_time:.3f}s for {len(dishes)} dishes "
+          f"({len(analyses)} unique, {len(dish_lookups)} DB lookups, "
+          f"queue {timings['queue_time']:.3f}s, db {timings['db_time']:.3f}s)")
     
     return {
         "results": results,
         "total_dishes": len(dishes),
-        "processing_time": round(end_time - start_time, 3)
+        "processing_time": round(end_time - start_time, 3),
+        "processing_breakdown": {
+            "queue_time": round(timings["queue_time"], 3),
+            "db_time": round(timings["db_time"], 3),
+            "unique_dishes": len(analyses),
+            "db_lookups": len(dish_lookups),
+            "max_concurrency": max_concurrency
+        }
     }
 
-def analyze_single_dish(dish: str, user_allergens: List[str], main_ingredients: List[str] = [], normalized_ingredients: List[str] = []):
+@router.get("/cache_stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters for the result caches, plus Gemini call metrics"""
+    # Imported here so the Gemini SDK isn't loaded at API startup
+    from gemini_integration import gemini_metrics
+    return {**cache_stats(), "gemini": gemini_metrics(), "recipe_snapshot": recipe_snapshot.stats()}
+
+async def analyze_single_dish(dish: str, user_allergens: List[str], main_ingredients: List[str] = [], normalized_ingredients: List[str] = [], timings: Optional[Dict[str, float]] = None, dish_lookups: Optional[Dict[str, "asyncio.Task"]] = None):
     """Enhanced analysis logic with ingredient normalization and mapping"""
     
+    cache_key = analysis_cache_key(dish, user_allergens, main_ingredients, normalized_ingredients)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        # Echo this request's spelling and order rather than the cached request's
+        cached.update({"dish": dish, "main_ingredients": main_ingredients, "normalized_ingredients": normalized_ingredients})
+        return cached
+    
     # Step 1: Get all relevant ingredients for analysis
     all_ingredients = []
     
@@ -371,8 +583,8 @@ def analyze_single_dish(dish: str, user_allergens: List[str], main_ingredients:
     allergen_matches, all_normalized = get_allergen_matches(unique_ingredients, user_allergens)
     
     # Step 4: Calculate probabilities based on enhanced detection
-    probability_breakdown = {}
-    common_usage = {}
+    # (user_allergen, probability, usage, matches); probability is None until the DB fallback runs
+    decisions = []
     
     for user_allergen in user_allergens:
         allergen_lower = user_allergen.lower()
@@ -409,19 +621,46 @@ def analyze_single_dish(dish: str, user_allergens: List[str], main_ingredients:
                 usage = "likely"
         else:
             # Fall back to database analysis for dishes we have data on
-            probability, usage = get_database_probability(dish, user_allergen)
+            probability, usage = None, None
         
+        decisions.append((user_allergen, probability, usage, matches if mapping_match else []))
+    
+    # The database fallback reads the dish's precomputed stats first; allergens
+    # they can't answer are checked against one fetch of the dish
+    stats_answers = {}
+    if DISH_STATS_FALLBACK and any(probability is None for _, probability, _, _ in decisions):
+        stats = await dish_stats_lookup(dish, timings)
+        for user_allergen, probability, _, _ in decisions:
+            if probability is None:
+                stats_answers[user_allergen] = stats_probability(stats, user_allergen)
+    matched_dishes = None
+    fallback_needed = any(
+        probability is None and stats_answers.get(user_allergen) is None
+        for user_allergen, probability, _, _ in decisions
+    )
+    if fallback_needed:
+        if dish_lookups is None:
+            dish_lookups = {}
+        matched_dishes = await dish_lookup(dish, dish_lookups, timings)
+    
+    probability_breakdown = {}
+    common_usage = {}
+    
+    for user_allergen, probability, usage, matches in decisions:
+        if probability is None:
+            probability, usage = stats_answers.get(user_allergen) or probability_from_matches(matched_dishes, user_allergen)
+        allergen_lower = user_allergen.lower()
         probability_breakdown[allergen_lower] = probability
         common_usage[allergen_lower] = {
             "usage": usage,
             "count": 1 if probability > 0 else 0,
-            "matches": matches if mapping_match else []
+            "matches": matches
         }
     
     # Calculate overall probability
     max_probability = max(probability_breakdown.values()) if probability_breakdown.values() else 0.0
     
-    return {
+    result = {
         "dish": dish,
         "main_ingredients": main_ingredients,
         "normalized_ingredients": normalized_ingredients,
@@ -432,24 +671,41 @@ def analyze_single_dish(dish: str, user_allergens: List[str], main_ingredients:
         "common_usage": common_usage,
         "allergen_matches": allergen_matches
     }
+    # A failed database lookup shouldn't be remembered as "no data"
+    if not (fallback_needed and matched_dishes is None):
+        analysis_cache.set(cache_key, result)
+    return result
 
-def get_database_probability(dish: str, user_allergen: str):
-    """Fallback to database analysis for dishes we have recipe data on"""
+def analysis_cache_key(dish: str, user_allergens: List[str], main_ingredients: List[str], normalized_ingredients: List[str]):
+    """Requests that only differ in casing or ingredient order share a cache entry"""
+    return [
+        dish.lower(),
+        sorted(user_allergens),
+        sorted(i.lower() for i in main_ingredients),
+        sorted(i.lower() for i in normalized_ingredients),
+    ]
+
+async def fetch_dish_matches(dish: str, timings: Optional[Dict[str, float]] = None):
+    """
+    Recipes whose title fuzzily matches the dish, fetched once and shared by
+    every allergen checked against it. Returns None if the lookup failed.
+    """
+    db_started = time.perf_counter()
     try:
-        # Quick database lookup for this specific dish and allergen
+        # Quick database lookup for this specific dish
         search_patterns = [
-            {"title": {"$regex": f"\\b{dish}\\b", "$options": "i"}},
-            {"title": {"$regex": dish, "$options": "i"}},
+            title_filter(dish, whole_words=True),
+            title_filter(dish),
         ]
         
         matched_dishes = []
         for pattern in search_patterns:
             cursor = recipes_collection.find(
                 pattern, 
-                {"title": 1, "ingredients": 1}
+                {"title": 1, **DETECTION_FIELDS}
             ).limit(20)
             
-            for d in cursor:
+            async for d in cursor:
                 title = d.get("title", "")
                 if not isinstance(title, str):
                     continue
@@ -460,24 +716,80 @@ def get_database_probability(dish: str, user_allergen: str):
             if len(matched_dishes) >= 10:
                 break
         
-        if not matched_dishes:
-            return 0.0, None
-        
-        # Count allergen occurrences
-        allergen_count = 0
-        total_count = len(matched_dishes)
-        
-        for d in matched_dishes:
-            ingredients = d.get("ingredients", [])
-            ingredients_text = " ".join(ingredients).lower()
-            if user_allergen.lower() in ingredients_text:
-                allergen_count += 1
-        
-        probability = (allergen_count / total_count * 100) if total_count > 0 else 0.0
-        usage = "central" if probability > 50 else "possible" if probability > 0 else None
-        
-        return probability, usage
+        return matched_dishes
         
     except Exception as e:
-        print(f"Database lookup failed for {dish}/{user_allergen}: {e}")
+        print(f"Database lookup failed for {dish}: {e}")
+        return None
+    finally:
+        if timings is not None:
+            timings["db_time"] = timings.get("db_time", 0.0) + time.perf_counter() - db_started
+
+async def dish_stats_lookup(dish: str, timings: Optional[Dict[str, float]] = None):
+    """The dish's dish_stats entry; None on a miss or if the lookup failed"""
+    db_started = time.perf_counter()
+    try:
+        return await find_dish_stats(async_db, dish)
+    except Exception as e:
+        print(f"Dish stats lookup failed for {dish}: {e}")
+        return None
+    finally:
+        if timings is not None:
+            timings["db_time"] = timings.get("db_time", 0.0) + time.perf_counter() - db_started
+
+def probability_from_matches(matched_dishes, user_allergen: str):
+    """Share of the matched recipes containing the allergen, with the usage it implies"""
+    if not matched_dishes:
         return 0.0, None
+    
+    # Count allergen occurrences
+    allergen_count = 0
+    total_count = len(matched_dishes)
+    
+    for d in matched_dishes:
+        if detect_allergens(d, [user_allergen]):
+            allergen_count += 1
+    
+    probability = (allergen_count / total_count * 100) if total_count > 0 else 0.0
+    usage = "central" if probability > 50 else "possible" if probability > 0 else None
+    
+    return probability, usage
+
+def dish_lookup(dish: str, lookups: Dict[str, "asyncio.Task"], timings: Optional[Dict[str, float]] = None):
+    """
+    Shared fetch_dish_matches task for a dish within one request, so repeated
+    dish names (even ones analyzed concurrently) only hit the database once.
+    """
+    key = dish.lower()
+    if key not in lookups:
+        lookups[key] = asyncio.ensure_future(cached_dish_matches(dish, timings))
+    return lookups[key]
+
+async def cached_dish_matches(dish: str, timings: Optional[Dict[str, float]] = None):
+    """fetch_dish_matches behind the shared result cache"""
+    matched_dishes = dish_match_cache.get(dish.lower())
+    if matched_dishes is None:
+        matched_dishes = await fetch_dish_matches(dish, timings)
+        if matched_dishes is not None:
+            dish_match_cache.set(dish.lower(), matched_dishes)
+    return matched_dishes
+
+async def get_database_probability(dish: str, user_allergen: str, timings: Optional[Dict[str, float]] = None):
+    """Fallback to database analysis for dishes we have recipe data on"""
+    matched_dishes = await cached_dish_matches(dish, timings)
+    return probability_from_matches(matched_dishes, user_allergen)
+
+# Keeps each $in lookup comfortably below Mongo's document size limits
+ID_LOOKUP_CHUNK = 1000
+
+async def fetch_by_ids(ids, projection):
+    """Fetch documents for the given _ids, returned as a dict keyed by _id"""
+    async def fetch_chunk(chunk):
+        return await recipes_collection.find({"_id": {"$in": chunk}}, projection).to_list(None)
+    
+    chunks = [ids[start:start + ID_LOOKUP_CHUNK] for start in range(0, len(ids), ID_LOOKUP_CHUNK)]
+    docs = {}
+    for chunk_docs in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        for d in chunk_docs:
+            docs[d["_id"]] = d
+    return docs
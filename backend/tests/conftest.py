@@ -0,0 +1,30 @@
+import os
+import uuid
+import pytest
+from pymongo import MongoClient
+
+# Some checks need a real server: mongomock can't run every aggregation
+# expression or explain a query plan. They use a throwaway database on
+# TEST_MONGO_URI and are skipped when no server answers there.
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_uri():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        pytest.skip(f"no MongoDB server at {TEST_MONGO_URI}: {e}")
+    finally:
+        client.close()
+    return TEST_MONGO_URI
+
+
+@pytest.fixture
+def mongo_database(mongo_uri):
+    client = MongoClient(mongo_uri)
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
@@ -0,0 +1,18 @@
+from pymongo import ReplaceOne
+
+
+class UpdateOneCollection:
+    """mongomock's bulk_write doesn't accept this pymongo's operations; apply them one at a time"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            if isinstance(operation, ReplaceOne):
+                self.collection.replace_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+            else:
+                self.collection.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from pymongo import AsyncMongoClient
+from recipe_enrichment import ENRICHMENT_VERSION, enrich_recipe
+from routes import recipes as recipe_routes
+
+RECIPES = [
+    # Enriched with a current mask
+    {"title": "Fluffy Pancakes", "ingredients": ["1 cup Milk", "2 eggs", "1 kiwi"]},
+    {"title": "Pancake stack", "ingredients": ["Butter", "2 cups wheat flour"]},
+    # Not enriched yet: answered from the ingredient text
+    {"title": "Banana pancakes", "ingredients": ["2 bananas", "Peanut butter"], "enriched": False},
+    # A current enrichment_version without a mask is also answered from the text
+    {"title": "Pancakes", "ingredients": ["1 cup milk", "soy sauce"], "enriched": False,
+     "enrichment_version": ENRICHMENT_VERSION},
+    # An outdated mask is ignored
+    {"title": "Old pancakes", "ingredients": ["3 eggs"], "enriched": False,
+     "enrichment_version": "outdated", "allergen_mask": 0},
+    # Non-string ingredients are skipped, a missing list counts as no ingredients
+    {"title": "Pancake mix", "ingredients": ["milk", 3, None, {"item": "eggs"}, "Soy flour"], "enriched": False},
+    {"title": "Pancake art", "enriched": False},
+    {"title": "Tomato soup", "ingredients": ["milk", "eggs"]},
+]
+
+
+def recipe_documents():
+    docs = []
+    for recipe in RECIPES:
+        doc = {k: v for k, v in recipe.items() if k != "enriched"}
+        if recipe.get("enriched", True):
+            doc.update(enrich_recipe(doc))
+        docs.append(doc)
+    return docs
+
+
+@pytest.mark.parametrize("user_allergens", [
+    ["milk"],
+    ["Milk", "MILK", "eggs"],  # duplicates in different casing
+    ["kiwi", "peanut", "butter"],  # kiwi and peanut are not ALLERGEN_TERMS
+    ["Soy", "wheat", "unicorn"],
+    [],
+])
+def test_aggregate_mode_counts_like_scan_mode(mongo_uri, mongo_database, monkeypatch, user_allergens):
+    mongo_database.recipes.insert_many(recipe_documents())
+
+    async def detect(mode):
+        client = AsyncMongoClient(mongo_uri)
+        try:
+            monkeypatch.setattr(recipe_routes, "recipes_collection", client[mongo_database.name].recipes)
+            return await recipe_routes.detect(dish="pancake", user_allergens=user_allergens, mode=mode)
+        finally:
+            await client.close()
+
+    aggregate = asyncio.run(detect("aggregate"))
+    scan = asyncio.run(detect("scan"))
+
+    assert aggregate["total_recipes"] == scan["total_recipes"] == 7
+    assert aggregate == scan
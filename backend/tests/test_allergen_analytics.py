@@ -0,0 +1,55 @@
+import threading
+import time
+from allergen_analytics import AllergenAnalytics
+
+
+class SlowRecipes:
+    def __init__(self, docs, delay=0.2):
+        self.docs = docs
+        self.delay = delay
+        self.scans = 0
+
+    def find(self, *args, **kwargs):
+        self.scans += 1
+        time.sleep(self.delay)
+        return list(self.docs)
+
+
+def test_concurrent_first_breakdowns_build_once():
+    collection = SlowRecipes([
+        {"title": "Pancakes", "ingredients": ["1 cup milk", "2 eggs"]},
+        {"title": "Vegan pancakes", "ingredients": ["1 cup oat milk"]},
+        {"title": "Tomato soup", "ingredients": ["4 tomatoes"]},
+    ])
+    analytics = AllergenAnalytics(collection)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(analytics.breakdown("pancakes", ["eggs"])))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert collection.scans == 1
+    assert len(results) == 5
+    assert all(result[0] == 2 and result[2] == {"eggs": 1} for result in results)
+
+
+def test_stale_bitmaps_rebuild_in_the_background():
+    collection = SlowRecipes([{"title": "Pancakes", "ingredients": ["2 eggs"]}], delay=0)
+    analytics = AllergenAnalytics(collection, refresh_interval=0.01)
+    analytics.build()
+    collection.docs.append({"title": "Fluffy pancakes", "ingredients": ["3 eggs"]})
+    collection.delay = 0.5
+    time.sleep(0.02)
+
+    start = time.monotonic()
+    assert analytics.breakdown("pancakes", ["eggs"])[0] == 1
+    assert time.monotonic() - start < 0.25, "the rebuild ran on the request"
+
+    deadline = time.monotonic() + 5
+    while analytics.breakdown("pancakes", ["eggs"])[0] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert analytics.breakdown("pancakes", ["eggs"])[0] == 2
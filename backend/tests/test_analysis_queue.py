@@ -0,0 +1,94 @@
+import pytest
+from analysis_queue import DONE, FAILED, IN_FLIGHT, MAX_ATTEMPTS, PENDING, claim_batch, completion_operation, sync_work_queue
+from recipe_enrichment import ingredients_hash
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def apply(collection, operation):
+    collection.update_one(operation._filter, operation._doc)
+
+
+def queued_recipe(_id, ingredients, **fields):
+    return {
+        "_id": _id,
+        "ingredients": ingredients,
+        "ingredients_hash": ingredients_hash(ingredients),
+        "analysis_state": PENDING,
+        "analysis_attempts": 0,
+        **fields,
+    }
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.recipes
+
+
+def fail_until_parked(collection):
+    for _ in range(MAX_ATTEMPTS):
+        claim_id, recipes = claim_batch(collection, 10)
+        for recipe in recipes:
+            apply(collection, completion_operation(recipe, claim_id, {"_id": recipe["_id"], "error": "bad output"}))
+
+
+def test_failed_recipe_with_unchanged_ingredients_stays_failed(collection):
+    collection.insert_one(queued_recipe("r1", ["1 cup milk"]))
+    fail_until_parked(collection)
+    assert collection.find_one({"_id": "r1"})["analysis_state"] == FAILED
+
+    sync_work_queue(collection)
+
+    recipe = collection.find_one({"_id": "r1"})
+    assert recipe["analysis_state"] == FAILED
+    assert recipe["analysis_attempts"] == MAX_ATTEMPTS
+
+
+def test_failed_recipe_is_requeued_when_ingredients_change(collection):
+    collection.insert_one(queued_recipe("r1", ["1 cup milk"]))
+    fail_until_parked(collection)
+    collection.update_one({"_id": "r1"}, {"$set": {"ingredients_hash": ingredients_hash(["1 cup oat milk"])}})
+
+    sync_work_queue(collection)
+
+    recipe = collection.find_one({"_id": "r1"})
+    assert recipe["analysis_state"] == PENDING
+    assert recipe["analysis_attempts"] == 0
+
+
+def test_done_recipe_is_only_requeued_when_ingredients_change(collection):
+    collection.insert_many([
+        queued_recipe("same", ["2 eggs"], analysis_state=DONE, analyzed_hash=ingredients_hash(["2 eggs"])),
+        queued_recipe("changed", ["2 eggs"], analysis_state=DONE, analyzed_hash=ingredients_hash(["3 eggs"])),
+    ])
+
+    sync_work_queue(collection)
+
+    assert collection.find_one({"_id": "same"})["analysis_state"] == DONE
+    assert collection.find_one({"_id": "changed"})["analysis_state"] == PENDING
+
+
+class RacingCollection:
+    """Another worker claims every candidate of the first claim attempt just before it lands"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.raced = False
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def update_many(self, filter, update):
+        if not self.raced:
+            self.raced = True
+            self.collection.update_many(filter, {"$set": {"analysis_state": IN_FLIGHT, "analysis_claim": "other"}})
+        return self.collection.update_many(filter, update)
+
+
+def test_claim_batch_moves_on_when_another_worker_wins_the_race(collection):
+    collection.insert_many([queued_recipe(f"r{i}", [f"{i} eggs"]) for i in range(4)])
+
+    claim_id, recipes = claim_batch(RacingCollection(collection), 2)
+
+    assert sorted(r["_id"] for r in recipes) == ["r2", "r3"]
+    assert collection.count_documents({"analysis_claim": "other"}) == 2
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from routes import recipes as recipe_routes
+
+
+@pytest.fixture
+def analyses(monkeypatch):
+    state = {"in_flight": 0, "peak": 0, "calls": []}
+
+    async def fake_analyze(dish, user_allergens, main_ingredients, normalized_ingredients, timings, dish_lookups):
+        state["calls"].append(dish)
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            # Later dishes finish first, so results only keep their order if the route restores it
+            await asyncio.sleep(0.05 / (1 + len(state["calls"])))
+            if dish == "bad dish":
+                raise RuntimeError("analysis failed")
+            return {"dish": dish, "probability_with_any": 10.0, "user_allergens": user_allergens}
+        finally:
+            state["in_flight"] -= 1
+
+    async def no_generation_check(database):
+        pass
+    monkeypatch.setattr(recipe_routes, "analyze_single_dish", fake_analyze)
+    monkeypatch.setattr(recipe_routes, "sync_cache_generation", no_generation_check)
+    return state
+
+
+def run_batch(dishes, **request):
+    return asyncio.run(recipe_routes.batch_ingredient_analysis({
+        "dishes": [{"dish_name": name} for name in dishes], "user_allergens": ["milk"], **request,
+    }))
+
+
+def test_results_keep_input_order_and_a_failure_stays_isolated(analyses):
+    dishes = [f"dish {i}" for i in range(10)]
+    dishes[4] = "bad dish"
+
+    response = run_batch(dishes + [""], max_concurrency=3)
+
+    results = response["results"]
+    assert [r["dish"] for r in results] == dishes + [""]
+    assert results[4]["error"] == "analysis failed"
+    assert results[10]["error"] == "Dish name is required"
+    assert all(r["probability_with_any"] == 10.0 for i, r in enumerate(results) if i not in (4, 10))
+    assert analyses["peak"] == 3
+
+
+def test_concurrency_is_capped(analyses, monkeypatch):
+    monkeypatch.setattr(recipe_routes, "BATCH_MAX_CONCURRENCY", 4)
+
+    run_batch([f"dish {i}" for i in range(12)], max_concurrency=100)
+
+    assert analyses["peak"] == 4
+    assert len(analyses["calls"]) == 12
+
+
+def test_identical_dishes_are_analyzed_once(analyses):
+    response = run_batch(["pizza", "pasta", "pizza"])
+
+    assert [r["dish"] for r in response["results"]] == ["pizza", "pasta", "pizza"]
+    assert sorted(analyses["calls"]) == ["pasta", "pizza"]
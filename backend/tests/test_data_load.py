@@ -0,0 +1,78 @@
+import json
+import threading
+import data_load
+from fakes import UpdateOneCollection
+
+
+class FailingCollection:
+    def bulk_write(self, operations, ordered=True):
+        raise ConnectionError("write failed")
+
+
+def test_ingest_raises_instead_of_hanging_when_a_write_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_load, "recipes_collection", FailingCollection())
+    files = []
+    for n in range(3):
+        path = tmp_path / f"recipes_{n}.json"
+        recipes = {
+            f"{n}-{i}": {"title": f"Recipe {i}", "ingredients": ["1 cup milk", "2 eggs"], "instructions": ""}
+            for i in range(200)
+        }
+        path.write_text(json.dumps(recipes))
+        files.append(str(path))
+    outcome = {}
+
+    def run():
+        try:
+            # Tiny batches and queue, so parsers are blocked on a full queue when the write fails
+            data_load.ingest(files, workers=2, batch_size=5, queue_size=1, resume=False)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+
+    assert not thread.is_alive(), "ingest hung after the write failed"
+    assert isinstance(outcome.get("error"), ConnectionError)
+
+
+def test_reload_keeps_the_analysis_queue_state():
+    import mongomock
+    from analysis_queue import DONE, FAILED, IN_FLIGHT, PENDING, sync_work_queue
+    from recipe_enrichment import ingredients_hash
+
+    collection = UpdateOneCollection(mongomock.MongoClient().db.recipes)
+    milk = ingredients_hash(["1 cup milk"])
+    collection.insert_many([
+        # Analyzed before the work queue existed
+        {"_id": "legacy", "ingredients": ["1 cup milk"], "ingredient_analysis_complete": True},
+        {"_id": "failed", "ingredients": ["1 cup milk"], "ingredients_hash": milk,
+         "analysis_state": FAILED, "failed_hash": milk, "analysis_attempts": 3},
+        {"_id": "failed-changed", "ingredients": ["1 cup milk"], "ingredients_hash": milk,
+         "analysis_state": FAILED, "failed_hash": milk, "analysis_attempts": 3},
+        {"_id": "in-flight", "ingredients": ["1 cup milk"], "ingredients_hash": milk,
+         "analysis_state": IN_FLIGHT, "analysis_claim": "worker-1"},
+        {"_id": "done", "ingredients": ["1 cup milk"], "ingredients_hash": milk,
+         "analysis_state": DONE, "analyzed_hash": milk},
+        {"_id": "done-changed", "ingredients": ["1 cup milk"], "ingredients_hash": milk,
+         "analysis_state": DONE, "analyzed_hash": milk},
+    ])
+    reloaded = {
+        "legacy": ["1 cup milk"], "failed": ["1 cup milk"], "failed-changed": ["1 cup oat milk"],
+        "in-flight": ["1 cup milk"], "done": ["1 cup milk"], "done-changed": ["1 cup oat milk"],
+        "new": ["2 eggs"],
+    }
+    for recipe_id, ingredients in reloaded.items():
+        operation = data_load.upsert_operation(
+            data_load.clean_recipe(recipe_id, {"title": recipe_id, "ingredients": ingredients})
+        )
+        collection.bulk_write([operation])
+    sync_work_queue(collection)
+
+    states = {r["_id"]: r.get("analysis_state") for r in collection.find()}
+    assert states == {
+        "legacy": DONE, "failed": FAILED, "failed-changed": PENDING, "in-flight": IN_FLIGHT,
+        "done": DONE, "done-changed": PENDING, "new": PENDING,
+    }
+    assert collection.find_one({"_id": "in-flight"})["analysis_claim"] == "worker-1"
@@ -0,0 +1,59 @@
+import pytest
+from dish_stats import DISH_STATS_COLLECTION, refresh_stale, stats_breakdown, stats_probability
+from fakes import UpdateOneCollection
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def collection():
+    collection = UpdateOneCollection(mongomock.MongoClient().db.recipes)
+    collection.insert_many([
+        {"_id": "r1", "title": "Pancakes", "ingredients": ["1 cup milk", "2 eggs"], "dish_stats_stale": True},
+        {"_id": "r2", "title": "pancakes!", "ingredients": ["3 eggs", "1 cup flour"], "dish_stats_stale": True},
+        {"_id": "r3", "title": "Tomato Soup", "ingredients": ["4 tomatoes"], "dish_stats_stale": True},
+    ])
+    refresh_stale(collection)
+    return collection
+
+
+def stats(collection, key):
+    return collection.database[DISH_STATS_COLLECTION].find_one({"_id": key})
+
+
+def test_stats_breakdown(collection):
+    pancakes = stats(collection, "pancakes")
+
+    assert stats_breakdown(pancakes, ["Eggs", "milk"]) == (2, 2, {"eggs": 2, "milk": 1})
+    assert stats_breakdown(pancakes, ["milk"]) == (2, 1, {"milk": 1})
+    # Listed twice in different casing counts twice, like the live loop
+    assert stats_breakdown(pancakes, ["eggs", "EGGS"]) == (2, 2, {"eggs": 4})
+    # Allergens outside the precomputed terms, and outdated entries, need the live computation
+    assert stats_breakdown(pancakes, ["unicorn"]) is None
+    assert stats_breakdown({**pancakes, "enrichment_version": "old"}, ["milk"]) is None
+    assert stats_breakdown(None, ["milk"]) is None
+
+
+def test_stats_probability(collection):
+    pancakes = stats(collection, "pancakes")
+
+    assert stats_probability(pancakes, "Eggs") == (100.0, "central")
+    assert stats_probability(pancakes, "milk") == (50.0, "possible")
+    assert stats_probability(pancakes, "peanuts") == (0.0, None)
+    assert stats_probability(pancakes, "unicorn") is None
+    assert stats_probability(None, "milk") is None
+
+
+def test_refresh_stale_moves_renamed_recipes_between_dishes(collection):
+    collection.update_one({"_id": "r2"}, {"$set": {"title": "Crepes", "dish_stats_stale": True}})
+    collection.update_one({"_id": "r3"}, {"$set": {"title": "Gazpacho", "dish_stats_stale": True}})
+
+    # pancakes (left by r2), crepes and gazpacho are recomputed; tomato soup has no recipes left
+    assert refresh_stale(collection) == (3, 1)
+
+    assert stats(collection, "pancakes")["total_recipes"] == 1
+    assert stats(collection, "pancakes")["allergen_counts"]["milk"] == 1
+    assert stats(collection, "crepes")["allergen_counts"]["flour"] == 1
+    assert stats(collection, "gazpacho")["total_recipes"] == 1
+    assert stats(collection, "tomato soup") is None
+    assert collection.count_documents({"dish_stats_stale": True}) == 0
@@ -0,0 +1,27 @@
+import threading
+from enrichment_pipeline import EnrichmentPipeline
+
+
+class BrokenCollection:
+    """Every query fails, like a lost connection"""
+
+    def find(self, *args, **kwargs):
+        raise ConnectionError("network is unreachable")
+
+
+def test_run_raises_when_claiming_fails():
+    pipeline = EnrichmentPipeline(BrokenCollection(), lambda recipe: {"_id": recipe["_id"]}, workers=2, claim_size=5)
+    outcome = {}
+
+    def run():
+        try:
+            pipeline.run()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive(), "run() hung after the reader failed"
+    assert isinstance(outcome.get("error"), ConnectionError)
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import gemini_integration
+import result_cache
+from result_cache import ResultCache
+
+CALLERS = 8
+# The same request up to case, whitespace, order and duplicates
+VARIANTS = [
+    ("pad thai", ["Noodles", "peanuts"], ["peanuts"]),
+    ("Pad Thai ", ["peanuts", "noodles"], ["Peanuts", "peanuts"]),
+]
+
+
+def test_concurrent_identical_requests_share_one_call(monkeypatch):
+    monkeypatch.setattr(result_cache, "_caches", [])
+    monkeypatch.setattr(gemini_integration, "dish_analysis_cache", ResultCache("gemini_test", ttl=60))
+    monkeypatch.setattr(gemini_integration, "_metrics", {"requests": 0, "api_calls": 0, "coalesced": 0, "errors": 0})
+    calls = []
+
+    def fake_call(dish_name, ingredients, allergens, current_conclusion):
+        calls.append(dish_name)
+        # Stay in flight until every other caller has joined this call
+        deadline = time.monotonic() + 5
+        while gemini_integration._metrics["coalesced"] < CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return {"dish": dish_name, "allergens": {"peanuts": "likely"}}
+    monkeypatch.setattr(gemini_integration, "_call_gemini", fake_call)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(CALLERS) as pool:
+            return await asyncio.gather(*(
+                loop.run_in_executor(pool, gemini_integration.analyze_dish_with_gemini, *VARIANTS[i % 2], {})
+                for i in range(CALLERS)
+            ))
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert gemini_integration._metrics["coalesced"] == CALLERS - 1
+    assert all(result == results[0] for result in results)
+    assert len({id(result) for result in results}) == CALLERS
+
+    results[0]["allergens"]["peanuts"] = "none"
+    results[1]["allergens"].clear()
+    assert results[2]["allergens"] == {"peanuts": "likely"}
+    # Later requests are answered from the cache, unaffected by the callers' changes
+    cached = gemini_integration.analyze_dish_with_gemini("PAD THAI", ["peanuts", "noodles"], ["peanuts"], {})
+    assert cached["allergens"] == {"peanuts": "likely"}
+    assert len(calls) == 1
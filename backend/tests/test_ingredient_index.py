@@ -0,0 +1,53 @@
+import threading
+import time
+from ingredient_index import IngredientIndex
+
+
+class SlowRecipes:
+    def __init__(self, docs, delay=0.2):
+        self.docs = docs
+        self.delay = delay
+        self.scans = 0
+
+    def find(self, *args, **kwargs):
+        self.scans += 1
+        time.sleep(self.delay)
+        return list(self.docs)
+
+
+def test_concurrent_first_counts_build_once():
+    collection = SlowRecipes([
+        {"_id": "a", "ingredients": ["1 cup milk", "2 eggs"]},
+        {"_id": "b", "ingredients": ["4 tomatoes"]},
+    ])
+    index = IngredientIndex(collection)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(index.count(["a", "b"], ["milk"])))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert collection.scans == 1
+    assert results == [(2, 1, {"milk": 1})] * 5
+
+
+def test_stale_index_rebuilds_in_the_background():
+    collection = SlowRecipes([{"_id": "a", "ingredients": ["1 cup milk"]}], delay=0)
+    index = IngredientIndex(collection, refresh_interval=0.01)
+    index.build()
+    collection.docs.append({"_id": "b", "ingredients": ["2 cups milk"]})
+    collection.delay = 0.5
+    time.sleep(0.02)
+
+    start = time.monotonic()
+    assert index.count(["a", "b"], ["milk"]) == (1, 1, {"milk": 1})
+    assert time.monotonic() - start < 0.25, "the rebuild ran on the request"
+
+    deadline = time.monotonic() + 5
+    while index.count(["a", "b"], ["milk"])[0] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert index.count(["a", "b"], ["milk"]) == (2, 2, {"milk": 2})
@@ -0,0 +1,64 @@
+import re
+import pytest
+from rapidfuzz import fuzz
+from ingredient_scoring import main_ingredient_scores
+
+
+def baseline_scores(main_ingredients_lower, recipes_ingredients, ingredient_threshold):
+    """The per-recipe triple loop /match used before main_ingredient_scores"""
+    scores = []
+    for recipe_ingredients in recipes_ingredients:
+        detected_main = 0
+        if main_ingredients_lower and recipe_ingredients:
+            for mi in main_ingredients_lower:
+                found = False
+                for ri in recipe_ingredients:
+                    if re.search(r'\\b' + re.escape(mi) + r'\\b', ri):
+                        found = True
+                        break
+                    if len(mi) >= 4 and (mi in ri.split() or ri in mi.split()):
+                        found = True
+                        break
+                    if fuzz.ratio(mi, ri) >= ingredient_threshold:
+                        found = True
+                        break
+                if found:
+                    detected_main += 1
+            scores.append((detected_main / len(main_ingredients_lower)) * 100)
+        else:
+            scores.append(0)
+    return scores
+
+
+RECIPES = [
+    ["2 cloves garlic", "1 tbsp olive oil", "salt"],
+    ["oil", "egg", "1 cup milk"],
+    ["olive oil", "garlic powder", "eggs"],
+    [],
+    ["c++ (sauce)", "a.b*c", "[chili] flakes?", "1/2 tsp salt & pepper"],
+    [r"\bpepper\b sauce", r"salt\b", "back\\slash", r"\\beef\\ stock"],
+    ["", "   ", "tomatoes"],
+    ["fresh basil leaves", "basil"],
+]
+
+MAINS = [
+    ["garlic", "olive oil"],
+    ["oil", "egg", "soy"],  # shorter than 4 characters: no token rule
+    ["garlic powder", "eggs"],  # tokens of the main inside an ingredient, and the reverse
+    ["c++ (sauce)", "a.b*c", "[chili]", "salt & pepper"],
+    ["pepper", "salt", r"\beef", "back\\slash", "beef\\"],
+    ["basil", "basil", "tomato"],  # duplicates count once each
+    ["", "xyz"],
+    [],
+]
+
+
+@pytest.mark.parametrize("threshold", [-20, 0, 1, 60, 85, 100, 101, 150])
+@pytest.mark.parametrize("mains", MAINS)
+def test_scores_match_the_original_loop(mains, threshold):
+    assert main_ingredient_scores(mains, RECIPES, threshold) == baseline_scores(mains, RECIPES, threshold)
+
+
+def test_recipes_without_ingredients_score_zero():
+    assert main_ingredient_scores(["garlic"], [[], []], 60) == [0, 0]
+    assert main_ingredient_scores([], [["garlic"]], 60) == [0]
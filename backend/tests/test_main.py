@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import main
+
+
+def test_lifespan_runs_startup_hooks_and_closes_clients(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.title_index, "ensure_fresh", lambda: calls.append("title index"))
+    monkeypatch.setattr(main.title_index, "follow", lambda store: calls.append("follow snapshot"))
+    monkeypatch.setattr(main, "SNAPSHOT_MODE", True)
+    monkeypatch.setattr(main.recipe_snapshot, "load_or_build", lambda: calls.append("snapshot"))
+    install = main.signal.signal
+    monkeypatch.setattr(main.signal, "signal", lambda signum, handler: (
+        calls.append("sighup") if signum == main.signal.SIGHUP else install(signum, handler)
+    ))
+
+    async def close_clients():
+        calls.append("close")
+    monkeypatch.setattr(main, "close_clients", close_clients)
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            calls.append("serving")
+            main.app.state.warm_up.join(timeout=5)
+    asyncio.run(run())
+
+    assert calls.index("follow snapshot") < calls.index("snapshot") < calls.index("title index")
+    assert "sighup" in calls and calls.index("serving") < calls.index("close") == len(calls) - 1
+
+
+def test_lifespan_serves_before_the_title_index_is_built(monkeypatch):
+    built = threading.Event()
+    release = threading.Event()
+
+    def slow_build():
+        release.wait(timeout=5)
+        built.set()
+    monkeypatch.setattr(main, "SNAPSHOT_MODE", False)
+    monkeypatch.setattr(main.title_index, "ensure_fresh", slow_build)
+
+    async def close_clients():
+        pass
+    monkeypatch.setattr(main, "close_clients", close_clients)
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            assert not built.is_set()
+            release.set()
+            main.app.state.warm_up.join(timeout=5)
+    asyncio.run(run())
+
+    assert built.is_set()
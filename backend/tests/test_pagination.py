@@ -0,0 +1,23 @@
+import base64
+import pytest
+from bson import ObjectId
+from pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("last_id", ["recipe-42", ObjectId("65f1c0ffee0000000000beef"), 7])
+def test_cursor_round_trip(last_id):
+    assert decode_cursor(encode_cursor(last_id)) == last_id
+
+
+def cursor(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+@pytest.mark.parametrize("value", [
+    "not base64!", cursor("{not json"), base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    cursor('{"$oid": "zz"}'), cursor('{"$date": "nope"}'), cursor('{"$binary": 5}'),
+    cursor('{"$numberDecimal": "abc"}'),
+])
+def test_malformed_cursor_is_a_value_error(value):
+    with pytest.raises(ValueError):
+        decode_cursor(value)
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from bench_rate_limiter import generate
+from fake_llm_server import start_fake_server
+from rate_limiter import AdaptiveLimiter, call_with_retries
+
+REQUESTS = 12
+
+
+def test_limiter_backs_off_on_429s_and_retries_succeed():
+    server, base_url, server_state = start_fake_server(rate=4, max_concurrency=3, latency=0.05, jitter=0)
+    # Starts well above what the server accepts
+    limiter = AdaptiveLimiter(rate=20, max_concurrency=10, min_concurrency=1, latency_target=0,
+                              cooldown=0.2, min_rate=1)
+    try:
+        with ThreadPoolExecutor(REQUESTS) as pool:
+            results = list(pool.map(
+                lambda _: call_with_retries(lambda: generate(base_url), limiter, max_retries=10,
+                                            base_delay=0.1, max_delay=1.0),
+                range(REQUESTS),
+            ))
+    finally:
+        server.shutdown()
+
+    stats = limiter.stats()
+    assert server_state.stats()["throttled"] > 0
+    assert stats["throttled"] > 0 and stats["retries"] > 0
+    assert stats["decreases"] > 0
+    assert stats["lowest_concurrency_limit"] < 10
+    assert all(result["candidates"] for result in results)
+    assert stats["successes"] == REQUESTS
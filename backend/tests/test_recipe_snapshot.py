@@ -0,0 +1,32 @@
+import recipe_snapshot
+from recipe_enrichment import ENRICHMENT_VERSION
+from recipe_snapshot import RecipeSnapshot, SnapshotStore
+
+RECIPES = [
+    {"_id": "a1", "title": "Chicken Salad", "ingredients": ["1 cup milk", "2 eggs"]},
+    {"_id": "b2", "title": "Tomato Soup", "ingredients": ["4 tomatoes"]},
+]
+
+
+def test_snapshot_file_round_trip(tmp_path):
+    path = str(tmp_path / "recipes.snapshot")
+    RecipeSnapshot.build(RECIPES).save(path)
+
+    snapshot = RecipeSnapshot.open(path)
+
+    assert snapshot.position("b2") == 1
+    assert list(snapshot.find_title("SALAD")) == [0]
+    assert snapshot.recipe(0)["ingredients"] == ["1 cup milk", "2 eggs"]
+    assert snapshot.recipe(0)["enrichment_version"] == ENRICHMENT_VERSION
+
+
+def test_snapshot_from_another_enrichment_version_is_rejected(tmp_path, monkeypatch):
+    path = str(tmp_path / "recipes.snapshot")
+    RecipeSnapshot.build(RECIPES).save(path)
+    # The term mapping changed after the file was built
+    monkeypatch.setattr(recipe_snapshot, "ENRICHMENT_VERSION", "v-next")
+
+    store = SnapshotStore(collection=None, path=path, check_interval=0)
+    store.load_or_build()
+
+    assert store.current is None
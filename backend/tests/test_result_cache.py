@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+import result_cache
+from result_cache import CACHE_STATE_COLLECTION, LocalBackend, ResultCache, invalidate_result_caches, sync_cache_generation
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(result_cache, "time", clock)
+    # Caches created by a test register here instead of next to the app's caches
+    monkeypatch.setattr(result_cache, "_caches", [])
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResultCache("lru", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # b is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResultCache("ttl", maxsize=10, ttl=5)
+    cache.set(["caesar salad", ["eggs"]], {"probability": 40})
+    clock.now += 4.9
+    assert cache.get(["caesar salad", ["eggs"]]) == {"probability": 40}
+    clock.now += 0.2
+
+    assert cache.get(["caesar salad", ["eggs"]], "missing") == "missing"
+    assert cache.stats()["expirations"] == 1
+
+
+def test_cached_values_are_copies(clock):
+    cache = ResultCache("copies", maxsize=10, ttl=60)
+    value = {"allergens": ["milk"]}
+    cache.set("k", value)
+    value["allergens"].append("eggs")
+    cache.get("k")["allergens"].append("soy")
+
+    assert cache.get("k") == {"allergens": ["milk"]}
+
+
+def test_backend_round_trip(clock):
+    backend = LocalBackend()
+    writer = ResultCache("shared", maxsize=10, ttl=5, backend=backend)
+    reader = ResultCache("shared", maxsize=10, ttl=5, backend=backend)
+    writer.set({"dish": "pad thai"}, {"total": 3, "ids": ["a", "b"]})
+
+    assert reader.get({"dish": "pad thai"}) == {"total": 3, "ids": ["a", "b"]}
+    assert reader.stats()["backend_hits"] == 1
+    # Now held locally too
+    assert reader.get({"dish": "pad thai"}) == {"total": 3, "ids": ["a", "b"]}
+    assert reader.stats()["backend_hits"] == 1
+
+    clock.now += 6
+    other = ResultCache("shared", maxsize=10, ttl=5, backend=backend)
+    assert other.get({"dish": "pad thai"}) is None
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+
+def test_bumped_generation_misses_the_cache(clock, monkeypatch):
+    database = mongomock.MongoClient().db
+    backend = LocalBackend()
+    api_cache = ResultCache("dish_analysis", maxsize=10, ttl=600, backend=backend)
+    api_cache.set("pad thai", {"probability": 80})
+
+    # A writer in another process: its invalidation only reaches this one through the generation
+    monkeypatch.setattr(result_cache, "_caches", [])
+    invalidate_result_caches(database)
+    monkeypatch.setattr(result_cache, "_caches", [api_cache])
+    assert api_cache.get("pad thai") == {"probability": 80}
+
+    monkeypatch.setattr(result_cache, "_last_generation_check", 0.0)
+    asyncio.run(sync_cache_generation({CACHE_STATE_COLLECTION: AsyncCollection(database[CACHE_STATE_COLLECTION])}))
+
+    assert api_cache.generation == 1
+    # Neither the local entry nor the backend entry of the old generation is served
+    assert api_cache.get("pad thai") is None
+    api_cache.set("pad thai", {"probability": 75})
+    assert api_cache.get("pad thai") == {"probability": 75}
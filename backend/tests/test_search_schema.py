@@ -0,0 +1,17 @@
+from models import RecipePage
+from routes.recipes import router
+
+
+def test_search_documents_the_page_without_validating_it():
+    route = next(r for r in router.routes if r.path == "/search")
+    assert route.response_model is None
+    assert route.responses[200]["model"] is RecipePage
+
+
+def test_projected_page_matches_the_documented_schema():
+    page = RecipePage.model_validate({
+        "recipes": [{"title": "Pancakes"}, {"picture_link": None}],
+        "next_cursor": None,
+        "total_estimate": 2,
+    })
+    assert page.recipes[0].ingredients is None
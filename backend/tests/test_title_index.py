@@ -0,0 +1,67 @@
+import threading
+import time
+from title_index import TitleIndex
+
+
+class SlowTitles:
+    """A collection whose full scans are slow and counted"""
+
+    def __init__(self, titles, delay=0.2):
+        self.docs = [{"_id": i, "title": title} for i, title in enumerate(titles)]
+        self.delay = delay
+        self.scans = 0
+
+    def find(self, *args, **kwargs):
+        self.scans += 1
+        time.sleep(self.delay)
+        return list(self.docs)
+
+
+def test_concurrent_first_searches_build_once():
+    collection = SlowTitles(["Chicken Salad", "Tomato Soup"])
+    index = TitleIndex(collection)
+    threads = [threading.Thread(target=index.search, args=("chicken salad",)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert collection.scans == 1
+
+
+def test_stale_index_refreshes_in_the_background():
+    collection = SlowTitles(["Chicken Salad"], delay=0)
+    index = TitleIndex(collection, refresh_interval=0.01)
+    index.build()
+    collection.docs.append({"_id": 1, "title": "Chicken Salads"})
+    collection.delay = 0.5
+    time.sleep(0.02)
+
+    start = time.monotonic()
+    results = index.search("chicken salad")
+    assert time.monotonic() - start < 0.25, "the refresh ran on the request"
+    assert [_id for _id, _ in results] == [0]
+
+    deadline = time.monotonic() + 5
+    while len(index) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert [_id for _id, _ in index.search("chicken salad")] == [0, 1]
+
+
+def test_snapshot_titles_match_the_collection_index():
+    from recipe_snapshot import RecipeSnapshot
+
+    titles = ["Chicken Salad", "Crème brûlée", "Chicken salads", "Pâté", "Tomato Soup", "Chicken Saladé", ""]
+    collection = SlowTitles(titles, delay=0)
+    from_mongo = TitleIndex(collection)
+    from_mongo.build()
+
+    class Store:
+        current = RecipeSnapshot.build([{"_id": i, "title": t} for i, t in enumerate(titles)])
+
+    from_snapshot = TitleIndex(collection)
+    from_snapshot.follow(Store())
+    for query in ("chicken salad", "creme brulee", "pate", "crème"):
+        expected = [(str(_id), score) for _id, score in from_mongo.search(query)]
+        assert from_snapshot.search(query) == expected
+    assert collection.scans == 1
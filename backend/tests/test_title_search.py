@@ -0,0 +1,61 @@
+import mongomock
+import pytest
+from title_search import title_filter, uses_title_tokens_index
+
+
+def titles(collection, dish, whole_words=False):
+    return sorted(r["title"] for r in collection.find(title_filter(dish, whole_words, backend="tokens")))
+
+
+def test_tokens_backend_finds_recipes_before_and_after_backfill():
+    collection = mongomock.MongoClient().db.recipes
+    collection.insert_many([
+        {"title": "Chicken Curry", "title_lower": "chicken curry", "title_tokens": ["chicken", "curry"]},
+        {"title": "Chickpea Salad", "title_lower": "chickpea salad", "title_tokens": ["chickpea", "salad"]},
+        {"title": "Roast Chicken"},  # not backfilled
+        {"title": "Beef Stew"},
+    ])
+
+    assert titles(collection, "chick") == ["Chicken Curry", "Chickpea Salad", "Roast Chicken"]
+    assert titles(collection, "chicken", whole_words=True) == ["Chicken Curry", "Roast Chicken"]
+    assert titles(collection, "curry") == ["Chicken Curry"]
+
+
+def ixscan(field):
+    return {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "keyPattern": {field: 1}}}
+
+
+def test_plan_check_requires_the_title_tokens_index():
+    assert uses_title_tokens_index({"stage": "SUBPLAN", "inputStage": {
+        "stage": "OR", "inputStages": [ixscan("title_tokens"), ixscan("title_tokens")],
+    }})
+    assert not uses_title_tokens_index({"stage": "OR", "inputStages": [
+        ixscan("title_tokens"), {"stage": "COLLSCAN"},
+    ]})
+    assert not uses_title_tokens_index(ixscan("title"))
+    assert not uses_title_tokens_index({"stage": "COLLSCAN"})
+
+
+@pytest.mark.parametrize("whole_words", [False, True])
+def test_title_lookup_plan_uses_the_title_tokens_index(mongo_database, monkeypatch, whole_words):
+    import create_indexes
+    from recipe_enrichment import enrich_recipe
+    from title_search import winning_plan
+
+    collection = mongo_database.recipes
+    docs = []
+    for i in range(2000):
+        doc = {"_id": i, "title": f"{['Chicken', 'Beef', 'Tofu', 'Lentil'][i % 4]} curry {i}", "ingredients": []}
+        if i % 10:  # a tenth is not backfilled yet
+            doc.update(enrich_recipe(doc))
+        docs.append(doc)
+    collection.insert_many(docs)
+    # The indexes production has
+    monkeypatch.setattr(create_indexes, "recipes_collection", collection)
+    create_indexes.create_indexes()
+
+    plan = winning_plan(collection, "chicken", whole_words, backend="tokens")
+
+    assert uses_title_tokens_index(plan), plan
+    found = collection.count_documents(title_filter("chicken", whole_words, backend="tokens"))
+    assert found == 500
@@ -0,0 +1,214 @@
+"""
+In-memory title index for fuzzy dish lookups.
+
+/api/match used to pull every recipe over the wire and call fuzz.ratio once per
+document. The index keeps the lowercased titles in memory, prunes them by
+length and scores the survivors in one batched rapidfuzz call, so a request
+only fetches the ingredients of the handful of recipes that can actually match.
+
+With the recipe snapshot enabled, the index follows it instead: titles are read
+from the snapshot's mapped title_lower column, so workers share them through
+the page cache rather than each holding a copy, and only a length-ordered
+array of positions is private. Titles then change when the snapshot does.
+"""
+import math
+import threading
+import time
+import numpy as np
+from rapidfuzz import fuzz, process
+from db import recipes_collection
+
+# /match never considers a recipe whose title scores below this
+TITLE_SCORE_FLOOR = 50
+
+# How long (in seconds) the index may serve results before it re-syncs titles
+REFRESH_INTERVAL = 300
+
+
+def length_bounds(query_length, min_score):
+    """
+    Range of title lengths that can reach min_score against a query of this length.
+
+    fuzz.ratio is 2 * LCS / (len_a + len_b) * 100 and the LCS can never exceed
+    the shorter string, so titles outside this window cannot reach min_score.
+    """
+    if min_score <= 0:
+        return 0, None
+    fraction = min_score / 100
+    # Widen slightly so float rounding never drops a title sitting on the boundary
+    lower = query_length * fraction / (2 - fraction) - 1e-9
+    upper = query_length * (2 - fraction) / fraction + 1e-9
+    return math.ceil(lower), math.floor(upper)
+
+
+class LengthIndex:
+    """Title positions ordered by title length, to pick the titles in a length window"""
+
+    def __init__(self, lengths):
+        lengths = np.asarray(lengths, dtype=np.int32)
+        self.order = np.argsort(lengths, kind="stable")
+        self.sorted_lengths = lengths[self.order]
+
+    def between(self, low, high):
+        """Sorted positions of the titles with low <= length <= high (no upper bound if None)"""
+        start = np.searchsorted(self.sorted_lengths, low, side="left")
+        stop = len(self.order) if high is None else np.searchsorted(self.sorted_lengths, high, side="right")
+        return np.sort(self.order[start:stop])
+
+
+def utf8_lengths(column):
+    """Character length of every string in a snapshot StringColumn, without decoding them"""
+    # Every byte except a UTF-8 continuation byte starts a character
+    starts = (column.buffer & 0xC0) != 0x80
+    counts = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum(starts, out=counts[1:])
+    return counts[column.offsets[1:]] - counts[column.offsets[:-1]]
+
+
+class TitleIndex:
+    """Lowercased recipe titles ordered by length, in collection (or snapshot) order."""
+
+    def __init__(self, collection, refresh_interval=REFRESH_INTERVAL):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        # (ids, titles, positions, lengths), swapped as a whole on every update
+        self._state = ([], [], {}, LengthIndex([]))
+        self._built_at = None
+        self._lock = threading.Lock()
+        # SnapshotStore to follow, and the snapshot the state was taken from
+        self._store = None
+        self._snapshot = None
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def build(self, force=True):
+        """
+        Load every title from the collection, replacing the current index.
+
+        With force=False, does nothing if the index was built meanwhile (e.g.
+        by a concurrent first request that held the lock).
+        """
+        with self._lock:
+            if not force and self.is_built:
+                return
+            ids, titles = [], []
+            for doc in self.collection.find({}, {"title": 1}):
+                title = doc.get("title", "")
+                if not isinstance(title, str) or not title.strip():
+                    continue
+                ids.append(doc["_id"])
+                titles.append(title.lower())
+            self._publish(ids, titles)
+            print(f"Title index built with {len(ids)} recipes")
+
+    def refresh(self):
+        """
+        Re-sync the index with the collection without re-reading ingredients.
+
+        Titles that were added or changed are applied in place and removed
+        recipes are dropped; untouched entries keep their position. The new
+        state is swapped in as a whole, so searches keep using the old one
+        until then.
+        """
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is already refreshing
+        try:
+            ids, titles, positions, _ = self._state
+            ids, titles, positions = list(ids), list(titles), dict(positions)
+            seen = set()
+            added = changed = 0
+            for doc in self.collection.find({}, {"title": 1}):
+                title = doc.get("title", "")
+                if not isinstance(title, str) or not title.strip():
+                    continue
+                _id = doc["_id"]
+                seen.add(_id)
+                title = title.lower()
+                position = positions.get(_id)
+                if position is None:
+                    positions[_id] = len(ids)
+                    ids.append(_id)
+                    titles.append(title)
+                    added += 1
+                elif titles[position] != title:
+                    titles[position] = title
+                    changed += 1
+            removed = [_id for _id in positions if _id not in seen]
+            if removed:
+                keep = [i for i, _id in enumerate(ids) if _id in seen]
+                ids = [ids[i] for i in keep]
+                titles = [titles[i] for i in keep]
+            if added or changed or removed:
+                print(f"Title index refreshed: {added} added, {changed} changed, {len(removed)} removed")
+            self._publish(ids, titles)
+        except Exception as e:
+            print(f"Title index refresh failed, serving the previous titles: {e}")
+        finally:
+            self._lock.release()
+
+    def follow(self, store):
+        """Search the titles of store.current (a SnapshotStore) whenever it has a snapshot"""
+        self._store = store
+
+    def use_snapshot(self, snapshot):
+        """Search the snapshot's mapped title_lower column; snapshot ids are str(_id)"""
+        self._state = (snapshot.ids, snapshot.title_lower, None, LengthIndex(utf8_lengths(snapshot.title_lower)))
+        self._snapshot = snapshot
+        self._built_at = time.time()
+        print(f"Title index following the recipe snapshot ({len(snapshot)} recipes)")
+
+    def ensure_fresh(self):
+        """
+        Build on first use. Once the index is older than the interval, refresh
+        it on a background thread; requests keep searching the current titles.
+        When following a snapshot store that has a snapshot, switch to its
+        titles instead (Mongo is not read).
+        """
+        snapshot = self._store.current if self._store is not None else None
+        if snapshot is not None:
+            if snapshot is not self._snapshot:
+                self.use_snapshot(snapshot)
+            return
+        if not self.is_built:
+            self.build(force=False)
+        elif time.time() - self._built_at > self.refresh_interval and not self._lock.locked():
+            threading.Thread(target=self.refresh, name="title-index-refresh", daemon=True).start()
+
+    def search(self, query, min_score=TITLE_SCORE_FLOOR):
+        """
+        Return (_id, title_score) for every title scoring at least min_score.
+
+        Scores are exactly fuzz.ratio(query, title.lower()) and results keep
+        collection order, so callers see the same sequence a full scan produced.
+        """
+        self.ensure_fresh()
+        ids, titles, _, lengths = self._state
+        positions = lengths.between(*length_bounds(len(query), min_score))
+        if not len(positions):
+            return []
+        matches = process.extract(
+            query,
+            [titles[p] for p in positions],
+            scorer=fuzz.ratio,
+            processor=None,
+            score_cutoff=min_score,
+            limit=None,
+        )
+        matches.sort(key=lambda m: m[2])
+        return [(ids[positions[index]], score) for _, score, index in matches]
+
+    def _publish(self, ids, titles):
+        lengths = LengthIndex([len(title) for title in titles])
+        positions = {_id: position for position, _id in enumerate(ids)}
+        # Swap everything in one go so concurrent searches never see a mix
+        self._state = (ids, titles, positions, lengths)
+        self._snapshot = None
+        self._built_at = time.time()
+
+
+title_index = TitleIndex(recipes_collection)
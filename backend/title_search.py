@@ -0,0 +1,99 @@
+"""
+Title filters for the routes that look recipes up by dish name.
+
+An unanchored, case-insensitive $regex on `title` cannot use an index, so
+every lookup was a collection scan. The default backend matches each query
+word as a prefix of the stored `title_tokens` (a multikey index turns the
+anchored regex into an IXSCAN range) and then checks the escaped phrase
+against `title_lower` on the few documents that survive. Both fields come from
+recipe_enrichment; recipes it has not backfilled yet have no title_tokens and
+are matched with the old case-insensitive regex instead. The same index finds
+them (a missing field is indexed as null), so the lookup stays an index scan
+and that branch simply empties once the backfill is done.
+
+Backends, selected with TITLE_SEARCH_BACKEND:
+  tokens - anchored prefix match on title_tokens (default)
+  text   - phrase query against the text index on title
+  regex  - the old case-insensitive substring match, with the input escaped
+"""
+import os
+import re
+from dotenv import load_dotenv
+from recipe_enrichment import tokenize_title
+
+load_dotenv()
+
+TITLE_SEARCH_BACKEND = os.getenv("TITLE_SEARCH_BACKEND", "tokens")
+
+def regex_filter(dish):
+    return {"title": {"$regex": re.escape(dish), "$options": "i"}}
+
+def text_filter(dish):
+    # A quoted $search is a phrase query; quotes in the input would end it early
+    return {"$text": {"$search": '"' + dish.replace('"', " ") + '"'}}
+
+def tokens_filter(dish, whole_words=False):
+    dish_lower = dish.lower().strip()
+    tokens = tokenize_title(dish_lower)
+    if not tokens:
+        # Nothing indexable (e.g. only digits or punctuation)
+        return regex_filter(dish)
+    if whole_words:
+        token_clauses = [{"title_tokens": {"$all": tokens}}]
+        phrase = r"\b" + re.escape(dish_lower) + r"\b"
+    else:
+        token_clauses = [{"title_tokens": {"$regex": "^" + re.escape(t)}} for t in tokens]
+        phrase = re.escape(dish_lower)
+    return {"$or": [
+        {"$and": token_clauses + [{"title_lower": {"$regex": phrase}}]},
+        # Not backfilled by recipe_enrichment yet
+        {"title_tokens": {"$exists": False}, "title": {"$regex": phrase, "$options": "i"}},
+    ]}
+
+def title_filter(dish, whole_words=False, backend=None):
+    """
+    Mongo filter for recipes whose title contains the dish name.
+
+    whole_words=True only matches the dish name on word boundaries.
+    """
+    backend = backend or TITLE_SEARCH_BACKEND
+    if backend == "tokens":
+        return tokens_filter(dish, whole_words)
+    if backend == "text":
+        return text_filter(dish)
+    if whole_words:
+        return {"title": {"$regex": r"\b" + re.escape(dish) + r"\b", "$options": "i"}}
+    return regex_filter(dish)
+
+def plan_stages(plan):
+    """Flatten the stage names of an explain() plan tree, outermost first"""
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return [s for s in stages if s]
+
+def plan_index_scans(plan):
+    """Key patterns of every IXSCAN in an explain() plan tree"""
+    scans = [plan.get("keyPattern", {})] if plan.get("stage") == "IXSCAN" else []
+    if "inputStage" in plan:
+        scans += plan_index_scans(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        scans += plan_index_scans(child)
+    return scans
+
+def winning_plan(collection, dish, whole_words=False, backend=None):
+    explanation = collection.find(title_filter(dish, whole_words, backend)).explain()
+    plan = explanation["queryPlanner"]["winningPlan"]
+    # Slot-based execution nests the classic plan one level down
+    return plan.get("queryPlan", plan)
+
+def explain_title_search(collection, dish, whole_words=False, backend=None):
+    """Stage names of the winning plan Mongo picks for a title lookup"""
+    return plan_stages(winning_plan(collection, dish, whole_words, backend))
+
+def uses_title_tokens_index(plan):
+    """True when the plan is answered from the title_tokens index without a collection scan"""
+    scans = plan_index_scans(plan)
+    return "COLLSCAN" not in plan_stages(plan) and any("title_tokens" in scan for scan in scans)